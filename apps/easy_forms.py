@@ -11,12 +11,12 @@ from utils.utility import find_closest_category, snake_case_to_label
 from utils.globals import ABBRV_IDX_TO_CATEGORY_NAME, COLUMN_SORT_ORDER
 from utils.model_inferencer import ModelInferencer
 from utils.display_utility import show_example_form, pandas_2_AgGrid
-from utils.s3vc_Misc.s3_cache import S3_Lookup_Cache
+from utils.s3vc_Misc.s3_cache import S3_Lookup_Cache, get_shared_s3_cache
 from utils.geolocator import GeoLocator
 
 def easy_forms_page():
   if 'S3VC_Lookup_Cache' not in state:
-    state['S3VC_Lookup_Cache'] = S3_Lookup_Cache()
+    state['S3VC_Lookup_Cache'] = get_shared_s3_cache()
 
   st.subheader('Form Builder')
   c1, c2 = st.columns([1,1])
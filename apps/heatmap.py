@@ -6,20 +6,16 @@ import numpy as np
 import pandas as pd
 import logging
 from typing import Optional
-from supabase import create_client
+from utils.supabase_pool import SUPABASE_POOL, get_supabase_client
+from utils.table_stream import read_table_frame
 
 import plotly.express as px
 import plotly.graph_objs as go
 
 def heatmapPage():
-  url = st.secrets['supabase_url']
-  key = st.secrets['supabase_anon_key']
-  supabase = create_client(url, key)
-
   TABLE = 'climate_risk-climate_simulation_v2'
 
-  data = supabase_query(table=TABLE, url=url, key=key, limit=None)
-  df = pd.DataFrame(data)
+  df = load_table(table=TABLE)
   if 'id' in df.columns:
     df = df.drop('id', axis=1)
 
@@ -59,28 +55,21 @@ def heatmapPage():
 #---Helper---#
 @st.cache_data()
 def show_columns(table:str, url:str, key:str):
-  supabase = create_client(url, key)
-  response = supabase.table(table).select("*").execute()
+  supabase = get_supabase_client(url, key)
+  response = SUPABASE_POOL.execute( supabase.table(table).select("*") )
   data = response.data
   return list(data[0].keys()) if data else []
 
 @st.cache_data(show_spinner=True)
-def supabase_query(table:str, url:str, key:str, limit: Optional[int]=10000):
-  supabase = create_client(url, key)
-  query_builder = supabase.table(table).select("*")
-
-  if limit is not None:
-    query_builder = query_builder.limit(limit)
-  
-  try:
-    response = query_builder.execute()
-  except Exception as e:
-    raise e
-  
-  if response.data in ([], None):
+def load_table(table:str, order: Optional[str]=None) -> pd.DataFrame:
+  """
+  Whole table as a DataFrame, streamed in range-paged chunks so large tables are neither one giant response nor truncated.
+  """
+  df = read_table_frame(table, order=order)
+  if df.empty:
     print(f'No data found for `{table}`. Make sure RLS is turned off.')
     logging.info(f'No data found for `{table}`. Make sure RLS is turned off.')
-  return response.data
+  return df
 
 
 def pandas_2_AgGrid(df: pd.DataFrame, theme:str='streamlit') -> AgGrid:
@@ -3,30 +3,22 @@ from streamlit import session_state as state
 from st_aggrid import AgGrid, AgGridTheme, GridOptionsBuilder, JsCode, DataReturnMode
 
 import os
+import numpy as np
 import pandas as pd
 from functools import partial
 
-from utils.utility import get_dataframe
-from utils.model_inferencer import ModelInferencer
-from utils.geolocator import GeoLocator
-from utils.model_df_utility import df_to_calculator, calculator_to_df, calculators_2_df
-
-from utils.s1de_Misc.s1_calculators import S1_Calculator
-from utils.s2ie_Misc.s2_calculators import S2_Calculator
-from utils.s3vc_Misc.s3_calculators import S3_Calculator
-from utils.s3vc_Misc.s3c15_calculators import S3C15_Calculator, create_s3c15_data
-
-from utils.s1de_Misc.s1_creators import *
-from utils.s2ie_Misc.s2_creators import create_s2pp_data
-from utils.s3vc_Misc.s3_creators import *
-from utils.s3vc_Misc.s3_cache import S3_Lookup_Cache
+from utils.geolocator import get_shared_geolocator
+from utils.model_df_utility import calculators_2_df, merge_calculator
+from utils.file_pool import map_files
+from utils.file_processing import process_file
+from utils.s3vc_Misc.s3_cache import S3_Lookup_Cache, get_shared_s3_cache
 
 def homePage():
   user_level = state.get("user_level", 1)
   if 'geolocator' not in state: 
-    state['geolocator'] = GeoLocator()
+    state['geolocator'] = get_shared_geolocator()
   if 'S3VC_Lookup_Cache' not in state:
-    state['S3VC_Lookup_Cache'] = S3_Lookup_Cache()
+    state['S3VC_Lookup_Cache'] = get_shared_s3_cache()
 
   st.title('Welcome to Trace')
   st.divider()
@@ -89,173 +81,113 @@ def process_files(files, state, pbar=False):
   files: uploaded csvs file
   state: streamlit session state obj
   pbar: Progress bar for streamlit
-  """
 
-  modinf = ModelInferencer()
+  Files are processed in parallel (see utils.file_pool, FILE_POOL_MODE), then merged into state in upload order,
+  so the session ends up exactly as if they were processed one after another.
+  Rows already uploaded for a model are not calculated again, see `merge_file_result`.
+  """
   gl = state['geolocator']
   cache = state['S3VC_Lookup_Cache']
+  known_rows = get_known_rows(state)
+
+  tasks = []
+  for file in files:
+    if isinstance(file, str):  # When file is a path string
+      tasks.append( (os.path.basename(file), file) )
+    else:  # When file is a file-like object
+      tasks.append( (file.name, file.getvalue()) )
 
   if pbar:
-   # Loop through the uploaded files and convert to models
     progress_bar = st.progress(0)
-    nfiles = len(files)
+    nfiles = len(tasks)
     progress_idx = 1
 
-  for file in files:
-    if isinstance(file, str):  # When file is a path string
-      data = pd.read_csv(file)
-      file_name = os.path.basename(file)
-    else:  # When file is a file-like object
-      data = pd.read_csv(file)
-      file_name = file.name
-    
-    if data is not None:
-      df = get_dataframe(data)
-      inferred_model = modinf.infer_model_from_df(df=df)
-      if inferred_model is None:
-        st.error(f'File "{file.name}" with columns {list(df.columns)} has no reliable matches. Please make sure you are submitting a file that closely resemble the examples.')
-        continue
-
-      model_name = inferred_model['model']
-      Model = modinf.available_models[model_name]    
-
-      # Store the filename with the model name
-      if 'model_filenames' not in state:
-        state['model_filenames'] = {}
-      state['model_filenames'][model_name] = file_name
-
-      if model_name in s1_models:
-        s1_inits = {
-          's1de_calc_results': {},
-          's1de_warnings': {},
-          's1de_original_dfs': {},
-          's1de_result_dfs': {},
-          's1de_invalid_indices': {},
-        }
-
-        # Loop to initialize variables in state if not present
-        for var_name, default_value in s1_inits.items():
-          if var_name not in state:
-            state[var_name] = default_value
-        
-        CREATOR_FUNCTIONS = {
-          'S1_MobileCombustion': partial( create_s1mc_data, Model=Model, cache=cache ),
-          'S1_StationaryCombustion': partial( create_s1sc_data, Model=Model, cache=cache ),
-          'S1_FugitiveEmission': partial( create_s1fe_data, Model=Model, cache=cache ),
-        }
-
-        calc = S1_Calculator(cache=cache)
-        creator = CREATOR_FUNCTIONS[model_name]  
-        calc, warning_list, invalid_indices = df_to_calculator(df, calculator=calc, creator=creator, progress_bar=False, return_invalid_indices=True) 
-        result_df = calculator_to_df(calc)
-
-        if len(warning_list) > 0:
-          state['s1de_warnings'][model_name] = warning_list
-          state['s1de_invalid_indices'][model_name] = invalid_indices
-        state['s1de_original_dfs'][model_name] = df
-        state['s1de_result_dfs'][model_name] = result_df # required to display validated table in S1 tab, when upload vector from home.
-        state['s1de_calc_results'][model_name] = calc
-
-      elif model_name in s2_models:
-        s2_inits = {
-          's2ie_calc_results': {},
-          's2ie_warnings': {},
-          's2ie_invalid_indices': {},
-          's2ie_original_dfs': {},
-          's2ie_result_dfs': {},
-        }
-
-        # Loop to initialize variables in state if not present
-        for var_name, default_value in s2_inits.items():
-          if var_name not in state:
-            state[var_name] = default_value
-
-        CREATOR_FUNCTIONS = {
-          'S2_PurchasedPower': partial( create_s2pp_data, Model=Model, cache=cache, geolocator=gl ),
-        }
-
-        calc = S2_Calculator(cache=cache)
-        creator = CREATOR_FUNCTIONS[model_name]
-        calc, warning_list, invalid_indices = df_to_calculator(df, calculator=calc, creator=creator, progress_bar=False, return_invalid_indices=True) 
-        result_df = calculator_to_df(calc)
-
-        if len(warning_list) > 0:
-          state['s2ie_warnings'][model_name] = warning_list
-          state['s2ie_invalid_indices'][model_name] = invalid_indices
-        state['s2ie_original_dfs'][model_name] = df
-        state['s2ie_result_dfs'][model_name] = result_df # required to display validated table in S2 tab, when upload vector from home.
-        state['s2ie_calc_results'][model_name] = calc
-
-      else:
-        s3_inits = {
-          's3vc_calc_results': {},
-          's3vc_warnings': {},
-          's3vc_invalid_indices': {},
-          's3vc_original_dfs': {},
-          's3vc_result_dfs': {},
-        }
-        for var_name, default_value in s3_inits.items():
-          if var_name not in state:
-            state[var_name] = default_value
-                
-        # S3 INVESTMENT CATEGORIES
-        if model_name in c15_models:        
-          calc = S3C15_Calculator()
-          creator = partial(create_s3c15_data, Model=Model) 
-          calc, warning_list, invalid_indices = df_to_calculator(df, calculator=calc, creator=creator, progress_bar=False, return_invalid_indices=True) 
-          result_df = calculator_to_df(calc)
-
-          if len(warning_list) > 0:
-            state['s3vc_warnings'][model_name] = warning_list
-            state['s3vc_invalid_indices'][model_name] = invalid_indices
-          state['s3vc_original_dfs'][model_name] = df
-          state['s3vc_result_dfs'][model_name] = result_df
-          state['s3vc_calc_results'][model_name] = calc
-
-        # S3 NORMAL CATEGORIES
-        else:
-          CREATOR_FUNCTIONS = {
-          'S3C1_PurchasedGoods': partial( create_s3c1_data, Model=Model, cache=cache ),
-          'S3C2_CapitalGoods': partial( create_s3c2_data, Model=Model, cache=cache ),
-          'S3C3_EnergyRelated': partial( create_s3c3_data, Model=Model, cache=cache ),
-          'S3C4_UpstreamTransport': partial( create_s3c4_data, Model=Model, cache=cache ),
-          'S3C5_WasteGenerated': partial( create_s3c5_data, Model=Model, cache=cache ),
-          
-          'S3C6_1_BusinessTravel': partial( create_s3c6_1_data, Model=Model, cache=cache ),
-          'S3C6_2_BusinessStay': partial( create_s3c6_2_data, Model=Model, cache=cache ),
-          
-          'S3C7_EmployeeCommute': partial( create_s3c7_data, Model=Model, cache=cache ),
-        
-          'S3C8_1_UpstreamLeasedEstate': partial( create_s3c8_1_data, Model=Model, cache=cache, geolocator=gl ),
-          'S3C8_2_UpstreamLeasedAuto': partial( create_s3c8_2_data, Model=Model, cache=cache ),
-
-          'S3C9_DownstreamTransport':partial( create_s3c9_data, Model=Model, cache=cache ),
-          'S3C10_ProcessingProducts': partial( create_s3c10_data, Model=Model, cache=cache ),
-          'S3C11_UseOfSold': partial( create_s3c11_data, Model=Model, cache=cache ),
-          'S3C12_EOLTreatment': partial( create_s3c12_data, Model=Model, cache=cache ),
-
-          'S3C13_1_DownstreamLeasedEstate': partial( create_s3c13_1_data, Model=Model, cache=cache, geolocator=gl ),
-          'S3C13_2_DownstreamLeasedAuto': partial( create_s3c13_2_data, Model=Model, cache=cache ),             
-          
-          'S3C14_Franchise': partial( create_s3c14_data, Model=Model, cache=cache, geolocator=gl ),
-        }
-          calc = S3_Calculator(cache=cache)
-          creator = CREATOR_FUNCTIONS[model_name]
-          calc, warning_list, invalid_indices = df_to_calculator(df, calculator=calc, creator=creator, progress_bar=False, return_invalid_indices=True) 
-          result_df = calculator_to_df(calc)
-
-          if len(warning_list) > 0:
-            state['s3vc_warnings'][model_name] = warning_list
-            state['s3vc_invalid_indices'][model_name] = invalid_indices
-          state['s3vc_original_dfs'][model_name] = df
-          state['s3vc_result_dfs'][model_name] = result_df
-          state['s3vc_calc_results'][model_name] = calc
-
-      # update progress bar
-      if pbar:
-        progress_pct = progress_idx / nfiles
-        progress_bar.progress(progress_pct)
-        progress_idx += 1 
+  results = [None] * len(tasks)
+  for position, result in map_files(partial(process_file, known_rows=known_rows), tasks, cache=cache, geolocator=gl):
+    results[position] = result
+
+    # update progress bar
+    if pbar:
+      progress_pct = progress_idx / nfiles
+      progress_bar.progress(progress_pct, text=f'Processed "{tasks[position][0]}" ({progress_idx}/{nfiles})')
+      progress_idx += 1 
+
+  merged = set()
+  for position, result in enumerate(results):
+    if isinstance(result, Exception):
+      raise result
+    if result is None:
+      continue
+    if result.get('error'):
+      st.error(result['error'])
+      continue
+    if result.get('reused') is not None and result['model_name'] in merged: # rows were matched against the session before this upload
+      result = process_file(tasks[position], cache, gl)
+    merge_file_result(result, state)
+    merged.add(result['model_name'])
+
+
+def get_known_rows(state) -> dict:
+  """{model name: row keys} of the uploads whose calculator is still the one in state, see `merge_file_result`."""
+  known_rows = {}
+  for model_name, rows in state.get('upload_rows', {}).items():
+    if rows['calc'] is state.get(f"{rows['scope']}_calc_results", {}).get(model_name): # not replaced by a scope page upload
+      known_rows[model_name] = np.fromiter(rows['uuids'], dtype=np.uint64, count=len(rows['uuids']))
+  return known_rows
+
+
+def merge_file_result(result: dict, state):
+  """
+  Store one `process_file` result in the session, under the scope's state keys.
+  A re-upload of a model whose rows were partly `reused` updates the calculator in state instead of replacing it:
+  rows missing from the new file go through `remove_data`, the newly calculated rows are appended. Totals and
+  aggregates of the unchanged rows are never recalculated. `state['upload_rows']` maps row keys to calculator uuids.
+  """
+  model_name, scope = result['model_name'], result['scope']
+
+  # Store the filename with the model name
+  if 'model_filenames' not in state:
+    state['model_filenames'] = {}
+  state['model_filenames'][model_name] = result['file_name']
+
+  # Loop to initialize variables in state if not present
+  for var_name in ['calc_results', 'warnings', 'invalid_indices', 'original_dfs', 'result_dfs']:
+    if f'{scope}_{var_name}' not in state:
+      state[f'{scope}_{var_name}'] = {}
+  if 'upload_rows' not in state:
+    state['upload_rows'] = {}
+
+  calc, result_df, uuids = result['calc'], result['result_df'], result.get('row_uuids')
+  if result.get('reused') is not None:
+    rows = state['upload_rows'][model_name]
+    calc = rows['calc']
+    kept = set(result['row_keys'][result['reused']].tolist())
+    removed = [uuid for key, uuid in rows['uuids'].items() if key not in kept]
+    for uuid in removed:
+      calc.remove_data(uuid)
+    merge_calculator(calc, result['calc'])
+
+    result_df = state[f'{scope}_result_dfs'][model_name]
+    if removed and 'uuid' in result_df.columns:
+      result_df = result_df[~result_df['uuid'].isin(removed)]
+    result_df = pd.concat([result_df, result['result_df']], ignore_index=True)
+    if uuids is not None:
+      uuids = {**{key: uuid for key, uuid in rows['uuids'].items() if key in kept}, **uuids}
+
+  # warnings of the new file only, reused rows were valid
+  if len(result['warning_list']) > 0:
+    state[f'{scope}_warnings'][model_name] = result['warning_list']
+    state[f'{scope}_invalid_indices'][model_name] = result['invalid_indices']
+  else:
+    state[f'{scope}_warnings'].pop(model_name, None)
+    state[f'{scope}_invalid_indices'].pop(model_name, None)
+  state[f'{scope}_original_dfs'][model_name] = result['df']
+  state[f'{scope}_result_dfs'][model_name] = result_df # required to display validated table in the scope tab, when upload vector from home.
+  state[f'{scope}_calc_results'][model_name] = calc
+  if uuids is not None:
+    state['upload_rows'][model_name] = {'scope': scope, 'calc': calc, 'uuids': uuids}
+  else: # rows and uuids did not line up, the next upload of this model is calculated in full
+    state['upload_rows'].pop(model_name, None)
 
 
 
@@ -286,6 +218,7 @@ def aggrid_row_delete(grid):
 
   for row in selected_rows:
     model_name = row['Model Name']
+    state.get('upload_rows', {}).pop(model_name, None) # the whole calculator goes, no row is removed one by one
 
     for prefix in prefixes:
       for suffix in suffixes:
@@ -328,17 +261,6 @@ def create_grid_from_upload_df(df, theme='streamlit'):
 
 
 
-all_models = list(ModelInferencer().available_models.keys())
-s1_models = [
-  'S1_FugitiveEmission', 'S1_MobileCombustion', 'S1_StationaryCombustion'
-]
-s2_models = ['S2_PurchasedPower']
-c15_models =[
-  'S3C15_BaseAsset','S3C15_1A_ListedEquity','S3C15_1B_UnlistedEquity','S3C15_1C_CorporateBonds','S3C15_1D_BusinessLoans','S3C15_1E_CommercialRealEstate',
-  'S3C15_2A_Mortgage','S3C15_2B_VehicleLoans',
-  'S3C15_3_ProjectFinance','S3C15_4_EmissionRemovals','S3C15_5_SovereignDebt', 'S3C15_6_ManagedInvestments',
-]
-
 qa_md = """
 Already used to our navigation? Here is a one-stop place to upload your relevant GHG accounting tables.
 """
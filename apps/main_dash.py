@@ -16,6 +16,8 @@ from plotly.subplots import make_subplots
 from utils.utility import format_metric, convert_df, humanize_field
 from utils.display_utility import pandas_2_AgGrid
 from utils.model_df_utility import calculators_2_df
+from utils.emission_aggregates import aggregate_totals
+from utils.ghg_utils import GWP_SETS
 from utils.charting import make_donut_chart, sort_str_column_numeric
 
 
@@ -32,9 +34,13 @@ def main_dash_Page():
   st.title('Emissions Executive Summary')
   dfs_to_concat = []
 
+  # Results are stored per gas, switching the GWP set re-weights them without recalculating
+  gwp_set = st.selectbox('GWP set', options=list(GWP_SETS), key='gwp_set', help="'default' is the set results were calculated with.")
+  gwp_set = None if gwp_set == 'default' else gwp_set
+
   if 's1de_calc_results' in state and state['s1de_calc_results'] != {}:
     s1_res = state['s1de_calc_results']
-    s1_df = calculators_2_df(s1_res)
+    s1_df = calculators_2_df(s1_res, gwp_set=gwp_set)
     dfs_to_concat.append(s1_df)
   else:
     st.info('Calculated results of Scope 1 has yet to be retrieved. Main dashboard will not include results for Scope 1.')
@@ -42,14 +48,14 @@ def main_dash_Page():
 
   if 's2ie_calc_results' in state and state['s2ie_calc_results'] != {}:
     s2_res = state['s2ie_calc_results']     
-    s2_df = calculators_2_df(s2_res)
+    s2_df = calculators_2_df(s2_res, gwp_set=gwp_set)
     dfs_to_concat.append(s2_df)
   else:
     st.info('Calculated results of Scope 2 has yet to be retrieved. Main dashboard will not include results for Scope 2.')
 
   if 's3vc_calc_results' in state and state['s3vc_calc_results'] != {}:
     s3_res = state['s3vc_calc_results'] # key: Model name, val: Calculator # 
-    s3_df = calculators_2_df(s3_res) # convert each k/v to df
+    s3_df = calculators_2_df(s3_res, gwp_set=gwp_set) # convert each k/v to df
     dfs_to_concat.append(s3_df)
   else:
     st.info('Calculated results of Scope 3 has yet to be retrieved. Main dashboard will not include results for Scope 3.')
@@ -59,8 +65,14 @@ def main_dash_Page():
     df = pd.concat(standardized_dfs, ignore_index=True)
     df = standardize_merged_df(df)
 
-    # Emissions Overview
-    emissionOverviewPart(df)
+    # Emissions Overview, scope totals come from the calculators' running aggregates (stored results, default GWP set)
+    scope_totals = None
+    if not gwp_set:
+      scope_totals = {}
+      for calc_results in ['s1de_calc_results', 's2ie_calc_results', 's3vc_calc_results']:
+        for scope, amount in aggregate_totals(state.get(calc_results, {}), by='scope').items():
+          scope_totals[scope] = scope_totals.get(scope, 0) + amount
+    emissionOverviewPart(df, scope_totals=scope_totals)
 
     # Category Performance
     categoryPerformancePart(df)
@@ -128,18 +140,22 @@ def main_dash_Page():
 
 #-- PARTS --# 
 
-def emissionOverviewPart(df):      
+def emissionOverviewPart(df, scope_totals=None):
+    """scope_totals: {scope: emissions}, EG: from `aggregate_totals`. Summed from `df` when None."""
+    if scope_totals is None:
+      scope_totals = df.groupby('scope')['emission_result'].sum().to_dict()
+
     with st.expander('Emissions Overview', expanded=True):
       c1, c2, c3 = st.columns([1, 1, 1])
       
       with c1:
-          total_scope1 = df[df['scope'] == 1]['emission_result'].sum()
+          total_scope1 = scope_totals.get(1, 0)
           st.metric(label="Scope 1 Emissions", value=format_metric(total_scope1))
       with c2:
-          total_scope2 = df[df['scope'] == 2]['emission_result'].sum()
+          total_scope2 = scope_totals.get(2, 0)
           st.metric(label="Scope 2 Emissions", value=format_metric(total_scope2))
       with c3:
-          total_scope3 = df[df['scope'] == 3]['emission_result'].sum()
+          total_scope3 = scope_totals.get(3, 0)
           st.metric(label="Scope 3 Emissions", value=format_metric(total_scope3))
 
       temp = df.copy()
@@ -16,6 +16,7 @@ import plotly.graph_objects as go
 from utils.utility import get_dataframe, format_metric
 from utils.display_utility import show_example_form, pandas_2_AgGrid
 from utils.model_df_utility import df_to_calculator, calculator_to_df, calculators_2_df
+from utils.emission_aggregates import aggregate_totals
 from utils.md_utility import markdown_insert_images
 from utils.model_inferencer import ModelInferencer
 
@@ -23,12 +24,12 @@ from utils.s1de_Misc.s1_models import *
 from utils.s1de_Misc.s1_calculators import S1_Calculator
 from utils.s1de_Misc.s1_creators import *
 
-from utils.s3vc_Misc.s3_cache import S3_Lookup_Cache
+from utils.s3vc_Misc.s3_cache import S3_Lookup_Cache, get_shared_s3_cache
 
 
 def s1de_Page(): 
   user_level = state.get("user_level", 1)
-  state['S1SC_Lookup_Cache'] = state.get('S1SC_Lookup_Cache', S3_Lookup_Cache())
+  state['S1SC_Lookup_Cache'] = state.get('S1SC_Lookup_Cache', get_shared_s3_cache())
   state['s1sc_df'] = state.get('s1sc_df', None)
   state['validated_s1sc_df'] = state.get('validated_s1sc_df', None)
   state['validated_s1sc_warnings'] = state.get('validated_s1sc_warnings', [])
@@ -237,9 +238,10 @@ def s1de_Page():
 
     if 's1de_calc_results' in state and state['s1de_calc_results'] != {}:
       res_df = state['s1de_calc_results'] # key: Model name, val: Calculator
+      category_totals = aggregate_totals(res_df, by='category') # running totals, no recompute
       res_df = calculators_2_df(res_df) # convert each k/v to df
 
-      emissionOverviewPart(df=res_df)
+      emissionOverviewPart(df=res_df, category_totals=category_totals)
 
       st.write('')
       st.write('')
@@ -275,19 +277,26 @@ def s1de_Page():
 
 
 
-def emissionOverviewPart(df):      
+def emissionOverviewPart(df, category_totals=None):
+    """category_totals: {model name: emissions}, EG: from `aggregate_totals`. Summed from `df` when None."""
     # Global styling
     style_metric_cards(background_color='#D6D6D6', border_left_color='#28104E', border_radius_px=60)
 
+    if category_totals is None:
+      category_totals = {
+        name: df[df['category_name'] == category_name]['emission_result'].sum()
+        for name, category_name in [('S1_MobileCombustion', 'C0: Mobile Combustion'), ('S1_StationaryCombustion', 'C0: Stationary Combustion'), ('S1_FugitiveEmission', 'C0: Fugitive Emission')]
+      }
+
     c1,c2,c3 = st.columns([1,1,1])
     with c1: 
-      total_mc = df[df['category_name'] == 'C0: Mobile Combustion']['emission_result'].sum()
+      total_mc = category_totals.get('S1_MobileCombustion', 0)
       st.metric(label="Mobile Combustion", value=format_metric(total_mc))
     with c2:
-      total_sc = df[df['category_name'] == 'C0: Stationary Combustion']['emission_result'].sum()
+      total_sc = category_totals.get('S1_StationaryCombustion', 0)
       st.metric(label="Stationary Combustion", value=format_metric(total_sc))
     with c3:
-      total_fe = df[df['category_name'] == 'C0: Fugitive Emission']['emission_result'].sum()
+      total_fe = category_totals.get('S1_FugitiveEmission', 0)
       st.metric(label="Fugitive Emissions", value=format_metric(total_fe))
     st.divider()
 
@@ -13,21 +13,22 @@ import plotly.graph_objects as go
 from utils.s2ie_Misc.s2_models import S2_PurchasedPower
 from utils.s2ie_Misc.s2_calculators import S2_Calculator
 from utils.s2ie_Misc.s2_creators import create_s2pp_data
-from utils.s3vc_Misc.s3_cache import S3_Lookup_Cache
+from utils.s3vc_Misc.s3_cache import S3_Lookup_Cache, get_shared_s3_cache
 
 from utils.model_inferencer import ModelInferencer
 from utils.utility import get_dataframe, format_metric
 from utils.display_utility import show_example_form, pandas_2_AgGrid
 from utils.md_utility import markdown_insert_images
 from utils.model_df_utility import calculator_to_df, df_to_calculator, calculators_2_df
-from utils.geolocator import GeoLocator
+from utils.emission_aggregates import aggregate_totals
+from utils.geolocator import get_shared_geolocator
 
 
 def s2ie_Page():
   if 'geolocator' not in state:
-    state['geolocator'] = GeoLocator() # constructors cant use state.get() method
+    state['geolocator'] = get_shared_geolocator() # constructors cant use state.get() method
   if 'S2IE_Lookup_Cache' not in state:
-    state['S2IE_Lookup_Cache'] = S3_Lookup_Cache()
+    state['S2IE_Lookup_Cache'] = get_shared_s3_cache()
 
   user_level = state.get("user_level", 1)
   state['s2ie_original_dfs'] = state.get('s2ie_original_dfs', {})
@@ -206,7 +207,7 @@ def s2ie_Page():
         res_df = st.session_state['s2ie_calc_results'] # key: Model name, val: Calculator
         res_df = calculators_2_df(res_df) # convert each k/v to df
         
-        emissionOverviewPart(df=res_df)
+        emissionOverviewPart(df=res_df, scope_totals=aggregate_totals(st.session_state['s2ie_calc_results'], by='scope')) # running totals, no recompute
 
         st.write('')
         st.write('')
@@ -230,11 +231,14 @@ def s2ie_Page():
 
 
 
-def emissionOverviewPart(df):      
+def emissionOverviewPart(df, scope_totals=None):
+    """scope_totals: {scope: emissions}, EG: from `aggregate_totals`. Summed from `df` when None."""
     # Global styling
     style_metric_cards(background_color='#D6D6D6', border_left_color='#28104E', border_radius_px=60)
 
-    total_s2 = df[df['scope'] == 2]['emission_result'].sum()
+    if scope_totals is None:
+      scope_totals = df.groupby('scope')['emission_result'].sum().to_dict()
+    total_s2 = scope_totals.get(2, 0)
     st.metric(label="Scope 2 Emissions", value=format_metric(total_s2))
     st.divider()
 
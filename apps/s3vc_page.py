@@ -16,11 +16,13 @@ from utils.globals import SECTOR_TO_CATEGORY_IDX, IDX_TO_CATEGORY_NAME
 from utils.utility import get_dataframe, format_metric
 from utils.display_utility import show_example_form, pandas_2_AgGrid
 from utils.model_df_utility import df_to_calculator, calculator_to_df, calculators_2_df
+from utils.emission_aggregates import aggregate_totals
 from utils.md_utility import markdown_insert_images
 from utils.model_inferencer import ModelInferencer
+from utils.geolocator import get_shared_geolocator
 
 from utils.s3vc_Misc.s3_models import *
-from utils.s3vc_Misc.s3_cache import S3_Lookup_Cache
+from utils.s3vc_Misc.s3_cache import S3_Lookup_Cache, get_shared_s3_cache
 from utils.s3vc_Misc.s3_calculators import S3_Calculator
 from utils.s3vc_Misc.s3_creators import *
 
@@ -30,9 +32,9 @@ from utils.s3vc_Misc.s3c15_calculators import S3C15_Calculator, create_s3c15_dat
 
 def s3vc_Page(): 
   if 'geolocator' not in state:
-    state['geolocator'] = GeoLocator()
+    state['geolocator'] = get_shared_geolocator()
   if 'S3VC_Lookup_Cache' not in state:
-    state['S3VC_Lookup_Cache'] = S3_Lookup_Cache()
+    state['S3VC_Lookup_Cache'] = get_shared_s3_cache()
   user_level = state.get('user_level', 1)
 
   st.title('Scope 3: Value Chain')  
@@ -403,7 +405,7 @@ def s3vc_Page():
         res_df = state['s3vc_calc_results'] # key: Model name, val: Calculator
         res_df = calculators_2_df(res_df) # convert each k/v to df
         
-        emissionOverviewPart(df=res_df)
+        emissionOverviewPart(df=res_df, scope_totals=aggregate_totals(state['s3vc_calc_results'], by='scope')) # running totals, no recompute
 
         st.write('')
         st.write('')
@@ -433,11 +435,14 @@ def s3vc_Page():
 #---
 # Helpers
 #---
-def emissionOverviewPart(df):      
+def emissionOverviewPart(df, scope_totals=None):
+    """scope_totals: {scope: emissions}, EG: from `aggregate_totals`. Summed from `df` when None."""
     # Global styling
     style_metric_cards(background_color='#D6D6D6', border_left_color='#28104E', border_radius_px=60)
 
-    total_s3 = df[df['scope'] == 3]['emission_result'].sum()
+    if scope_totals is None:
+      scope_totals = df.groupby('scope')['emission_result'].sum().to_dict()
+    total_s3 = scope_totals.get(3, 0)
     st.metric(label="Scope 3 Emissions", value=format_metric(total_s3))
     st.divider()
 
@@ -14,18 +14,19 @@ hide_st_style = """
             </style>
             """
 
-icon = Image.open("./resources/GreenLogo_ico.ico")
-st.set_page_config(
-  page_title="Gecko Technologies Emission Calculation Service",
-  page_icon=icon,
-  layout="wide",
-  initial_sidebar_state="collapsed",
-  menu_items={
-    'Get Help': 'https://www.geckointel.com',
-    'Report a bug': "https://geckointel.com/contact-us",
-    'About': "# Gecko Technologies. GHG Emission Calculation Service",
-  }
-) # 
+def set_page_config():
+  icon = Image.open("./resources/GreenLogo_ico.ico")
+  st.set_page_config(
+    page_title="Gecko Technologies Emission Calculation Service",
+    page_icon=icon,
+    layout="wide",
+    initial_sidebar_state="collapsed",
+    menu_items={
+      'Get Help': 'https://www.geckointel.com',
+      'Report a bug': "https://geckointel.com/contact-us",
+      'About': "# Gecko Technologies. GHG Emission Calculation Service",
+    }
+  ) # 
 
 sidebar_md = """
 ## Resources
@@ -191,5 +192,6 @@ def run_app():
   complex_nav = build_navigation(user_level)
   app.run(complex_nav=complex_nav)
 
-if __name__ == '__main__':
+if __name__ == '__main__': # file pool workers import this script as __mp_main__, they must not touch the page
+  set_page_config()
   run_app()
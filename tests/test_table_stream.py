@@ -0,0 +1,90 @@
+import pytest
+
+import utils.table_stream as table_stream
+from utils.utility import supabase_query_in
+
+
+class FakeQuery:
+    """One postgrest request. `.range(start, end)` sends `Range: start-(end-1)`, the server answers at most `max_rows` rows."""
+    def __init__(self, table, start, end, with_count):
+        self.table, self.start, self.end, self.with_count = table, start, end, with_count
+
+    def execute(self):
+        self.table.ranges.append(f'{self.start}-{self.end - 1}')
+        if self.end - 1 < self.start:
+            raise ValueError(f'invalid Range header {self.start}-{self.end - 1}')
+        last = min(self.end, self.start + self.table.max_rows)
+        data = self.table.rows[self.start:last]
+        return type('Response', (), {'data': data, 'count': len(self.table.rows) if self.with_count and self.table.counts else None})
+
+
+class FakeTable:
+    def __init__(self, num_rows, max_rows=1000, counts=True, rows=None):
+        self.rows = rows if rows is not None else [{'id': i} for i in range(num_rows)]
+        self.max_rows = max_rows
+        self.counts = counts
+        self.ranges = []
+
+    def build(self, start, end, with_count=False):
+        return FakeQuery(self, start, end, with_count)
+
+
+class FakePool:
+    def execute(self, query_builder):
+        return query_builder.execute()
+
+
+@pytest.fixture
+def fake_table(monkeypatch):
+    def make(*args, **kwargs):
+        table = FakeTable(*args, **kwargs)
+        monkeypatch.setattr(table_stream, '_page_builder', lambda *a, **k: table.build)
+        monkeypatch.setattr(table_stream, 'SUPABASE_POOL', FakePool())
+        return table
+    return make
+
+
+def read(**kwargs):
+    return [row['id'] for rows in table_stream.iter_table_pages('t', **kwargs) for row in rows]
+
+
+@pytest.mark.parametrize('prefetch', [0, 1, 3])
+def test_reads_every_row(fake_table, prefetch):
+    table = fake_table(5000)
+    assert read(page_size=1000, prefetch=prefetch) == list(range(5000))
+    assert table.ranges[:2] == ['0-999', '1000-1999']
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_server_cap_below_page_size(fake_table, prefetch):
+    table = fake_table(5000, max_rows=999)
+    assert read(page_size=1000, prefetch=prefetch) == list(range(5000))
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_without_count_ends_on_empty_page(fake_table, prefetch):
+    table = fake_table(2500, max_rows=700, counts=False)
+    assert read(page_size=1000, prefetch=prefetch) == list(range(2500))
+
+
+def test_small_result_is_one_request(fake_table):
+    table = fake_table(1)
+    assert read(page_size=1000) == [0]
+    assert table.ranges == ['0-999']
+
+
+def test_limit(fake_table):
+    table = fake_table(5000)
+    assert read(page_size=1000, limit=1500) == list(range(1500))
+    assert table.ranges == ['0-999', '1000-1499']
+
+
+def test_empty_table(fake_table):
+    table = fake_table(0)
+    assert read() == []
+
+
+def test_query_in_pages_past_row_cap(fake_table):
+    fake_table(0, rows=[{'id': i, 'fuel': ['Diesel', 'Petrol'][i % 2]} for i in range(2500)])
+    grouped = supabase_query_in('t', 'fuel', ['Diesel', 'Petrol', 'LPG'])
+    assert [len(grouped[fuel]) for fuel in ['Diesel', 'Petrol', 'LPG']] == [1250, 1250, 0]
@@ -0,0 +1,65 @@
+import os
+
+"""
+Runtime knobs for the factor lookup layer. Override with environment variables, EG:
+  TRACE_CACHE_DIR=/tmp/trace_cache streamlit run main.py
+"""
+
+#--- Persistent factor cache ---#
+CACHE_DIR = os.getenv('TRACE_CACHE_DIR', '.trace_cache')
+FACTOR_DISK_CACHE_ENABLED = os.getenv('TRACE_FACTOR_DISK_CACHE', '1') not in ['0', 'false', 'False']
+FACTOR_DISK_CACHE_TTL = float(os.getenv('TRACE_FACTOR_DISK_CACHE_TTL', 7 * 24 * 3600)) # seconds
+
+#--- Factor backend ---#
+# 'supabase' queries the live project. 'local' answers the same queries from exported files, no network needed.
+FACTOR_BACKEND = os.getenv('TRACE_FACTOR_BACKEND', 'supabase')
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOCAL_FACTOR_EXPORT_DIR = os.getenv('TRACE_LOCAL_FACTOR_EXPORT_DIR', os.path.join(_ROOT, 'resources', 'factor_exports'))
+LOCAL_FACTOR_DIRS = [LOCAL_FACTOR_EXPORT_DIR, os.path.join(_ROOT, 'resources', 'csvs')] # searched in order, first match wins
+
+#--- Shared in-memory lookup cache ---#
+LOOKUP_CACHE_MAX_ENTRIES = int(os.getenv('TRACE_LOOKUP_CACHE_MAX_ENTRIES', 50000))
+LOOKUP_CACHE_TTL = float(os.getenv('TRACE_LOOKUP_CACHE_TTL', 0)) or None # seconds, 0 disables expiry
+
+#--- Factor prefetch ---#
+PREFETCH_MAX_WORKERS = int(os.getenv('TRACE_PREFETCH_MAX_WORKERS', 8)) # concurrent lookups before the row loop, 0 disables prefetch
+
+#--- Negative lookup cache ---#
+NEGATIVE_CACHE_TTL = float(os.getenv('TRACE_NEGATIVE_CACHE_TTL', 300)) # seconds a "not found" / failed lookup is remembered
+
+#--- Batched IN queries ---#
+SUPABASE_IN_URL_BUDGET = int(os.getenv('TRACE_SUPABASE_IN_URL_BUDGET', 4000)) # max encoded chars of one `in.(...)` filter before splitting
+
+#--- Paged table reads ---#
+SUPABASE_PAGE_SIZE = int(os.getenv('TRACE_SUPABASE_PAGE_SIZE', 1000)) # rows per range request, supabase caps responses at `max_rows` (1000 by default)
+SUPABASE_PREFETCH_PAGES = int(os.getenv('TRACE_SUPABASE_PREFETCH_PAGES', 1)) # pages fetched ahead in the background, 0 disables
+SUPABASE_LOOKUP_LIMIT = int(os.getenv('TRACE_SUPABASE_LOOKUP_LIMIT', 10000)) # max rows of one filtered (keyed) lookup, read without prefetch
+
+#--- Fuzzy category matching ---#
+FUZZY_MATCH_CACHE_MAX_ENTRIES = int(os.getenv('TRACE_FUZZY_MATCH_CACHE_MAX_ENTRIES', 100000)) # memoized (field, raw value) corrections
+FUZZY_NGRAM_MIN_CHOICES = int(os.getenv('TRACE_FUZZY_NGRAM_MIN_CHOICES', 500)) # allowed lists this long get a trigram candidate index, 0 disables
+FUZZY_NGRAM_TOP_K = int(os.getenv('TRACE_FUZZY_NGRAM_TOP_K', 50)) # candidates scored per query through the trigram index
+FUZZY_NGRAM_CONFIDENT_SCORE = int(os.getenv('TRACE_FUZZY_NGRAM_CONFIDENT_SCORE', 95)) # trigram candidates scoring below this are rescored against every choice
+
+#--- Reverse geocoding ---#
+GEO_CACHE_PRECISION = int(os.getenv('TRACE_GEO_CACHE_PRECISION', 4)) # lat/lon decimals before lookup, 4 ~ 11m
+GEO_CACHE_MAX_ENTRIES = int(os.getenv('TRACE_GEO_CACHE_MAX_ENTRIES', 100000)) # rounded coordinates kept in the LRU
+
+#--- Upload ingestion ---#
+INGEST_BATCH_SIZE = int(os.getenv('TRACE_INGEST_BATCH_SIZE', 1000)) # rows validated per TypeAdapter call, also the progress bar cadence
+
+#--- Parallel file processing ---#
+FILE_POOL_MODE = os.getenv('TRACE_FILE_POOL_MODE', 'thread') # 'thread' shares the session cache, 'process' scales with cores for large uploads, 'serial' disables the pool
+FILE_POOL_PROCESS_MIN_BYTES = int(os.getenv('TRACE_FILE_POOL_PROCESS_MIN_BYTES', 32 * 2**20)) # 'process' mode: smaller uploads (all files together) run on threads
+FILE_POOL_MAX_WORKERS = int(os.getenv('TRACE_FILE_POOL_MAX_WORKERS', 0)) or min(os.cpu_count() or 1, 8) # 0 picks the core count, capped at 8
+ROW_POOL_MAX_WORKERS = int(os.getenv('TRACE_ROW_POOL_MAX_WORKERS', FILE_POOL_MAX_WORKERS)) # processes splitting ONE large upload, 1 disables
+ROW_CHUNK_SIZE = int(os.getenv('TRACE_ROW_CHUNK_SIZE', 50000)) # rows per chunk, uploads shorter than two chunks are not split
+
+#--- Calculator results ---#
+RESULT_STORE_ENABLED = os.getenv('TRACE_RESULT_STORE', '1') not in ['0', 'false', 'False'] # columnar `calculated_emissions`, see utils.result_store
+RESULT_STORE_CHUNK_ROWS = int(os.getenv('TRACE_RESULT_STORE_CHUNK_ROWS', 4096)) # rows buffered as dicts before being packed into columns
+
+#--- Upload result cache ---#
+UPLOAD_CACHE_ENABLED = os.getenv('TRACE_UPLOAD_CACHE', '1') not in ['0', 'false', 'False'] # identical uploads restore their results, see utils.upload_cache
+UPLOAD_CACHE_DIR = os.getenv('TRACE_UPLOAD_CACHE_DIR', os.path.join(CACHE_DIR, 'uploads'))
+UPLOAD_CACHE_MAX_BYTES = int(float(os.getenv('TRACE_UPLOAD_CACHE_MAX_MB', 1024)) * 1024 * 1024) # least recently used results are evicted beyond this
@@ -0,0 +1,259 @@
+import heapq
+import threading
+from collections import OrderedDict, Counter
+from itertools import count
+from typing import Optional, Dict, List, Iterable, Tuple
+
+from fuzzywuzzy import fuzz, process, utils as fuzz_utils
+
+from utils.app_config import FUZZY_MATCH_CACHE_MAX_ENTRIES, FUZZY_NGRAM_MIN_CHOICES, FUZZY_NGRAM_TOP_K, FUZZY_NGRAM_CONFIDENT_SCORE
+
+
+"""
+Usage:
+  Memoized version of `find_closest_category`. Same answers as `process.extractOne` with the WRatio scorer (see
+  `ChoiceIndex.best` for the one approximation), but every allowed list is normalized ONCE into a choice index, and every (field, raw value) is resolved ONCE per
+  process. Uploads repeating the same few spellings thousands of times only pay for fuzzy matching once per spelling.
+
+  Allowed lists are recognised by identity first, so the cached lists creators pass row after row are not hashed per
+  lookup. Treat a list as read-only once it was matched against: changed in place, it keeps its old index.
+
+  Large lists (FUZZY_NGRAM_MIN_CHOICES+, EG: locations_states) also get an inverted character trigram index, so a query
+  only scores the FUZZY_NGRAM_TOP_K choices sharing the most trigrams with it instead of every choice. Unless one of
+  them scores FUZZY_NGRAM_CONFIDENT_SCORE+, every choice is scored anyway.
+
+matcher = get_category_matcher()
+matcher.match('Malaysa', allowed_countries, field='country') >> 'Malaysia'
+matcher.match('my', allowed_countries, abbrv_dict=LOCATION_ABBRV) >> 'Malaysia'
+matcher.get_stats() >> {'hits': 4211, 'misses': 37, 'indexes': 5, 'entries': 37}
+"""
+
+def _normalize(value: str) -> str:
+    return fuzz_utils.full_process(value, force_ascii=True)
+
+
+def _ngrams(value: str, n: int = 3) -> set:
+    padded = f' {value} '
+    return set(padded[i:i + n] for i in range(max(len(padded) - n + 1, 1)))
+
+
+#-----
+# Choice index
+#-----
+class ChoiceIndex:
+    _serials = count()
+
+    def __init__(self, choices: Iterable[str], ngram_min_choices: int = FUZZY_NGRAM_MIN_CHOICES, top_k: int = FUZZY_NGRAM_TOP_K, confident_score: int = FUZZY_NGRAM_CONFIDENT_SCORE):
+        """
+        Allowed values processed up front. `exact` maps a normalized value to the first choice with that form,
+        which is the choice WRatio scores 100 and extractOne would return.
+
+        ngram_min_choices:
+          Lists at least this long get a trigram index (`grams`: trigram -> positions of choices containing it). 0 disables.
+
+        top_k:
+          Choices scored per query when the trigram index is used.
+
+        confident_score:
+          Best candidate score accepted without scoring every choice. Lower is faster and further from extractOne.
+        """
+        self.serial = next(ChoiceIndex._serials) # short stand-in for the choices in memo keys
+        self.choices: List[str] = list(choices)
+        self.processed: List[str] = [_normalize(choice) for choice in self.choices]
+        self.exact: Dict[str, str] = {}
+        for choice, processed in zip(self.choices, self.processed):
+            self.exact.setdefault(processed, choice)
+
+        self.top_k = top_k
+        self.confident_score = confident_score
+        self.grams: Optional[Dict[str, List[int]]] = None
+        self.gram_counts: List[int] = []
+        if ngram_min_choices and len(self.choices) >= ngram_min_choices:
+            self.grams = {}
+            for i, processed in enumerate(self.processed):
+                grams = _ngrams(processed)
+                self.gram_counts.append(len(grams))
+                for gram in grams:
+                    self.grams.setdefault(gram, []).append(i)
+
+    def __len__(self):
+        return len(self.choices)
+
+    def _score(self, processed_query: str, positions: Iterable[int]) -> Tuple[Optional[str], int]:
+        best_choice, best_score = None, -1
+        for i in positions:
+            score = fuzz.WRatio(processed_query, self.processed[i], full_process=False)
+            if score > best_score: # first best wins, same as max() in extractOne
+                best_choice, best_score = self.choices[i], score
+        return best_choice, best_score
+
+    def candidates(self, processed_query: str) -> List[int]:
+        """
+        Positions of the `top_k` choices with the highest trigram overlap, in list order.
+        Overlap is shared / min(query trigrams, choice trigrams), so short choices inside a long query (and the reverse),
+        which WRatio scores through partial_ratio, rank as high as full matches.
+        """
+        query_grams = _ngrams(processed_query)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.grams.get(gram, ()))
+
+        def overlap(i):
+            return shared[i] / min(len(query_grams), self.gram_counts[i]), shared[i]
+        return sorted(heapq.nlargest(self.top_k, shared, key=overlap))
+
+    def best(self, query: str, threshold: int = 0) -> Tuple[Optional[str], int]:
+        """
+        (closest choice, score). Same as `process.extractOne(query, choices)`, with one intentional approximation:
+        with a trigram index only the top candidates are scored, and their best is returned if it reaches both
+        `threshold` and `confident_score`. A choice outside the candidates could still tie or beat it, then a different
+        (equally close or marginally closer) choice than extractOne's is returned. Anything less certain is rescored
+        against every choice, so whether a match above threshold exists is never decided by the index alone.
+        """
+        processed_query = _normalize(query)
+        if processed_query in self.exact:
+            return self.exact[processed_query], 100
+
+        if self.grams is not None:
+            best_choice, best_score = self._score(processed_query, self.candidates(processed_query))
+            if best_score >= max(threshold, self.confident_score) and best_choice is not None:
+                return best_choice, best_score
+        return self._score(processed_query, range(len(self.choices)))
+
+
+#-----
+# Matcher
+#-----
+class CategoryMatcher:
+    MAX_LIST_IDS = 256 # allowed lists (and abbreviation dicts) recognised by identity, least recently used dropped first
+
+    def __init__(self, max_entries: Optional[int] = FUZZY_MATCH_CACHE_MAX_ENTRIES):
+        """
+        max_entries:
+          Memoized (field, raw value) results kept, least recently used dropped first. None means unbounded.
+        """
+        self.max_entries = max_entries
+        self._indexes: Dict[tuple, ChoiceIndex] = {}
+        self._list_ids: OrderedDict = OrderedDict() # id(allowed list): (allowed list, index), the list is kept so its id is not reused
+        self._abbrvs: Dict[tuple, Tuple[int, Dict[str, str]]] = {} # abbreviation items: (serial, lowercased abbreviations)
+        self._abbrv_ids: OrderedDict = OrderedDict() # id(abbrv_dict): (abbrv_dict, serial, lowercased abbreviations)
+        self._memo: OrderedDict = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0}
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return f"<CategoryMatcher: {len(self._indexes)} indexes, {len(self._memo)}/{self.max_entries} memoized>"
+
+    #--Helper--#
+    def get_index(self, allowed_list) -> ChoiceIndex:
+        """Index of `allowed_list`. Only a list object not seen recently is hashed, equal lists share one index."""
+        list_id = id(allowed_list)
+        with self._lock:
+            entry = self._list_ids.get(list_id)
+            if entry is not None and entry[0] is allowed_list and len(allowed_list) == len(entry[1]):
+                self._list_ids.move_to_end(list_id)
+                return entry[1]
+
+        key = tuple(allowed_list)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = ChoiceIndex(key)
+            self._list_ids[list_id] = (allowed_list, index)
+            while len(self._list_ids) > self.MAX_LIST_IDS:
+                self._list_ids.popitem(last=False)
+        return index
+
+    def _get_abbrv(self, abbrv_dict) -> Tuple[Optional[int], Dict[str, str]]:
+        """(serial, lowercased abbreviations) of `abbrv_dict`, recognised by identity like allowed lists."""
+        if not abbrv_dict:
+            return None, {}
+        dict_id = id(abbrv_dict)
+        with self._lock:
+            entry = self._abbrv_ids.get(dict_id)
+            if entry is not None and entry[0] is abbrv_dict and len(abbrv_dict) == len(entry[2]):
+                self._abbrv_ids.move_to_end(dict_id)
+                return entry[1], entry[2]
+
+        key = tuple(sorted(abbrv_dict.items()))
+        with self._lock:
+            if key not in self._abbrvs:
+                self._abbrvs[key] = (len(self._abbrvs), {str(k).strip().lower(): v for k, v in abbrv_dict.items()})
+            serial, abbrv = self._abbrvs[key]
+            self._abbrv_ids[dict_id] = (abbrv_dict, serial, abbrv)
+            while len(self._abbrv_ids) > self.MAX_LIST_IDS:
+                self._abbrv_ids.popitem(last=False)
+        return serial, abbrv
+
+    def _resolve(self, input_str, index: ChoiceIndex, threshold, abbrv: Dict[str, str]) -> Optional[str]:
+        input_str = abbrv.get(input_str.strip().lower(), input_str)
+        closest_match, score = index.best(input_str, threshold=threshold)
+        if score >= threshold:
+            return closest_match
+        return None
+
+    #--Match--#
+    def match(self, input_str, allowed_list: list, threshold=80, abbrv_dict: Optional[dict] = None, field: Optional[str] = None) -> Optional[str]:
+        """
+        Closest allowed value for `input_str`, or None when nothing scores at least `threshold`.
+        `field` only namespaces the memo, EG: 'country' and 'state' spellings never share entries.
+        """
+        if input_str in [None, '']:
+            return None
+        if not isinstance(input_str, str) or not allowed_list:
+            return self._fallback(input_str, allowed_list, threshold, abbrv_dict)
+
+        index = self.get_index(allowed_list)
+        abbrv_key, abbrv = self._get_abbrv(abbrv_dict)
+        memo_key = (field, input_str, threshold, abbrv_key, index.serial)
+
+        with self._lock:
+            if memo_key in self._memo:
+                self._memo.move_to_end(memo_key)
+                self._stats['hits'] += 1
+                return self._memo[memo_key]
+            self._stats['misses'] += 1
+
+        result = self._resolve(input_str, index, threshold, abbrv)
+        with self._lock:
+            self._memo[memo_key] = result
+            while self.max_entries is not None and len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return result
+
+    def _fallback(self, input_str, allowed_list, threshold, abbrv_dict):
+        """Unmemoized original path for inputs the index does not handle (non-string values, empty choices)."""
+        if abbrv_dict not in [None, {}]:
+            input_str = abbrv_dict.get(input_str.strip().lower(), input_str)
+
+        closest_match, score = process.extractOne(input_str, allowed_list)
+        if score >= threshold:
+            return closest_match
+        return None
+
+    #--Stats--#
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._list_ids.clear()
+            self._abbrv_ids.clear()
+            self._abbrvs.clear()
+            self._memo.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, 'indexes': len(self._indexes), 'entries': len(self._memo)}
+
+
+_CATEGORY_MATCHER = None
+_CATEGORY_MATCHER_LOCK = threading.Lock()
+
+def get_category_matcher() -> CategoryMatcher:
+    """
+    Process-wide matcher, so memoized corrections carry over across rows, files and sessions.
+    """
+    global _CATEGORY_MATCHER
+    with _CATEGORY_MATCHER_LOCK:
+        if _CATEGORY_MATCHER is None:
+            _CATEGORY_MATCHER = CategoryMatcher()
+        return _CATEGORY_MATCHER
@@ -0,0 +1,229 @@
+import re
+import math
+from array import array
+from typing import Optional, Dict, List, Tuple, Any
+
+
+"""
+Usage:
+  Running totals of one calculator's rows, kept in step with `calculated_emissions` by `add_data`, `add_many`,
+  `remove_data` and `replace_data`. Every change touches only the rows it adds or removes, dashboards read the totals
+  instead of summing a DataFrame of every row.
+
+  Rows are counted per (category, date) cell. Per cell:
+    rows        number of stored rows
+    best        sum of best (lowest data quality) emissions, the values in best_emissions / total_emissions
+    shown       sum of each row's first result, the `emission_result` the dashboards show (see `calculators_2_df`)
+  Totals by category, scope or date roll the cells up, there are far fewer cells than rows.
+
+  Keys are handed out by `next_key` and never reused, so a removed row does not collide with the next one added.
+
+aggregates = EmissionAggregates()
+key = aggregates.next_key()
+aggregates.add(key, uuid='a1', category='S1_MobileCombustion', date='2024-01-31', best=26.9, shown=27.4)
+aggregates.totals(by='scope') >> {1: 27.4}
+aggregates.remove('a1') >> [(0, 26.9)] # (key, best emissions) of the removed rows
+"""
+
+VALUES = ('rows', 'best', 'shown')
+
+
+def category_scope(category: Optional[str]) -> Optional[int]:
+    """Scope of a model name, EG: 'S3C6_1_BusinessTravel' >> 3. Same rule as `calculators_2_df`."""
+    match = re.search(r'S(\d+)', category or '')
+    return int(match.group(1)) if match else None
+
+
+def shown_emissions(calculated_emissions: dict) -> float:
+    """First number of the row's result dict ('emission_result', or 'emission_removals' for S3C15_4), NaN when there is none."""
+    for key in ['emission_result', 'emission_removals']:
+        result = calculated_emissions.get(key)
+        if isinstance(result, dict):
+            for value in result.values():
+                if isinstance(value, (int, float)):
+                    return value
+            return math.nan
+    return math.nan
+
+
+class EmissionAggregates:
+    def __init__(self):
+        self._cell = array('q') # per key: cell code, -1 when removed (or never stored)
+        self._best = array('d') # per key: best emissions, NaN when the row has none
+        self._shown = array('d') # per key: first result, NaN when the row has none
+        self._index: Dict[str, Any] = {} # uuid: key, or list of keys when an upload repeats a uuid
+
+        self.cells: List[list] = [] # per code: [category, date, rows, best, shown]
+        self._codes: Dict[Tuple[Any, Any], int] = {}
+
+    def __repr__(self):
+        return f"<EmissionAggregates: {len(self)} rows, {len(self.cells)} cells>"
+
+    def __len__(self):
+        return sum(cell[2] for cell in self.cells)
+
+    def __contains__(self, uuid):
+        return uuid in self._index
+
+    def next_key(self) -> int:
+        """`calculated_emissions` key for the next row."""
+        return len(self._cell)
+
+    def keys(self, uuid: str) -> List[int]:
+        """`calculated_emissions` keys of the rows of `uuid`."""
+        keys = self._index.get(uuid, [])
+        return keys if isinstance(keys, list) else [keys]
+
+    def uuids(self) -> List[str]:
+        """uuids of the stored rows, in the order they were first added."""
+        return list(self._index)
+
+    #--Changes--#
+    def _code(self, category, date) -> int:
+        code = self._codes.get((category, date))
+        if code is None:
+            code = self._codes[(category, date)] = len(self.cells)
+            self.cells.append([category, date, 0, 0.0, 0.0])
+        return code
+
+    def _count(self, code: int, best: float, shown: float, sign: int):
+        cell = self.cells[code]
+        cell[2] += sign
+        if best == best:
+            cell[3] += sign * best
+        if shown == shown:
+            cell[4] += sign * shown
+
+    def add(self, key: int, uuid: str, category: Optional[str], date: Any, best: Optional[float], shown: Optional[float]):
+        """
+        Count one stored row.
+
+        best, shown:
+          The row's best emissions (None when its metadata is empty, it is then not in best_emissions) and first result.
+        """
+        best = math.nan if best is None else best
+        shown = math.nan if shown is None else shown
+        while len(self._cell) < key:
+            self._cell.append(-1)
+            self._best.append(math.nan)
+            self._shown.append(math.nan)
+
+        code = self._code(category, date)
+        if key == len(self._cell):
+            self._cell.append(code)
+            self._best.append(best)
+            self._shown.append(shown)
+        else:
+            self._cell[key], self._best[key], self._shown[key] = code, best, shown
+        self._count(code, best, shown, 1)
+        self._index_key(uuid, key)
+
+    def _index_key(self, uuid: str, key: int):
+        keys = self._index.get(uuid)
+        if keys is None:
+            self._index[uuid] = key
+        elif isinstance(keys, list):
+            keys.append(key)
+        else:
+            self._index[uuid] = [keys, key]
+
+    def remove(self, uuid: str) -> List[Tuple[int, float]]:
+        """Uncount every row of `uuid`. Returns (key, best emissions) of those rows, best is NaN for rows without."""
+        removed = []
+        keys = self._index.pop(uuid, [])
+        for key in keys if isinstance(keys, list) else [keys]:
+            code = self._cell[key]
+            if code < 0:
+                continue
+            self._count(code, self._best[key], self._shown[key], -1)
+            removed.append((key, self._best[key]))
+            self._cell[key] = -1
+        return removed
+
+    def extend(self, other: 'EmissionAggregates', key_offset: int = 0):
+        """
+        Count the rows of `other`, EG: the aggregates of a row chunk. Its keys are shifted by `key_offset`.
+        Rows are counted one by one, so the sums come out exactly as if they had been added here.
+        """
+        codes = [self._code(category, date) for category, date, _, _, _ in other.cells]
+        while len(self._cell) < key_offset:
+            self._cell.append(-1)
+            self._best.append(math.nan)
+            self._shown.append(math.nan)
+        for code, best, shown in zip(other._cell, other._best, other._shown):
+            code = codes[code] if code >= 0 else -1
+            self._cell.append(code)
+            self._best.append(best)
+            self._shown.append(shown)
+            if code >= 0:
+                self._count(code, best, shown, 1)
+
+        for uuid in other._index:
+            for key in other.keys(uuid):
+                self._index_key(uuid, key + key_offset)
+
+    #--Totals--#
+    def totals(self, by: str = 'category', value: str = 'shown') -> Dict[Any, float]:
+        """
+        by:
+          'category' (model name), 'scope' or 'date'.
+
+        value:
+          'shown' (what the dashboards show), 'best' (what total_emissions adds up) or 'rows'.
+        """
+        column = 2 + VALUES.index(value)
+        totals = {}
+        for cell in self.cells:
+            if not cell[2]:
+                continue
+            category, date = cell[0], cell[1]
+            group = {'category': category, 'scope': category_scope(category), 'date': date}[by]
+            totals[group] = totals.get(group, 0) + cell[column]
+        return totals
+
+    def total(self, value: str = 'shown') -> float:
+        return sum(cell[2 + VALUES.index(value)] for cell in self.cells)
+
+
+#-----
+# Calculators
+#-----
+def next_key(calculator) -> int:
+    """Key for the next row of `calculator`. `len(calculated_emissions)` for calculators without aggregates."""
+    aggregates = getattr(calculator, 'aggregates', None)
+    return aggregates.next_key() if aggregates is not None else len(calculator.calculated_emissions)
+
+
+def remove_rows(calculator, data_uuid: str) -> int:
+    """
+    Remove every row of `data_uuid` from `calculator`: stored results, best_emissions, total_emissions, aggregates and the
+    gas ledger. Only those rows are touched. Returns the number of rows removed.
+    """
+    removed = calculator.aggregates.remove(data_uuid)
+    ledger = getattr(calculator, 'gas_emissions', None)
+    total_emissions = calculator.total_emissions
+    for key, best in removed:
+        del calculator.calculated_emissions[key]
+        if best == best:
+            total_emissions -= best
+        if ledger is not None:
+            ledger.remove(key)
+    calculator.total_emissions = total_emissions
+    if removed:
+        calculator.best_emissions.pop(data_uuid, None)
+    return len(removed)
+
+
+def aggregate_totals(calculators: dict, by: str = 'category', value: str = 'shown') -> Dict[Any, float]:
+    """
+    `EmissionAggregates.totals` over a dict of calculators, EG: state['s1de_calc_results'].
+    Calculators without aggregates are left out.
+    """
+    totals = {}
+    for calculator in calculators.values():
+        aggregates = getattr(calculator, 'aggregates', None)
+        if aggregates is None:
+            continue
+        for group, amount in aggregates.totals(by=by, value=value).items():
+            totals[group] = totals.get(group, 0) + amount
+    return totals
@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import sqlite3
+from contextlib import closing
+from typing import Optional, Any, Tuple
+
+from utils.app_config import CACHE_DIR, FACTOR_DISK_CACHE_ENABLED, FACTOR_DISK_CACHE_TTL, FACTOR_BACKEND
+
+
+"""
+Usage:
+  Persistent cache tier that sits below the in-memory lookup dicts. Survives sessions, reconnects and server restarts.
+  Backed by a single SQLite file in WAL mode, so several streamlit processes can read and write at once without corrupting it.
+
+  Every table carries a version stamp. Entries written under an older version, or older than the TTL, are treated as misses.
+
+dc = FactorDiskCache()
+dc.set('s1sc_liquid', 's1sc_liquid_fuel_type_Diesel', {'fuel_type': 'Diesel', ...})
+dc.get('s1sc_liquid', 's1sc_liquid_fuel_type_Diesel') >> (True, {'fuel_type': 'Diesel', ...})
+dc.invalidate('s1sc_liquid') # bump version, drop entries
+"""
+
+class FactorDiskCache:
+    DB_NAME = 'factor_cache.sqlite3'
+
+    def __init__(self, cache_dir: Optional[str] = None, ttl: Optional[float] = FACTOR_DISK_CACHE_TTL):
+        """
+        cache_dir:
+          Directory holding the sqlite file. Defaults to `CACHE_DIR` in app_config.
+
+        ttl:
+          Seconds before an entry expires. None means entries never expire.
+        """
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.ttl = ttl
+        self.path = os.path.join(self.cache_dir, self.DB_NAME)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                ' tbl TEXT NOT NULL, cache_key TEXT NOT NULL, value TEXT, version INTEGER NOT NULL, created_at REAL NOT NULL,'
+                ' PRIMARY KEY (tbl, cache_key))'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS versions (tbl TEXT PRIMARY KEY, version INTEGER NOT NULL, updated_at REAL NOT NULL)')
+
+    def __repr__(self):
+        return f"<FactorDiskCache: {self.path}, ttl={self.ttl}>"
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    #--Versioning--#
+    def get_version(self, table: str) -> int:
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT version FROM versions WHERE tbl = ?', (table,)).fetchone()
+        return row[0] if row else 0
+
+    def invalidate(self, table: Optional[str] = None):
+        """
+        Bump the version stamp of `table` (or every table when None) and drop its entries.
+        Versions are read inside every get/set, so other processes see the bump immediately.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            if table is None:
+                conn.execute('UPDATE versions SET version = version + 1, updated_at = ?', (now,))
+                conn.execute('DELETE FROM entries')
+            else:
+                conn.execute(
+                    'INSERT INTO versions (tbl, version, updated_at) VALUES (?, 1, ?) '
+                    'ON CONFLICT(tbl) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at',
+                    (table, now)
+                )
+                conn.execute('DELETE FROM entries WHERE tbl = ?', (table,))
+
+    #--Entries--#
+    def get(self, table: str, cache_key: str) -> Tuple[bool, Any]:
+        """
+        Returns (found, value). `found` separates a cached None from a miss.
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                'SELECT e.value, e.version, e.created_at, COALESCE(v.version, 0) FROM entries e '
+                'LEFT JOIN versions v ON v.tbl = e.tbl WHERE e.tbl = ? AND e.cache_key = ?',
+                (table, cache_key)
+            ).fetchone()
+
+        if row is None:
+            return False, None
+
+        value, entry_version, created_at, table_version = row
+        if entry_version != table_version:
+            return False, None
+        if self.ttl is not None and time.time() - created_at > self.ttl:
+            return False, None
+        return True, json.loads(value)
+
+    def set(self, table: str, cache_key: str, value: Any):
+        payload = json.dumps(value, default=str)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries (tbl, cache_key, value, version, created_at) '
+                'VALUES (?, ?, ?, (SELECT COALESCE(MAX(version), 0) FROM versions WHERE tbl = ?), ?)',
+                (table, cache_key, payload, table, time.time())
+            )
+
+    def purge_expired(self):
+        if self.ttl is None:
+            return
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM entries WHERE created_at < ?', (time.time() - self.ttl,))
+
+
+_DISK_CACHE = None
+
+def get_factor_disk_cache() -> Optional[FactorDiskCache]:
+    """
+    Process-wide disk cache configured from app_config. Returns None if disabled or the directory is not writable.
+    The local factor backend already reads from disk, so no second copy is kept for it.
+    """
+    global _DISK_CACHE
+    if not FACTOR_DISK_CACHE_ENABLED or FACTOR_BACKEND == 'local':
+        return None
+    if _DISK_CACHE is None:
+        try:
+            _DISK_CACHE = FactorDiskCache()
+        except (OSError, sqlite3.Error) as e:
+            print(f'Persistent factor cache unavailable, falling back to memory only. Error: {e}')
+            return None
+    return _DISK_CACHE
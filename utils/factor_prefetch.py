@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Dict, Any, Iterable
+
+from utils.app_config import PREFETCH_MAX_WORKERS
+
+
+"""
+Usage:
+  Warm the lookup cache for a whole upload before the calculator walks it row by row.
+  Distinct lookup keys are collected from the validated models, then fetched concurrently with a bounded thread pool.
+  Keys of the same lookup are grouped into one batched `IN` query where the cache has a `*_batch` getter.
+  The per-row loop afterwards only reads from the cache.
+
+requests = collect_lookup_requests(validated_models)
+  >> [('get_fuel_emission_factors', {'fuel_type': 'Diesel'}), ('get_grid_emission_factors', {'table': 's2ie_gef', 'country': 'Malaysia', 'state': None}), ...]
+prefetch_lookups(cache, validated_models) >> {'requested': 4, 'failed': 0} # batched calls
+"""
+
+#-----
+# Keys
+#-----
+VEHICLE_TABLE = 's3c6_travel_factors'
+GRID_TABLE = 's2ie_gef'
+
+# single getter: (batch getter, kwarg of the single getter that is batched, values argument of the batch getter)
+BATCH_METHODS = {
+    'get_fuel_emission_factors': ('get_fuel_emission_factors_batch', 'fuel_type', 'fuel_types'),
+    'get_freight_emission_factors': ('get_freight_emission_factors_batch', 'freight_type', 'freight_types'),
+    'get_vehicle_emission_factors': ('get_vehicle_emission_factors_batch', 'vehicle_type', 'vehicle_types'),
+    'get_waste_emission_factors': ('get_waste_emission_factors_batch', 'waste_type', 'waste_types'),
+    'get_refrigerant_gwp': ('get_refrigerant_gwp_batch', 'refrigerant_type', 'refrigerant_types'),
+}
+
+
+def _has(data, *fields) -> bool:
+    return all(getattr(data, field, None) is not None for field in fields)
+
+
+def get_lookup_requests(data) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Cache calls a calculator would make for `data`, as (method name, kwargs).
+    Mirrors the lookups in the s1/s2/s3 `calc_*` functions, so prefetched keys match the cache keys the row loop asks for.
+    """
+    requests = []
+    if _has(data, 'freight_type'):
+        requests.append(('get_freight_emission_factors', {'freight_type': data.freight_type}))
+
+    if _has(data, 'fuel_type'):
+        requests.append(('get_fuel_emission_factors', {'fuel_type': data.fuel_type}))
+
+    if _has(data, 'vehicle_type'):
+        requests.append(('get_vehicle_emission_factors', {'table': VEHICLE_TABLE, 'vehicle_type': data.vehicle_type}))
+
+    if _has(data, 'waste_type'):
+        if getattr(data, 'waste_treatment_method', None):
+            requests.append(('get_waste_emission_factors', {'waste_type': data.waste_type, 'waste_treatment_method': data.waste_treatment_method}))
+        else:
+            requests.append(('get_waste_emission_factors', {'waste_type': data.waste_type}))
+
+    if _has(data, 'country') and getattr(data, 'grid_emission_factor', None) is None:
+        requests.append(('get_grid_emission_factors', {'table': GRID_TABLE, 'country': data.country, 'state': getattr(data, 'state', None)}))
+
+    if _has(data, 'refrigerant_type'):
+        requests.append(('get_refrigerant_gwp', {'refrigerant_type': data.refrigerant_type}))
+    return requests
+
+
+def collect_lookup_requests(models: Iterable) -> List[Tuple[str, Dict[str, Any]]]:
+    """Distinct lookup requests across all models, in first-seen order."""
+    seen = set()
+    requests = []
+    for data in models:
+        for method, kwargs in get_lookup_requests(data):
+            key = (method, tuple(sorted(kwargs.items())))
+            if key in seen:
+                continue
+            seen.add(key)
+            requests.append((method, kwargs))
+    return requests
+
+
+def group_lookup_requests(cache, requests: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Merge requests that only differ in their batched kwarg into one batch call, EG:
+      ('get_fuel_emission_factors', {'fuel_type': 'Diesel'}), ('get_fuel_emission_factors', {'fuel_type': 'Petrol'})
+      >> ('get_fuel_emission_factors_batch', {'fuel_types': ['Diesel', 'Petrol']})
+    Requests without a batch getter on `cache` are kept as they are.
+    """
+    batches = {}
+    grouped = []
+    for method, kwargs in requests:
+        batch_method, batch_kwarg, values_arg = BATCH_METHODS.get(method, (None, None, None))
+        if batch_method is None or not hasattr(cache, batch_method):
+            grouped.append((method, kwargs))
+            continue
+
+        rest = {k: v for k, v in kwargs.items() if k != batch_kwarg}
+        batch_key = (batch_method, tuple(sorted(rest.items())))
+        if batch_key not in batches:
+            batches[batch_key] = (batch_method, {**rest, values_arg: []})
+            grouped.append(batches[batch_key])
+        batches[batch_key][1][values_arg].append(kwargs[batch_kwarg])
+    return grouped
+
+
+#-----
+# Prefetch
+#-----
+def prefetch_lookups(cache, models: Iterable, max_workers: int = PREFETCH_MAX_WORKERS) -> Dict[str, int]:
+    """
+    Fetch every distinct lookup for `models` into `cache` concurrently.
+    Failures are only counted here; the row loop hits the same lookup again and reports it against the row.
+    """
+    requests = [(method, kwargs) for method, kwargs in collect_lookup_requests(models) if hasattr(cache, method)]
+    if not requests or not max_workers:
+        return {'requested': 0, 'failed': 0}
+    requests = group_lookup_requests(cache, requests)
+
+    def fetch(request):
+        method, kwargs = request
+        try:
+            getattr(cache, method)(**kwargs)
+            return True
+        except Exception as e:
+            print(f'Prefetch failed for {method}({kwargs}). Error: {e}')
+            return False
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(requests))) as executor:
+        results = list(executor.map(fetch, requests))
+
+    stats = {'requested': len(requests), 'failed': results.count(False)}
+    print(f'Prefetched {stats["requested"] - stats["failed"]}/{stats["requested"]} lookup calls')
+    return stats
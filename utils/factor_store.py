@@ -0,0 +1,289 @@
+import os
+from typing import Optional, Dict, List, Any
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utils.app_config import FACTOR_BACKEND, LOCAL_FACTOR_DIRS, LOCAL_FACTOR_EXPORT_DIR, SUPABASE_PREFETCH_PAGES, SUPABASE_LOOKUP_LIMIT
+from utils.utility import supabase_query_in, supabase_query_distinct
+from utils.table_stream import iter_table_pages
+
+
+"""
+Usage:
+  Pluggable source of emission factor rows. Every lookup layer (S3_Lookup_Cache, FactorSnapshot, GeoLocator, legacy caches)
+  asks the store instead of calling supabase directly, so the backend can be swapped without touching the calculators.
+
+  - SupabaseFactorStore: the live supabase project (default).
+  - LocalFactorStore: files on disk. `.arrow` / `.feather` exports are memory mapped (zero-copy), then `.parquet`, then `.csv`.
+
+  Pick the backend with TRACE_FACTOR_BACKEND=local|supabase. Export the live tables once with:
+    python -m utils.factor_store export [out_dir]
+
+store = get_factor_store()
+store.select('s1sc_liquid', fuel_type='Diesel') >> [{'fuel_type': 'Diesel', ...}]
+store.select('s1sc_liquid', columns=['fuel_type']) >> [{'fuel_type': 'Diesel'}, ...] # projection, only these columns are transferred
+store.uniques('s3c5_waste_factors', 'waste_treatment_method', waste_type='Glass') >> ['Landfilled', ...]
+store.select_in('s3c6_travel_factors', 'vehicle_type', ['Bus', 'Taxi']) >> {'Bus': [{...}], 'Taxi': [{...}]}
+"""
+
+#-----
+# Interface
+#-----
+class FactorStore:
+    name = 'base'
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}>"
+
+    def select(self, table: str, limit: Optional[int] = None, columns: Optional[List[str]] = None, **filters) -> List[dict]:
+        """
+        Rows of `table` where every column equals its filter value. None filters are skipped, same as `supabase_query_v2`.
+        columns: only return these columns. None returns every column.
+        """
+        raise NotImplementedError
+
+    def uniques(self, table: str, column: str, **filters) -> List[Any]:
+        """Distinct values of `column`. Only that column is read, not whole rows."""
+        return list(set(row.get(column) for row in self.select(table, limit=None, columns=[column], **filters)))
+
+    def select_in(self, table: str, column: str, values: List[Any], **filters) -> Dict[Any, List[dict]]:
+        """
+        Rows where `column` is any of `values`, grouped by value. Values without rows map to [].
+        """
+        return {value: self.select(table, **{**filters, column: value}) for value in dict.fromkeys(values) if value is not None}
+
+
+#-----
+# Backends
+#-----
+class SupabaseFactorStore(FactorStore):
+    name = 'supabase'
+
+    def select(self, table: str, limit: Optional[int] = None, columns: Optional[List[str]] = None, **filters) -> List[dict]:
+        """Range paged, so the server row cap cannot truncate the result. Filtered lookups are bounded by SUPABASE_LOOKUP_LIMIT."""
+        prefetch = SUPABASE_PREFETCH_PAGES
+        if limit is None and any(value is not None for value in filters.values()): # keyed lookup, a single counted request in practice
+            limit, prefetch = SUPABASE_LOOKUP_LIMIT, 0
+        rows = [row for rows in iter_table_pages(table, prefetch=prefetch, columns=columns, limit=limit, **filters) for row in rows]
+        if limit is not None and len(rows) >= limit:
+            print(f'`{table}` returned {len(rows)} rows, hitting limit={limit}. Results may be truncated.')
+        return rows
+
+    def uniques(self, table: str, column: str, **filters) -> List[Any]:
+        return supabase_query_distinct(table, column, **filters)
+
+    def select_in(self, table: str, column: str, values: List[Any], **filters) -> Dict[Any, List[dict]]:
+        return supabase_query_in(table, column, values, **filters)
+
+
+class LocalFactorStore(FactorStore):
+    name = 'local'
+    EXTENSIONS = ['.arrow', '.feather', '.parquet', '.csv'] # preference order per table
+    KEY_COLUMN = '__select_in_key'
+
+    def __init__(self, data_dirs: Optional[List[str]] = None, fallback: Optional[FactorStore] = None):
+        """
+        data_dirs:
+          Directories searched in order for `<table>.<ext>`. Defaults to LOCAL_FACTOR_DIRS in app_config.
+
+        fallback:
+          Store serving tables without a local file, EG: the live store behind a partial export. None returns no rows.
+        """
+        self.data_dirs = list(data_dirs) if data_dirs is not None else list(LOCAL_FACTOR_DIRS)
+        self.fallback = fallback
+        self._tables: Dict[str, pa.Table] = {}
+
+    def __repr__(self):
+        return f"<LocalFactorStore: {len(self._tables)} tables loaded from {self.data_dirs}>"
+
+    def find(self, table: str) -> Optional[str]:
+        for data_dir in self.data_dirs:
+            for ext in self.EXTENSIONS:
+                path = os.path.join(data_dir, f'{table}{ext}')
+                if os.path.isfile(path):
+                    return path
+        return None
+
+    def available_tables(self) -> List[str]:
+        tables = set()
+        for data_dir in self.data_dirs:
+            if not os.path.isdir(data_dir):
+                continue
+            for fname in os.listdir(data_dir):
+                stem, ext = os.path.splitext(fname)
+                if ext in self.EXTENSIONS:
+                    tables.add(stem)
+        return sorted(tables)
+
+    def _read(self, path: str) -> pa.Table:
+        ext = os.path.splitext(path)[1]
+        if ext in ['.arrow', '.feather']:
+            return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all() # buffers point into the mapped file
+        if ext == '.parquet':
+            import pyarrow.parquet as pq
+            return pq.read_table(path, memory_map=True)
+        import pyarrow.csv as pcsv
+        return pcsv.read_csv(path)
+
+    def table(self, table: str) -> Optional[pa.Table]:
+        if table not in self._tables:
+            path = self.find(table)
+            if path is None:
+                if self.fallback is None:
+                    print(f'No local data found for `{table}`. Searched {self.data_dirs}')
+                return None
+            self._tables[table] = self._read(path)
+        return self._tables[table]
+
+    def _mask(self, data: pa.Table, column: str, value):
+        col = data.column(column)
+        try:
+            return pc.equal(col, pa.scalar(value).cast(col.type))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            return pc.equal(pc.cast(col, pa.string()), str(value)) # EG: id stored as int, filtered with '38'
+
+    def select(self, table: str, limit: Optional[int] = None, columns: Optional[List[str]] = None, **filters) -> List[dict]:
+        data = self.table(table)
+        if data is None:
+            return self.fallback.select(table, limit=limit, columns=columns, **filters) if self.fallback else []
+        return self.select_from(data, limit=limit, columns=columns, **filters)
+
+    def _filter(self, data: pa.Table, **filters) -> Optional[pa.Table]:
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if column not in data.column_names:
+                return None
+            data = data.filter(self._mask(data, column, value))
+        return data
+
+    def select_from(self, data: pa.Table, limit: Optional[int] = None, columns: Optional[List[str]] = None, **filters) -> List[dict]:
+        data = self._filter(data, **filters)
+        if data is None:
+            return []
+
+        if columns:
+            data = data.select([col for col in columns if col in data.column_names])
+        if limit is not None:
+            data = data.slice(0, limit)
+        return data.to_pylist() # only the projected columns are converted to python objects
+
+    def uniques(self, table: str, column: str, **filters) -> List[Any]:
+        data = self.table(table)
+        if data is None and self.fallback is not None:
+            return self.fallback.uniques(table, column, **filters)
+        if data is None or column not in data.column_names:
+            return []
+        data = self._filter(data, **filters)
+        if data is None:
+            return []
+        return pc.unique(data.column(column)).to_pylist()
+
+    def select_in(self, table: str, column: str, values: List[Any], **filters) -> Dict[Any, List[dict]]:
+        values = [value for value in dict.fromkeys(values) if value is not None]
+        grouped = {value: [] for value in values}
+        data = self.table(table)
+        if data is None and self.fallback is not None:
+            return self.fallback.select_in(table, column, values, **filters)
+        if data is None or not values or column not in data.column_names:
+            return grouped
+
+        # rows are matched back to the requested values through the same cast, EG: 1 requested on a float column is 1.0
+        keys = data.column(column)
+        try:
+            value_set = pa.array(values).cast(keys.type)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            keys, value_set = pc.cast(keys, pa.string()), pa.array([str(v) for v in values])
+        mask = pc.is_in(keys, value_set=value_set)
+        data = data.filter(mask).append_column(self.KEY_COLUMN, keys.filter(mask))
+        rows = self.select_from(data, **filters)
+
+        requested = {}
+        for key, value in zip(value_set.to_pylist(), values):
+            requested.setdefault(key, []).append(value)
+        for row in rows:
+            for value in requested.get(row.pop(self.KEY_COLUMN), []):
+                grouped[value].append(row)
+        return grouped
+
+
+#-----
+# Export
+#-----
+def export_factor_tables(out_dir: Optional[str] = None, tables: Optional[List[str]] = None, source: Optional[FactorStore] = None) -> Dict[str, str]:
+    """
+    Dump factor tables from `source` (default: supabase) to uncompressed Arrow IPC files that LocalFactorStore memory maps.
+    Returns {table: path}.
+    """
+    from utils.s3vc_Misc.s3_snapshot import FACTOR_TABLES
+
+    out_dir = out_dir or LOCAL_FACTOR_EXPORT_DIR
+    source = source or SupabaseFactorStore()
+    os.makedirs(out_dir, exist_ok=True)
+
+    paths = {}
+    for table in tables or list(FACTOR_TABLES.keys()):
+        rows = source.select(table, limit=None)
+        if not rows:
+            print(f'Skipping `{table}`, no rows returned.')
+            continue
+
+        path = os.path.join(out_dir, f'{table}.arrow')
+        write_arrow_table(rows, path)
+        print(f'Exported `{table}` ({len(rows)} rows) to {path}')
+        paths[table] = path
+    return paths
+
+
+def write_arrow_table(rows: List[dict], path: str):
+    """
+    Rows as an uncompressed Arrow IPC file that LocalFactorStore memory maps. Written next to `path` and moved in place,
+    so a process mapping the old file keeps reading it. Raises pyarrow errors for columns of mixed types.
+    """
+    data = pa.Table.from_pylist(rows)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, data.schema) as writer:
+            writer.write_table(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+#-----
+# Process-wide store
+#-----
+FACTOR_STORES = {
+    'supabase': SupabaseFactorStore,
+    'local': LocalFactorStore,
+}
+
+_FACTOR_STORE = None
+
+def get_factor_store() -> FactorStore:
+    """
+    Process-wide store for the backend configured in app_config.
+    """
+    global _FACTOR_STORE
+    if _FACTOR_STORE is None:
+        if FACTOR_BACKEND not in FACTOR_STORES:
+            raise ValueError(f'Unknown factor backend `{FACTOR_BACKEND}`. Must be in {list(FACTOR_STORES.keys())}')
+        _FACTOR_STORE = FACTOR_STORES[FACTOR_BACKEND]()
+    return _FACTOR_STORE
+
+
+def set_factor_store(store: FactorStore):
+    """Swap the process-wide store, EG: LocalFactorStore(['/data/bench']) for benchmarks."""
+    global _FACTOR_STORE
+    _FACTOR_STORE = store
+    return store
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1] == 'export':
+        export_factor_tables(sys.argv[2] if len(sys.argv) >= 3 else None)
+    else:
+        print('Usage: python -m utils.factor_store export [out_dir]')
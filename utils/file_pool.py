@@ -0,0 +1,219 @@
+import os
+import shutil
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import Optional, Callable, Iterator, List, Tuple, Any
+
+from utils.app_config import CACHE_DIR, FILE_POOL_MODE, FILE_POOL_MAX_WORKERS, FILE_POOL_PROCESS_MIN_BYTES, ROW_POOL_MAX_WORKERS
+from utils.shared_cache import SharedLookupCache
+
+
+"""
+Usage:
+  Fan independent uploaded files out to a pool. `worker(task, cache, geolocator)` handles ONE file and returns a dict
+  (EG: {'file_name', 'calc', ...}). It must not touch streamlit, the caller merges results into the session.
+
+  'thread': workers share the session lookup cache and geolocator. Only network bound lookups overlap. The default.
+  'process': every worker process builds its own lookup cache on the factor snapshot of the parent, written once to
+             memory mapped Arrow files all workers read (`process_executor`), so CSV parsing, validation and calculation scale with cores. A returned `calc` has its
+             process-local cache detached and the session cache attached again on arrival.
+             Workers are started by a forkserver (spawn where there is none), never forked from the multi-threaded server.
+             Starting them costs seconds, so ONE pool is created on first use and kept for the life of the server, and
+             uploads under FILE_POOL_PROCESS_MIN_BYTES run on threads instead.
+  'serial': plain loop, same as before.
+
+  Results are yielded in completion order with the position of their task. Merge in position order to get the same
+  session state as serial processing.
+
+tasks = [('scope1.csv', b'...'), ('resources/csvs/samples/s3c4.csv', 'resources/csvs/samples/s3c4.csv')]
+for position, result in map_files(process_file, tasks, cache=cache, geolocator=gl):
+  results[position] = result # an exception raised by the worker is yielded in place of its result
+"""
+
+_WORKER = {} # process-local lookup cache and geolocator, set by `_init_worker`
+_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+_PRELOAD = ['utils.file_pool', 'utils.s3vc_Misc.s3_cache', 'utils.file_processing'] # imported once by the forkserver instead of by every worker
+_EXECUTOR = None # see `process_executor`
+_EXECUTOR_LOCK = threading.Lock()
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, 'pool_snapshot') # one subdirectory of Arrow files per server process
+
+
+#-----
+# Worker process
+#-----
+def _init_worker(snapshot_dir: Optional[str]):
+    """Lookups read the shared Arrow files (see `export_snapshot`), tables left out of them go to the factor store."""
+    from utils.s3vc_Misc.s3_cache import S3_Lookup_Cache
+    from utils.factor_store import LocalFactorStore, get_factor_store
+    from utils.factor_disk_cache import get_factor_disk_cache
+    from utils.geolocator import get_shared_geolocator
+
+    disk_cache = get_factor_disk_cache()
+    if snapshot_dir is None:
+        _WORKER['cache'] = S3_Lookup_Cache(cache=SharedLookupCache(), snapshot_mode=True, disk_cache=disk_cache)
+    else:
+        store = LocalFactorStore([snapshot_dir], fallback=get_factor_store())
+        _WORKER['cache'] = S3_Lookup_Cache(cache=SharedLookupCache(), store=store, disk_cache=disk_cache)
+    _WORKER['geolocator'] = get_shared_geolocator()
+
+
+def get_worker() -> Tuple[Any, Any]:
+    """(lookup cache, geolocator) of the current worker process."""
+    return _WORKER['cache'], _WORKER['geolocator']
+
+
+def _run_in_worker(worker: Callable, task):
+    cache, geolocator = get_worker()
+    result = worker(task, cache, geolocator)
+    calc = result.get('calc') if isinstance(result, dict) else None
+    if calc is not None and calc.cache is cache:
+        calc.cache = None # holds locks, cannot be sent back. Reattached to the session cache by `map_files`
+    return result
+
+
+def export_snapshot(cache) -> Optional[str]:
+    """
+    Every snapshot table, bulk fetched once here and written to uncompressed Arrow files in SNAPSHOT_DIR. Workers memory
+    map them, so all processes share one copy of the factor rows instead of holding one each.
+    Returns the directory, None when `cache` has no snapshot. Tables that fail to load or export (EG: a column of mixed
+    types) are left out, workers fetch those from the factor store themselves.
+    """
+    from utils.factor_store import write_arrow_table
+
+    if cache is None or not getattr(cache, 'snapshot_mode', False):
+        return None
+    try:
+        cache.load_snapshot()
+    except Exception as e:
+        print(f'Unable to load the full factor snapshot before fanning out. Error: {e}')
+    records = cache.snapshot.export() if cache.snapshot is not None else {}
+
+    _remove_stale_snapshots()
+    snapshot_dir = os.path.join(SNAPSHOT_DIR, str(os.getpid()))
+    os.makedirs(snapshot_dir, exist_ok=True)
+    for table, rows in records.items():
+        path = os.path.join(snapshot_dir, f'{table}.arrow')
+        try:
+            if not rows:
+                raise ValueError('no rows')
+            write_arrow_table(rows, path)
+        except Exception as e:
+            print(f'Unable to share `{table}` with pool workers. Error: {e}')
+            if os.path.exists(path):
+                os.remove(path)
+    return snapshot_dir
+
+
+def _remove_stale_snapshots():
+    """Drop the Arrow files of server processes that are gone."""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return
+    for name in os.listdir(SNAPSHOT_DIR):
+        if not name.isdigit() or int(name) == os.getpid():
+            continue
+        try:
+            os.kill(int(name), 0)
+        except ProcessLookupError:
+            shutil.rmtree(os.path.join(SNAPSHOT_DIR, name), ignore_errors=True)
+        except OSError: # alive, owned by another user
+            pass
+
+
+def process_executor(cache=None) -> ProcessPoolExecutor:
+    """
+    Process pool whose workers each hold a lookup cache on the shared factor snapshot files. Shared by the file
+    pool and the row-chunk pool, created on first use and reused, so workers and their lookup caches outlive one upload.
+    Never shut it down, a pool broken by a dead worker is replaced on the next call.
+
+    The rows are shared through memory mapped Arrow files, never pickled. Forking the streamlit server, whose other threads may
+    hold locks at that moment, can deadlock the child, so workers come from a single threaded forkserver (or spawn).
+
+    cache:
+      Lookup cache whose snapshot is sent to the workers. Only used when the pool is created. Defaults to the shared one.
+    """
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None or getattr(_EXECUTOR, '_broken', False):
+            if cache is None:
+                from utils.s3vc_Misc.s3_cache import get_shared_s3_cache
+                cache = get_shared_s3_cache()
+            snapshot_dir = export_snapshot(cache)
+            context = multiprocessing.get_context(_START_METHOD)
+            if _START_METHOD == 'forkserver':
+                context.set_forkserver_preload(_PRELOAD)
+            max_workers = max(FILE_POOL_MAX_WORKERS, ROW_POOL_MAX_WORKERS)
+            _EXECUTOR = ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker, initargs=(snapshot_dir,))
+        return _EXECUTOR
+
+
+def task_bytes(task) -> int:
+    """Size of a (file name, path or file bytes) task, 0 when unknown."""
+    source = task[1] if isinstance(task, tuple) and len(task) > 1 else None
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    if isinstance(source, str):
+        try:
+            return os.path.getsize(source)
+        except OSError:
+            return 0
+    return 0
+
+
+def in_worker() -> bool:
+    """True inside a pool worker. Workers never start pools of their own."""
+    return multiprocessing.parent_process() is not None
+
+
+#-----
+# Pool
+#-----
+def map_files(worker: Callable, tasks: List[Any], cache=None, geolocator=None, mode: str = FILE_POOL_MODE, max_workers: Optional[int] = FILE_POOL_MAX_WORKERS) -> Iterator[Tuple[int, Any]]:
+    """
+    Yields (task position, worker result or raised exception) as files complete.
+
+    mode:
+      'process', 'thread' or 'serial'. Single files and `max_workers` <= 1 always run serially.
+      'process' falls back to threads when the files add up to less than FILE_POOL_PROCESS_MIN_BYTES.
+
+    max_workers:
+      Thread pool size, never more than the number of tasks. The shared process pool is sized once, see `process_executor`.
+    """
+    max_workers = min(max_workers or 1, len(tasks))
+    if mode not in ['process', 'thread'] or max_workers <= 1 or in_worker():
+        for position, task in enumerate(tasks):
+            try:
+                yield position, worker(task, cache, geolocator)
+            except Exception as e:
+                yield position, e
+        return
+
+    if mode == 'process' and sum(task_bytes(task) for task in tasks) < FILE_POOL_PROCESS_MIN_BYTES:
+        mode = 'thread'
+    if mode == 'process':
+        executor = process_executor(cache)
+        submit = lambda task: executor.submit(_run_in_worker, worker, task)
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='file_pool')
+        submit = lambda task: executor.submit(worker, task, cache, geolocator)
+
+    futures = {}
+    try:
+        futures = {submit(task): position for position, task in enumerate(tasks)}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                yield futures[future], e
+                continue
+
+            calc = result.get('calc') if isinstance(result, dict) else None
+            if calc is not None and calc.cache is None:
+                calc.cache = cache
+            yield futures[future], result
+    finally:
+        if mode == 'process': # the pool is shared, only drop what is left of this upload
+            for future in futures:
+                future.cancel()
+        else:
+            executor.shutdown()
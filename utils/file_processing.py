@@ -0,0 +1,167 @@
+import io
+import numpy as np
+import pandas as pd
+from functools import partial
+
+from utils.utility import get_dataframe
+from utils.model_inferencer import ModelInferencer
+from utils.model_df_utility import df_to_calculator, calculator_to_df, row_keys, stored_row_uuids
+from utils.upload_cache import get_upload_cache
+
+from utils.s1de_Misc.s1_calculators import S1_Calculator
+from utils.s2ie_Misc.s2_calculators import S2_Calculator
+from utils.s3vc_Misc.s3_calculators import S3_Calculator
+from utils.s3vc_Misc.s3c15_calculators import S3C15_Calculator, create_s3c15_data
+
+from utils.s1de_Misc.s1_creators import *
+from utils.s2ie_Misc.s2_creators import create_s2pp_data
+from utils.s3vc_Misc.s3_creators import *
+
+
+"""
+Usage:
+  Processing of ONE uploaded file, from bytes to calculator. Lives outside the pages so file pool workers import it
+  without streamlit page code (see utils.file_pool, it is preloaded by the forkserver).
+
+result = process_file(('scope1.csv', b'...'), cache, geolocator)
+result >> {'file_name', 'model_name', 'scope', 'calc', 'warning_list', 'invalid_indices', 'df', 'result_df', 'row_keys', 'row_uuids', 'reused'}
+
+  A corrected re-upload only calculates the rows that changed: pass the row keys already calculated in the session,
+  rows with one of them are left out of `calc` and marked in `reused` (see apps.home_page.merge_file_result).
+result = process_file(('scope1.csv', b'...'), cache, geolocator, known_rows={'S1_MobileCombustion': keys})
+"""
+
+all_models = list(ModelInferencer().available_models.keys())
+s1_models = [
+  'S1_FugitiveEmission', 'S1_MobileCombustion', 'S1_StationaryCombustion'
+]
+s2_models = ['S2_PurchasedPower']
+c15_models =[
+  'S3C15_BaseAsset','S3C15_1A_ListedEquity','S3C15_1B_UnlistedEquity','S3C15_1C_CorporateBonds','S3C15_1D_BusinessLoans','S3C15_1E_CommercialRealEstate',
+  'S3C15_2A_Mortgage','S3C15_2B_VehicleLoans',
+  'S3C15_3_ProjectFinance','S3C15_4_EmissionRemovals','S3C15_5_SovereignDebt', 'S3C15_6_ManagedInvestments',
+]
+
+
+#-----
+# File
+#-----
+def process_file(task, cache, gl, known_rows=None) -> dict:
+  """
+  task: (file name, path or file bytes)
+  Parse, infer, create and calculate ONE file. Runs inside the file pool, so it never touches streamlit or the session.
+  Returns {'file_name', 'model_name', 'scope', 'calc', 'warning_list', 'invalid_indices', 'df', 'result_df', 'row_keys', 'row_uuids', 'reused'},
+  or {'error'} when no model matches.
+  A file processed before (same bytes, factor data and code) is restored from the upload cache, see utils.upload_cache.
+
+  known_rows:
+    {model name: array of `row_keys` already calculated in the session}. Rows of the file with one of those keys are not
+    calculated again: `reused` is True for them and `calc`, `result_df` and `row_uuids` hold the other rows only.
+    `reused` is None when every row was calculated.
+  """
+  file_name, source = task
+  if isinstance(source, str):
+    with open(source, 'rb') as f:
+      source = f.read()
+
+  upload_cache = get_upload_cache()
+  cache_key = upload_cache.key(source) if upload_cache is not None else None
+  if cache_key is not None:
+    result = upload_cache.get(cache_key, cache=cache)
+    if result is not None:
+      return {**result, 'file_name': file_name}
+
+  data = pd.read_csv(io.BytesIO(source))
+  if data is None:
+    return None
+
+  modinf = ModelInferencer()
+  df = get_dataframe(data)
+  inferred_model = modinf.infer_model_from_df(df=df)
+  if inferred_model is None:
+    return {'error': f'File "{file_name}" with columns {list(df.columns)} has no reliable matches. Please make sure you are submitting a file that closely resemble the examples.'}
+
+  model_name = inferred_model['model']
+  Model = modinf.available_models[model_name]    
+
+  if model_name in s1_models:
+    scope = 's1de'
+    CREATOR_FUNCTIONS = {
+      'S1_MobileCombustion': partial( create_s1mc_data, Model=Model, cache=cache ),
+      'S1_StationaryCombustion': partial( create_s1sc_data, Model=Model, cache=cache ),
+      'S1_FugitiveEmission': partial( create_s1fe_data, Model=Model, cache=cache ),
+    }
+    calc = S1_Calculator(cache=cache)
+    creator = CREATOR_FUNCTIONS[model_name]  
+
+  elif model_name in s2_models:
+    scope = 's2ie'
+    CREATOR_FUNCTIONS = {
+      'S2_PurchasedPower': partial( create_s2pp_data, Model=Model, cache=cache, geolocator=gl ),
+    }
+    calc = S2_Calculator(cache=cache)
+    creator = CREATOR_FUNCTIONS[model_name]
+
+  # S3 INVESTMENT CATEGORIES
+  elif model_name in c15_models:        
+    scope = 's3vc'
+    calc = S3C15_Calculator()
+    creator = partial(create_s3c15_data, Model=Model) 
+
+  # S3 NORMAL CATEGORIES
+  else:
+    scope = 's3vc'
+    CREATOR_FUNCTIONS = {
+      'S3C1_PurchasedGoods': partial( create_s3c1_data, Model=Model, cache=cache ),
+      'S3C2_CapitalGoods': partial( create_s3c2_data, Model=Model, cache=cache ),
+      'S3C3_EnergyRelated': partial( create_s3c3_data, Model=Model, cache=cache ),
+      'S3C4_UpstreamTransport': partial( create_s3c4_data, Model=Model, cache=cache ),
+      'S3C5_WasteGenerated': partial( create_s3c5_data, Model=Model, cache=cache ),
+      
+      'S3C6_1_BusinessTravel': partial( create_s3c6_1_data, Model=Model, cache=cache ),
+      'S3C6_2_BusinessStay': partial( create_s3c6_2_data, Model=Model, cache=cache ),
+      
+      'S3C7_EmployeeCommute': partial( create_s3c7_data, Model=Model, cache=cache ),
+    
+      'S3C8_1_UpstreamLeasedEstate': partial( create_s3c8_1_data, Model=Model, cache=cache, geolocator=gl ),
+      'S3C8_2_UpstreamLeasedAuto': partial( create_s3c8_2_data, Model=Model, cache=cache ),
+
+      'S3C9_DownstreamTransport':partial( create_s3c9_data, Model=Model, cache=cache ),
+      'S3C10_ProcessingProducts': partial( create_s3c10_data, Model=Model, cache=cache ),
+      'S3C11_UseOfSold': partial( create_s3c11_data, Model=Model, cache=cache ),
+      'S3C12_EOLTreatment': partial( create_s3c12_data, Model=Model, cache=cache ),
+
+      'S3C13_1_DownstreamLeasedEstate': partial( create_s3c13_1_data, Model=Model, cache=cache, geolocator=gl ),
+      'S3C13_2_DownstreamLeasedAuto': partial( create_s3c13_2_data, Model=Model, cache=cache ),             
+      
+      'S3C14_Franchise': partial( create_s3c14_data, Model=Model, cache=cache, geolocator=gl ),
+    }
+    calc = S3_Calculator(cache=cache)
+    creator = CREATOR_FUNCTIONS[model_name]
+
+  keys = row_keys(df)
+  reused = None
+  if known_rows and model_name in known_rows:
+    reused = np.isin(keys, known_rows[model_name])
+    if not reused.any():
+      reused = None
+  calc_df = df[~reused] if reused is not None else df
+
+  calc, warning_list, invalid_indices = df_to_calculator(calc_df, calculator=calc, creator=creator, progress_bar=False, return_invalid_indices=True) 
+  result_df = calculator_to_df(calc)
+  result = {
+    'file_name': file_name,
+    'model_name': model_name,
+    'scope': scope,
+    'calc': calc,
+    'warning_list': warning_list,
+    'invalid_indices': invalid_indices,
+    'df': df,
+    'result_df': result_df,
+    'row_keys': keys,
+    'row_uuids': stored_row_uuids(calc, calc_df, keys[~reused] if reused is not None else keys, invalid_indices),
+    'reused': reused,
+  }
+  if cache_key is not None and reused is None: # a partial result depends on the session
+    upload_cache.set(cache_key, result)
+  return result
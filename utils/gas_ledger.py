@@ -0,0 +1,215 @@
+from array import array
+from bisect import bisect_left
+from typing import Optional, Dict, List, Callable, Any
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from utils.ghg_utils import GWP_DICT, get_gwp_set
+
+
+"""
+Usage:
+  Per gas results of one calculator, kept next to `calculated_emissions` so an inventory can be shown under another GWP set
+  (AR4, AR5, AR6, see `ghg_utils.GWP_SETS`) without running the upload again.
+
+  Every metadata entry of a row with a gas split becomes one ledger entry:
+    kg of CO2, CH4, N2O and refrigerants (by refrigerant type), stored as sparse (entry, gas, kg) triplets
+    fixed co2e: the part of the stored amount no gas accounts for (reported emissions, grid factors, rounding)
+  so that  amount = fixed + sum(kg * default gwp)  and under any other set  co2e = fixed + sum(kg * gwp).
+  Re-weighting is one sparse (entries x gases) matrix x GWP vector product, no per row python. The matrix is packed once
+  after rows were added and reused for every GWP set.
+
+  Rows without a gas split (reported, spend or financed emissions) are not in the ledger, their co2e does not depend on GWPs.
+  Removed rows (`calculator.remove_data`) stay in the arrays and are masked out of every result.
+
+ledger = GasLedger()
+ledger.add(key=0, uuid='a1', metadata=[{'calculation': 'use_based_emissions', 'amount': 26.9, ...}],
+           gases={'use_based_emissions': {'CO2': 26.8, 'CH4': 0.0037, 'N2O': 0.0002}})
+ledger.emissions('AR6') >> array([26.96]) # per entry
+ledger.best('AR6') - ledger.best() >> array([0.06]) # per row, change against the stored best emissions
+"""
+
+class GasLedger:
+    def __init__(self):
+        self.keys = array('q') # `calculated_emissions` key per row
+        self.uuids: List[str] = [] # input uuid per row
+        self._first = array('q') # entry of the row's first method, the value the dashboard shows
+        self._best = array('q') # entry of the row's best (lowest data quality) method, the value in best_emissions
+
+        self._fixed = array('d') # per entry
+        self._entry, self._gas, self._mass = array('q'), array('q'), array('d') # (entry, gas code, kg) triplets
+        self.gases: List[str] = [] # gas per code
+        self._codes: Dict[str, int] = {}
+        self.default_gwp = array('d') # per gas code, the GWP stored amounts were calculated with
+        self._packed = {} # 'all', 'first', 'best': (csr matrix, fixed co2e), dropped whenever rows are added
+        self._removed = set() # positions of removed rows
+
+    def __repr__(self):
+        return f"<GasLedger: {len(self)} rows, {len(self._fixed)} entries, gases {self.gases}>"
+
+    def __len__(self):
+        return len(self.keys) - len(self._removed)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_packed'] = {} # rebuilt on first use, not worth sending between processes
+        return state
+
+    def _code(self, gas: str, default_gwp: Optional[Callable[[str], float]]) -> int:
+        code = self._codes.get(gas)
+        if code is None:
+            gwp = GWP_DICT.get(gas)
+            if gwp is None: # refrigerants carry their own GWP from the factor table
+                gwp = default_gwp(gas) if default_gwp else 0
+            code = self._codes[gas] = len(self.gases)
+            self.gases.append(gas)
+            self.default_gwp.append(gwp)
+        return code
+
+    def add(self, key: int, uuid: str, metadata: List[dict], gases: Dict[str, Dict[str, float]], default_gwp: Optional[Callable[[str], float]] = None):
+        """
+        key, uuid:
+          The row's `calculated_emissions` key and input uuid.
+
+        metadata:
+          The row's metadata entries, as stored.
+
+        gases:
+          {calculation name: {gas: kg}} for the methods that have a gas split, EG: {'use_based_emissions': {'CO2': 26.8, 'CH4': 0.0037}}
+
+        default_gwp:
+          GWP of a gas not in GWP_DICT (refrigerants), EG: `lambda gas: cache.get_refrigerant_gwp(refrigerant_type=gas)['gwp_100']`
+        """
+        if not metadata or not any(gases.values()):
+            return
+
+        self._packed = {}
+        start = len(self._fixed)
+        for position, entry in enumerate(metadata):
+            fixed = entry['amount'] if isinstance(entry['amount'], (int, float)) else np.nan
+            for gas, mass in gases.get(entry['calculation'], {}).items():
+                code = self._code(gas, default_gwp)
+                self._entry.append(start + position)
+                self._gas.append(code)
+                self._mass.append(mass)
+                fixed -= mass * self.default_gwp[code]
+            self._fixed.append(fixed)
+
+        best = min(range(len(metadata)), key=lambda position: metadata[position]['data_quality'])
+        self.keys.append(key)
+        self.uuids.append(uuid)
+        self._first.append(start)
+        self._best.append(start + best)
+
+    def remove(self, key: int) -> bool:
+        """Mask out the row of `key`. Keys are added in increasing order, so it is found by bisection. False when not in the ledger."""
+        position = bisect_left(self.keys, key)
+        if position == len(self.keys) or self.keys[position] != key or position in self._removed:
+            return False
+        self._removed.add(position)
+        return True
+
+    def extend(self, other: 'GasLedger', key_offset: int = 0):
+        """Append the rows of `other`, EG: the ledger of a row chunk. Its keys are shifted by `key_offset`."""
+        self._packed = {}
+        entry_offset = len(self._fixed)
+        self._removed.update(position + len(self.keys) for position in other._removed)
+        codes = np.array([self._code(gas, lambda gas, code=code: other.default_gwp[code]) for code, gas in enumerate(other.gases)] + [0], dtype=np.int64)
+
+        self.keys.frombytes((np.frombuffer(other.keys, dtype=np.int64) + key_offset).tobytes())
+        self.uuids.extend(other.uuids)
+        self._first.frombytes((np.frombuffer(other._first, dtype=np.int64) + entry_offset).tobytes())
+        self._best.frombytes((np.frombuffer(other._best, dtype=np.int64) + entry_offset).tobytes())
+        self._fixed.extend(other._fixed)
+        self._entry.frombytes((np.frombuffer(other._entry, dtype=np.int64) + entry_offset).tobytes())
+        self._gas.frombytes(codes[np.frombuffer(other._gas, dtype=np.int64)].tobytes())
+        self._mass.extend(other._mass)
+
+    def _live(self) -> Optional[np.ndarray]:
+        """Mask of rows not removed, None when nothing was removed."""
+        if not self._removed:
+            return None
+        live = np.ones(len(self.keys), dtype=bool)
+        live[list(self._removed)] = False
+        return live
+
+    def row_keys(self) -> np.ndarray:
+        """`calculated_emissions` key per row, removed rows left out."""
+        keys, live = np.frombuffer(self.keys, dtype=np.int64), self._live()
+        return keys if live is None else keys[live]
+
+    def row_uuids(self) -> List[str]:
+        """Input uuid per row, removed rows left out."""
+        if not self._removed:
+            return self.uuids
+        return [uuid for position, uuid in enumerate(self.uuids) if position not in self._removed]
+
+    def gwp_vector(self, gwp_set: Optional[Any] = None) -> np.ndarray:
+        """
+        GWP per gas code. gwp_set: name in GWP_SETS, a {gas: gwp} dict, or None for 'default'.
+        Gases the set does not list keep their default GWP.
+        """
+        gwp = gwp_set if isinstance(gwp_set, dict) else get_gwp_set(gwp_set)
+        return np.array([gwp.get(gas.upper(), default) for gas, default in zip(self.gases, self.default_gwp)], dtype=float)
+
+    def _pack(self, rows: str) -> tuple:
+        """(matrix, fixed) of all entries, or of the first / best entry of each row."""
+        packed = self._packed.get(rows)
+        if packed is None:
+            if rows == 'all':
+                entry = np.frombuffer(self._entry, dtype=np.int64)
+                gas = np.frombuffer(self._gas, dtype=np.int64)
+                matrix = csr_matrix((np.frombuffer(self._mass, dtype=float), (entry, gas)), shape=(len(self._fixed), len(self.gases)))
+                packed = (matrix, np.frombuffer(self._fixed, dtype=float))
+            else:
+                matrix, fixed = self._pack('all')
+                entries = np.frombuffer(self._first if rows == 'first' else self._best, dtype=np.int64)
+                packed = (matrix[entries], fixed[entries])
+            self._packed[rows] = packed
+        return packed
+
+    def emissions(self, gwp_set: Optional[Any] = None) -> np.ndarray:
+        """co2e of every entry under `gwp_set`."""
+        matrix, fixed = self._pack('all')
+        return fixed + matrix @ self.gwp_vector(gwp_set)
+
+    def _rows(self, values: np.ndarray) -> np.ndarray:
+        live = self._live()
+        return values if live is None else values[live]
+
+    def first(self, gwp_set: Optional[Any] = None) -> np.ndarray:
+        """co2e of each row's first method, aligned with `row_keys()`."""
+        matrix, fixed = self._pack('first')
+        return self._rows(fixed + matrix @ self.gwp_vector(gwp_set))
+
+    def best(self, gwp_set: Optional[Any] = None) -> np.ndarray:
+        """co2e of each row's best method, aligned with `row_uuids()`."""
+        matrix, fixed = self._pack('best')
+        return self._rows(fixed + matrix @ self.gwp_vector(gwp_set))
+
+    def best_delta(self, gwp_set: Optional[Any] = None) -> np.ndarray:
+        """Change of each row's best emissions against the stored (default set) ones."""
+        matrix, _ = self._pack('best')
+        return self._rows(matrix @ (self.gwp_vector(gwp_set) - np.frombuffer(self.default_gwp, dtype=float)))
+
+
+#-----
+# Calculators
+#-----
+def gwp_total_emissions(calculator, gwp_set: Optional[Any] = None) -> float:
+    """`calculator.total_emissions` under another GWP set. Rows without a gas split count as stored."""
+    ledger = getattr(calculator, 'gas_emissions', None)
+    if not gwp_set or ledger is None or not len(ledger):
+        return calculator.total_emissions
+    return calculator.total_emissions + float(ledger.best_delta(gwp_set).sum())
+
+
+def gwp_best_emissions(calculator, gwp_set: Optional[Any] = None) -> Dict[str, float]:
+    """`calculator.best_emissions` under another GWP set."""
+    ledger = getattr(calculator, 'gas_emissions', None)
+    if not gwp_set or ledger is None or not len(ledger):
+        return calculator.best_emissions
+    best_emissions = dict(calculator.best_emissions)
+    best_emissions.update(zip(ledger.row_uuids(), ledger.best(gwp_set).tolist()))
+    return best_emissions
@@ -1,42 +1,236 @@
+import os
+import time
+import pickle
+import threading
 import streamlit as st
 import pandas as pd
 import numpy as np
-from sklearn.neighbors import KDTree
+from sklearn.neighbors import BallTree
+from typing import Dict, Optional
 
-from supabase import create_client
-from utils.utility import supabase_query
+from utils.app_config import CACHE_DIR, FACTOR_DISK_CACHE_TTL, GEO_CACHE_PRECISION, GEO_CACHE_MAX_ENTRIES
+from utils.factor_store import get_factor_store
+from utils.factor_disk_cache import get_factor_disk_cache
+from utils.shared_cache import SharedLookupCache
 
-""" 
-Usage: 
+"""
+Usage:
   Gets back row data of state and country that matched with *approximated* lat lon.
-  Initialize Geolocator before using it. You will build a map from 5k rows from database (query 2s, build 1s) and store it into memory. 
-  This means caching is no longer necessary.
+  Nearest location is found by great-circle (haversine) distance on a BallTree, so it stays correct near the poles
+  and across the antimeridian. Only GEO_COLUMNS are fetched from `locations_states`, not whole rows.
+
+  The tree is built lazily on first lookup, not on construction. Use the process-wide `get_shared_geolocator()` so it is
+  built once per server (or loaded from the pickled index in CACHE_DIR) instead of once per session.
+
+  Coordinates are rounded to GEO_CACHE_PRECISION decimals (4 ~ 11m) before lookup, and results sit in a bounded LRU
+  keyed on the rounded pair. Repeated or nearly identical sites skip the tree query entirely.
 
-gl = Geolocator()
+  For uploads, resolve every coordinate in ONE vectorized tree query with `get_fields_from_latlon_batch`.
+  `prime` does the same and keeps the results in the LRU, so per-row `get_fields_from_latlon` calls (EG: in the creators) become cache hits.
+  Pool workers do not share the LRU: send them `cached_fields` of their rows and `seed` their own geolocator with it.
+
+gl = get_shared_geolocator()
 location_row = gl.get_fields_from_latlon(1, 3)
+gl.get_fields_from_latlon_batch(df['lat'], df['lon']) >> {'state_name': array([...]), 'country_name': array([...]), ...} # aligned with input, None where lat/lon missing
+gl.prime(df['lat'], df['lon'])
+gl.get_stats() >> {'hits': 9120, 'misses': 31, 'hit_rate': 0.9966, 'entries': 31, ...}
 """
 
+GEO_TABLE = 'locations_states'
+GEO_COLUMNS = ['state_name', 'country_name', 'lat', 'lon']
+
 class GeoLocator:
-    def __init__(self, df=None): 
-        if df is None:
-            print('Building KDTree...')
-            try:
-                supabase_url= st.secrets['supabase_url']
-                supabase_anon_key= st.secrets['supabase_anon_key']
-                supabase = create_client(supabase_url, supabase_anon_key)
-
-                TABLE = 'locations_states'
-                data = pd.DataFrame(supabase_query(TABLE, supabase_url, supabase_anon_key))
-                self.df = data[ data['lat'].notna() & data['lon'].notna() ]
-            except Exception as e:
-                raise e
-            
+    INDEX_FORMAT = 1 # bump when the pickled index layout changes
+    CACHE_TABLE = GEO_TABLE # stats label in the LRU
+
+    def __init__(self, df=None, index_path: Optional[str] = None, precision: int = GEO_CACHE_PRECISION, max_entries: Optional[int] = GEO_CACHE_MAX_ENTRIES):
+        """
+        df:
+          Optional reference rows with `lat`, `lon` columns. Defaults to `locations_states` from the factor store.
+
+        index_path:
+          Pickled tree + columns, reused across restarts while `locations_states` is unchanged in the disk cache.
+          Only used when `df` is None and the factor disk cache is enabled.
+
+        precision:
+          Decimals lat/lon are rounded to before lookup and caching.
+
+        max_entries:
+          Rounded coordinates kept in the LRU.
+        """
+        self._source_df = df
+        self.index_path = index_path
+        self._tree = None
+        self.columns = {}
+        self.precision = precision
+        self.cache = SharedLookupCache(max_entries=max_entries, ttl=None) # (rounded lat, rounded lon): record
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return f"<GeoLocator: {'built' if self._tree is not None else 'not built'}, {len(self.cache)} cached coordinates>"
+
+    #--Index--#
+    @property
+    def tree(self) -> BallTree:
+        if self._tree is None:
+            with self._lock:
+                if self._tree is None:
+                    self._build()
+        return self._tree
+
+    def _build(self):
+        if self._source_df is None and self._load_index():
+            return
+
+        if self._source_df is None:
+            print('Building BallTree...')
+            data = pd.DataFrame(get_factor_store().select(GEO_TABLE, limit=None, columns=GEO_COLUMNS))
         else:
-            self.df = df[ df['lat'].notna() & df['lon'].notna() ]
-        self.kdtree = KDTree(self.df[['lat', 'lon']])
-        
+            data = self._source_df
+        df = data[ data['lat'].notna() & data['lon'].notna() ]
+
+        self.columns = {col: df[col].to_numpy() for col in df.columns} # columnar copy, no per-row pandas access
+        self._tree = BallTree(np.radians(df[['lat', 'lon']].to_numpy(dtype=float)), metric='haversine')
+        if self._source_df is None:
+            self._save_index()
+
+    def _index_version(self):
+        disk_cache = get_factor_disk_cache()
+        if disk_cache is None or self.index_path is None:
+            return None
+        return (self.INDEX_FORMAT, disk_cache.get_version(GEO_TABLE))
+
+    def _load_index(self) -> bool:
+        version = self._index_version()
+        if version is None or not os.path.isfile(self.index_path):
+            return False
+        if time.time() - os.path.getmtime(self.index_path) > FACTOR_DISK_CACHE_TTL:
+            return False
+
+        try:
+            with open(self.index_path, 'rb') as f:
+                saved = pickle.load(f)
+        except Exception as e:
+            print(f'Unable to load geolocator index from {self.index_path}. Error: {e}')
+            return False
+        if saved.get('version') != version:
+            return False
+
+        self.columns, self._tree = saved['columns'], saved['tree']
+        print(f'Loaded BallTree from {self.index_path}')
+        return True
+
+    def _save_index(self):
+        version = self._index_version()
+        if version is None:
+            return
+        try:
+            tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'version': version, 'columns': self.columns, 'tree': self._tree}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.index_path) # atomic, other processes never read a half written file
+        except OSError as e:
+            print(f'Unable to save geolocator index to {self.index_path}. Error: {e}')
+
+    #--Lookup--#
+    def _record(self, nearest_index) -> dict:
+        return {col: values[nearest_index] for col, values in self.columns.items()}
+
+    def quantize(self, lat, lon):
+        return round(float(lat), self.precision), round(float(lon), self.precision)
+
+    def quantize_array(self, values: np.ndarray) -> np.ndarray:
+        """`quantize` for an array of one coordinate. Python `round` per value, np.round rounds differently on some halfway values."""
+        return np.array([round(value, self.precision) for value in values.tolist()], dtype=float)
+
     def get_fields_from_latlon(self, lat, lon):
-        distance, indices = self.kdtree.query( np.array([[lat, lon]]), k=1 )
+        key = self.quantize(lat, lon)
+        found, record = self.cache.lookup(key, table=self.CACHE_TABLE)
+        if found:
+            return record
+
+        tree = self.tree
+        distance, indices = tree.query( np.radians(np.array([key], dtype=float)), k=1 )
         nearest_index = indices[0][0]
-        record = self.df.iloc[nearest_index].to_dict()
-        return record
\ No newline at end of file
+        record = self._record(nearest_index)
+        self.cache.set(key, record, table=self.CACHE_TABLE)
+        return record
+
+    def get_fields_from_latlon_batch(self, lats, lons) -> Dict[str, np.ndarray]:
+        """
+        Vectorized `get_fields_from_latlon`. One tree query for every coordinate pair.
+        Returns {column: array} aligned with the input. Rows with a missing or non numeric lat/lon get None in every column.
+        """
+        lats = pd.to_numeric(pd.Series(lats, dtype=object), errors='coerce').to_numpy(dtype=float)
+        lons = pd.to_numeric(pd.Series(lons, dtype=object), errors='coerce').to_numpy(dtype=float)
+        valid = ~(np.isnan(lats) | np.isnan(lons))
+        lats, lons = self.quantize_array(lats), self.quantize_array(lons) # same points as the single lookup
+
+        tree = self.tree
+        fields = {col: np.full(len(lats), None, dtype=object) for col in self.columns}
+        if valid.any():
+            distance, indices = tree.query( np.radians(np.column_stack([lats[valid], lons[valid]])), k=1 )
+            nearest = indices[:, 0]
+            for col, values in self.columns.items():
+                fields[col][valid] = values[nearest]
+        return fields
+
+    def prime(self, lats, lons) -> int:
+        """
+        Resolve every rounded coordinate of an upload that is not cached yet, in one `get_fields_from_latlon_batch` call.
+        Returns the number of coordinates resolved.
+        """
+        pairs = set()
+        for lat, lon in zip(lats, lons):
+            try:
+                key = self.quantize(lat, lon)
+            except (TypeError, ValueError):
+                continue
+            if not (np.isnan(key[0]) or np.isnan(key[1])) and key not in self.cache:
+                pairs.add(key)
+        if not pairs:
+            return 0
+
+        pairs = list(pairs)
+        fields = self.get_fields_from_latlon_batch([lat for lat, _ in pairs], [lon for _, lon in pairs])
+        for i, key in enumerate(pairs):
+            self.cache.set(key, {col: values[i] for col, values in fields.items()}, table=self.CACHE_TABLE)
+        return len(pairs)
+
+    def cached_fields(self, lats, lons) -> Dict[tuple, dict]:
+        """{rounded pair: record} of the coordinates already resolved here, EG: by `prime`, to `seed` a pool worker with."""
+        records = {}
+        for lat, lon in zip(lats, lons):
+            try:
+                key = self.quantize(lat, lon)
+            except (TypeError, ValueError):
+                continue
+            if key in records:
+                continue
+            found, record = self.cache.lookup(key, table=self.CACHE_TABLE)
+            if found:
+                records[key] = record
+        return records
+
+    def seed(self, records: Dict[tuple, dict]) -> int:
+        """Cache records from `cached_fields` of another process, so their coordinates never need the tree here."""
+        for key, record in records.items():
+            self.cache.set(key, record, table=self.CACHE_TABLE)
+        return len(records)
+
+    def get_stats(self) -> dict:
+        return self.cache.get_stats()['total']
+
+
+_SHARED_GEOLOCATOR = None
+_SHARED_GEOLOCATOR_LOCK = threading.Lock()
+
+def get_shared_geolocator() -> GeoLocator:
+    """
+    Process-wide GeoLocator. Cheap to call: the tree is only built (or loaded from disk) on the first lookup.
+    """
+    global _SHARED_GEOLOCATOR
+    with _SHARED_GEOLOCATOR_LOCK:
+        if _SHARED_GEOLOCATOR is None:
+            _SHARED_GEOLOCATOR = GeoLocator(index_path=os.path.join(CACHE_DIR, 'geolocator_index.pkl'))
+        return _SHARED_GEOLOCATOR
@@ -1,4 +1,6 @@
 import re
+from functools import lru_cache
+from typing import Optional, Dict, List, Tuple, Any, NamedTuple
 
 #--- Lookup ---#
 GWP_DICT = {
@@ -7,7 +9,108 @@ GWP_DICT = {
     'N2O': 198
 }
 
+# GWP100 vintages. Refrigerants by ASHRAE number (upper case); refrigerants a set does not list keep the factor table's `gwp_100`
+GWP_SETS = {
+    'default': GWP_DICT, # what every calculation uses, stored results are in this set
+    'AR4': {'CO2': 1, 'CH4': 25, 'N2O': 298, 'R-22': 1810, 'R-32': 675, 'R-125': 3500, 'R-134A': 1430, 'R-404A': 3922, 'R-407C': 1774, 'R-410A': 2088},
+    'AR5': {'CO2': 1, 'CH4': 28, 'N2O': 265, 'R-22': 1760, 'R-32': 677, 'R-125': 3170, 'R-134A': 1300, 'R-404A': 3943, 'R-407C': 1624, 'R-410A': 1924},
+    'AR6': {'CO2': 1, 'CH4': 27.9, 'N2O': 273, 'R-22': 1960, 'R-32': 771, 'R-125': 3740, 'R-134A': 1530, 'R-404A': 4728, 'R-407C': 1908, 'R-410A': 2256},
+}
+
+
+CHEMICALS = ['co2', 'ch4', 'n2o'] # expand when needed
+GAS_PATTERN = re.compile(r'(?i)(CO2|CH4|N2O)')
+UNIT_PATTERN = re.compile(r'_(\w+)$')
+
+# WARNING: hard coded multipliers
+# work around for n2o, ch4 represented as g not kg in db
+MASS_MULTIPLIERS = {'N2O': 1e-3, 'CH4': 1e-3}
+
+
+"""
+Usage:
+  Factor records of one table always have the same columns, EG: {'fuel_type', 'kgCO2_litre', 'gCH4_litre', 'gN2O_litre', ...}.
+  `factor_schema` parses a column layout ONCE into (gas, unit, kg multiplier) per column, and remembers which columns
+  `get_relevant_factors` picks for each unit. No regex runs per row.
+
+  `co2e_coefficient` folds the gas terms of a record into one co2e per unit value, cached on the record's values,
+  so `calculate_co2e` is a single multiply. The vectorized engine multiplies whole columns by the same coefficients.
+
+schema = factor_schema(tuple(factors))
+schema.columns['gCH4_litre'] >> FactorColumn(key='gCH4_litre', gas='CH4', unit='litre', mass_multiplier=0.001)
+get_co2e_per_unit(factors, unit='litre', unit_of_interest='litre') >> 2.6987 # kgCO2e per litre
+
+  `calculate_gases` splits the same calculation into kg per gas, so a result can be re-weighted under another GWP set
+  (`GWP_SETS`, `register_gwp_set`) without recalculating. See utils.gas_ledger.
+
+calculate_gases(relevant_factors, unit_value=10, unit_of_interest='litre') >> {'CO2': 26.8, 'CH4': 0.0037, 'N2O': 0.00021}
+"""
+
+#-----
+# Factor schema
+#-----
+class FactorColumn(NamedTuple):
+    key: str
+    gas: Optional[str] # first of CO2, CH4, N2O in the column name, upper case
+    unit: Optional[str] # everything after the first underscore, EG: 'litre', 'unit', 'per_kwh'
+    mass_multiplier: float # to kg
+
+
+class FactorSchema:
+    def __init__(self, keys: Tuple[str, ...]):
+        """
+        keys:
+          Column names of a factor record (or of a `get_relevant_factors` result), in record order.
+        """
+        self.keys = keys
+        self.columns: Dict[str, FactorColumn] = {key: self._parse(key) for key in keys}
+        self._relevant: Dict[Any, Tuple[str, ...]] = {} # unit: relevant keys
+        self._terms: Dict[tuple, list] = {} # (unit_of_interest, gwp items): [(key, mass_multiplier, gwp_value)]
+
+    def __repr__(self):
+        return f"<FactorSchema: {len(self.keys)} columns, {sum(1 for c in self.columns.values() if c.gas)} gas columns>"
+
+    @staticmethod
+    def _parse(key) -> FactorColumn:
+        if not isinstance(key, str):
+            return FactorColumn(key, None, None, 1)
+        gas_match, unit_match = GAS_PATTERN.search(key), UNIT_PATTERN.search(key)
+        gas = gas_match.group(0).upper() if gas_match else None
+        return FactorColumn(key, gas, unit_match.group(1) if unit_match else None, MASS_MULTIPLIERS.get(gas, 1))
+
+    def relevant_keys(self, unit) -> Tuple[str, ...]:
+        """Keys `get_relevant_factors` returns for `unit`: the unit suffix (a regex, case insensitive) plus any chemical."""
+        keys = self._relevant.get(unit)
+        if keys is None:
+            pattern = re.compile(f'_{unit}', re.IGNORECASE)
+            keys = self._relevant[unit] = tuple(
+                key for key in self.keys
+                if pattern.search(key) and any(chem in key.lower() for chem in CHEMICALS)
+            )
+        return keys
 
+    def terms(self, unit_of_interest: Optional[str], gwp: dict) -> List[Tuple[str, float, float]]:
+        """(key, mass_multiplier, gwp_value) of every gas column `get_co2e_terms` uses, in key order."""
+        cache_key = (unit_of_interest, tuple(sorted(gwp.items())))
+        terms = self._terms.get(cache_key)
+        if terms is None:
+            terms = self._terms[cache_key] = [
+                (column.key, column.mass_multiplier, gwp.get(column.gas, 1)) # Default to 1 if not found
+                for column in self.columns.values()
+                if column.gas and column.unit and (not unit_of_interest or column.unit == unit_of_interest)
+            ]
+        return terms
+
+
+@lru_cache(maxsize=1024)
+def factor_schema(keys: Tuple[str, ...]) -> FactorSchema:
+    """Schema shared by every record with this column layout."""
+    return FactorSchema(keys)
+
+
+#-----
+# Lookup
+#-----
 def get_relevant_factors(factors, unit:str):
     """
     factors:
@@ -19,26 +122,64 @@ def get_relevant_factors(factors, unit:str):
         key value pair for each chemical and factor value
     """
     try:
-        relevant_factors = {}
-        chemicals = ['co2', 'ch4', 'n2o'] # expand when needed
-
-        # Retrieve all columns with the specified fuel_unit in it
-        for key, value in factors.items():
-            if re.search(f'_{unit}', key, re.IGNORECASE):
-
-                # Retrieve all remaining columns containing chemicals
-                for chem in chemicals:
-                    if re.search(chem, key, re.IGNORECASE):
-                        chemical_name = key
-                        relevant_factors[chemical_name] = value
-                        break           
-        return relevant_factors
+        # Columns with the unit suffix and a chemical, resolved once per table layout
+        return {key: factors[key] for key in factor_schema(tuple(factors)).relevant_keys(unit)}
     
     except Exception as e:
         print(f"Unable to retrive relevant factors from {factors}. Error: {e}")
         return {}
 
 
+def get_co2e_terms(relevant_factors:dict, unit_of_interest:str=None, gwp:dict=None):
+    """ 
+    The per gas terms `calculate_co2e` sums, as [(factor, mass_multiplier, gwp_value), ...] in `relevant_factors` order.
+    Column names are parsed once per layout, see `FactorSchema`. Non numeric factors are skipped.
+    """
+    # use default GWP table if not provided
+    if not gwp:
+        gwp = GWP_DICT
+
+    schema = factor_schema(tuple(relevant_factors))
+    return [
+        (relevant_factors[key], mass_multiplier, gwp_value)
+        for key, mass_multiplier, gwp_value in schema.terms(unit_of_interest, gwp)
+        if isinstance(relevant_factors[key], (int, float))
+    ]
+
+
+@lru_cache(maxsize=65536)
+def _coefficient(keys: tuple, values: tuple, unit_of_interest, gwp_items: tuple) -> Optional[float]:
+    relevant_factors = dict(zip(keys, values))
+    terms = get_co2e_terms(relevant_factors, unit_of_interest=unit_of_interest, gwp=dict(gwp_items))
+    if not terms:
+        return None
+
+    coefficient = 0
+    for factor, mass_multiplier, gwp_value in terms:
+        coefficient += factor * mass_multiplier * gwp_value
+    return coefficient
+
+
+def co2e_coefficient(relevant_factors:dict, unit_of_interest:str=None, gwp:dict=None) -> Optional[float]:
+    """ 
+    kgCO2e per unit value: sum(factor * mass_multiplier * gwp_value) over the gas terms. None when no term applies.
+    Cached on the factor values, so each factor record is folded once per unit.
+    """
+    gwp_items = tuple(sorted((gwp or GWP_DICT).items()))
+    try:
+        return _coefficient(tuple(relevant_factors), tuple(relevant_factors.values()), unit_of_interest, gwp_items)
+    except TypeError: # unhashable factor value, nothing to cache on
+        return _coefficient.__wrapped__(tuple(relevant_factors), tuple(relevant_factors.values()), unit_of_interest, gwp_items)
+
+
+def get_co2e_per_unit(factors, unit:str, unit_of_interest:str=None, gwp:dict=None) -> Optional[float]:
+    """`co2e_coefficient` of a whole factor record, for the columns `get_relevant_factors(factors, unit)` picks."""
+    relevant_factors = get_relevant_factors(factors, unit=unit)
+    if not relevant_factors:
+        return None
+    return co2e_coefficient(relevant_factors, unit_of_interest=unit_of_interest, gwp=gwp)
+
+
 def calculate_co2e(relevant_factors:dict, unit_value:float, unit_of_interest:str=None, gwp:dict=None):
     """ 
     Input Parameters
@@ -59,46 +200,73 @@ def calculate_co2e(relevant_factors:dict, unit_value:float, unit_of_interest:str
     """
     total_co2e = 0
     
-    # use default GWP table if not provided
-    if not gwp:
-        gwp = GWP_DICT
-        
     if not relevant_factors:
         print('Unable to calculate co2e, no relevant factors provided')
         return total_co2e
     
-    for full_key, factor in relevant_factors.items():
-        if not isinstance(factor, (int, float)):
-            continue
-
-        # Match fields with chemical
-        chemical_match = re.search(r'(?i)(CO2|CH4|N2O)', full_key)
-        if not chemical_match:
-            continue
-            
-        # Match remainder fields with unit
-        unit_match = re.search(r'_(\w+)$', full_key)
-        if not unit_match:
-            continue  
-            
-        # Check if the unit matches the unit of interest
-        if unit_of_interest and unit_match.group(1) != unit_of_interest:
-            continue
-
-        ghg_type = chemical_match.group(0).upper()
-        gwp_value = gwp.get(ghg_type, 1)  # Default to 1 if not found
-        
-        # WARNING: hard coded multipliers
-        # work around for n2o, ch4 represented as g not kg in db
-        if ghg_type in ['N2O', 'CH4']:
-            mass_multiplier = 1e-3
-        else:
-            mass_multiplier = 1
-
-        # Calculate the emission value
-        emission_value = unit_value * factor * mass_multiplier
-        total_co2e += emission_value * gwp_value
-
-    return total_co2e
+    coefficient = co2e_coefficient(relevant_factors, unit_of_interest=unit_of_interest, gwp=gwp)
+    if coefficient is None:
+        return total_co2e
+
+    return unit_value * coefficient
+
+
+#-----
+# Per gas
+#-----
+@lru_cache(maxsize=65536)
+def _gas_coefficients(keys: tuple, values: tuple, unit_of_interest) -> Tuple[Tuple[str, float], ...]:
+    relevant_factors = dict(zip(keys, values))
+    schema = factor_schema(keys)
+    coefficients = {}
+    for key, mass_multiplier, _ in schema.terms(unit_of_interest, GWP_DICT):
+        factor = relevant_factors[key]
+        if isinstance(factor, (int, float)):
+            gas = schema.columns[key].gas
+            coefficients[gas] = coefficients.get(gas, 0) + factor * mass_multiplier
+    return tuple(coefficients.items())
+
+
+def gas_coefficients(relevant_factors:dict, unit_of_interest:str=None) -> Dict[str, float]:
+    """kg of each gas per unit value, the terms of `co2e_coefficient` before GWP weighting."""
+    if not relevant_factors:
+        return {}
+    try:
+        return dict(_gas_coefficients(tuple(relevant_factors), tuple(relevant_factors.values()), unit_of_interest))
+    except TypeError: # unhashable factor value, nothing to cache on
+        return dict(_gas_coefficients.__wrapped__(tuple(relevant_factors), tuple(relevant_factors.values()), unit_of_interest))
+
+
+def calculate_gases(relevant_factors:dict, unit_value:float, unit_of_interest:str=None) -> Dict[str, float]:
+    """
+    `calculate_co2e` split per gas: {gas: kg}. Empty where `calculate_co2e` returns 0 for lack of factors.
+    sum(kg * GWP_DICT[gas]) is the co2e `calculate_co2e` returns, up to float rounding.
+    """
+    return {gas: unit_value * coefficient for gas, coefficient in gas_coefficients(relevant_factors, unit_of_interest=unit_of_interest).items()}
+
+
+def add_gases(*gases: Dict[str, float]) -> Dict[str, float]:
+    """Sum of per gas dicts, EG: fuel + refrigerant of one physical emissions method."""
+    total = {}
+    for item in gases:
+        for gas, mass in item.items():
+            total[gas] = total.get(gas, 0) + mass
+    return total
+
+
+def register_gwp_set(name: str, gwp: Dict[str, float]):
+    """
+    Add or replace a GWP set. Gas names are upper cased: 'CO2', 'CH4', 'N2O' and refrigerant ASHRAE numbers.
+    'default' cannot be replaced, stored results are calculated with it.
+    """
+    if name == 'default':
+        raise ValueError("GWP set 'default' is the one results are calculated with and cannot be replaced.")
+    GWP_SETS[name] = {str(gas).upper(): value for gas, value in gwp.items()}
 
 
+def get_gwp_set(name: Optional[str] = None) -> Dict[str, float]:
+    if not name:
+        return GWP_SETS['default']
+    if name not in GWP_SETS:
+        raise KeyError(f'Unknown GWP set {name}. Available: {list(GWP_SETS)}')
+    return GWP_SETS[name]
@@ -4,9 +4,184 @@ import numpy as np
 import re
 import json
 import traceback
+from functools import partial
+from itertools import islice
+from concurrent.futures import as_completed
+from typing import List, Tuple, Optional, Annotated
 
+from pydantic import BaseModel, TypeAdapter, WrapValidator
 
-def df_to_calculator(df:pd.DataFrame, calculator, creator, progress_bar=True, return_invalid_indices=False):
+from utils.app_config import INGEST_BATCH_SIZE, ROW_POOL_MAX_WORKERS, ROW_CHUNK_SIZE
+from utils.factor_prefetch import prefetch_lookups
+from utils.file_pool import process_executor, get_worker, in_worker
+from utils.emission_aggregates import next_key
+
+
+#-----
+# Ingestion
+#-----
+PLACEHOLDERS = {'<Blank>', '<To fill>'} # template cells that mean "no value"
+_ADAPTERS = {} # Model: TypeAdapter over a list of Model, schema is built once per model
+
+
+def _clean(value):
+  if value is None or value is pd.NaT or value is pd.NA:
+    return None
+  if isinstance(value, str):
+    return None if value in PLACEHOLDERS else value
+  if isinstance(value, float) and value != value: # NaN
+    return None
+  return value
+
+
+def iter_records(df:pd.DataFrame):
+  """ 
+  (index, row dict) for every row of `df`, with placeholders and NaN turned into None in the same pass.
+  Plain dicts from `itertuples`, no per row Series and no full copies of `df`.
+  """
+  columns = list(df.columns)
+  for idx, values in zip(df.index, df.itertuples(index=False, name=None)):
+    yield idx, {col: _clean(value) for col, value in zip(columns, values)}
+
+
+def _collect_row(**row):
+  """Stand-in `Model` for creators. Returns the corrected row instead of the model, so rows can be validated in batches."""
+  return row
+
+
+class _RowError:
+  """Placeholder for a row that failed inside a batch validation."""
+  __slots__ = ['error']
+
+  def __init__(self, error):
+    self.error = error
+
+
+def _capture_row_error(value, handler):
+  try:
+    return handler(value)
+  except Exception as e: # one bad row must not fail the whole batch
+    return _RowError(e)
+
+
+def _get_adapter(Model) -> TypeAdapter:
+  adapter = _ADAPTERS.get(Model)
+  if adapter is None:
+    adapter = _ADAPTERS[Model] = TypeAdapter(List[Annotated[Model, WrapValidator(_capture_row_error)]])
+  return adapter
+
+
+def validate_batch(Model, rows:List[dict]) -> List[Tuple[Optional[BaseModel], Optional[Exception]]]:
+  """ 
+  Build `Model` for every row dict in one `TypeAdapter` pass. Returns (model, None) or (None, exception) per row.
+  Rows that fail are built again with `Model(**row)`, so their exception reads exactly like a single row error.
+  """
+  results = []
+  for row, data in zip(rows, _get_adapter(Model).validate_python([dict(row) for row in rows])):
+    if not isinstance(data, _RowError):
+      results.append((data, None))
+      continue
+    try:
+      results.append((Model(**row), None))
+    except Exception as e:
+      results.append((None, e))
+  return results
+
+
+#-----
+# Chunks
+#-----
+WORKER_KEYWORDS = ['cache', 'geolocator'] # creator keywords replaced by the worker's own read-only copies
+
+
+def _calculate_chunk(df_chunk:pd.DataFrame, calculator_cls, shared_cache:bool, creator_func, creator_keywords:dict, worker_keywords:List[str], prefetch:bool, geo_fields:dict):
+  """
+  Runs in a pool worker. Plain `df_to_calculator` on one chunk, returns what `_merge_chunk` needs.
+  geo_fields: the chunk's coordinates resolved by the parent (`GeoLocator.cached_fields`), so the worker never builds its own tree.
+  """
+  cache, geolocator = get_worker()
+  if geo_fields:
+    geolocator.seed(geo_fields)
+  own = {'cache': cache, 'geolocator': geolocator}
+  creator = partial(creator_func, **creator_keywords, **{k: own[k] for k in worker_keywords})
+  calculator = calculator_cls(cache=cache) if shared_cache else calculator_cls()
+
+  calculator, warning_list, invalid_indices = df_to_calculator(df_chunk, calculator, creator, progress_bar=False, return_invalid_indices=True, prefetch=prefetch, workers=1)
+  return (
+    calculator.calculated_emissions, calculator.best_emissions, warning_list, invalid_indices, # a ResultStore pickles as columns
+    getattr(calculator, 'gas_emissions', None), getattr(calculator, 'aggregates', None),
+  )
+
+
+def _merge_chunk(calculator, chunk_result):
+  """Append one chunk to `calculator` the way `add_data` would have: same keys, same summation order for the total."""
+  entries, best_emissions, _, _, gas_emissions, aggregates = chunk_result
+  key_offset = next_key(calculator)
+  if gas_emissions is not None and getattr(calculator, 'gas_emissions', None) is not None:
+    calculator.gas_emissions.extend(gas_emissions, key_offset=key_offset)
+  if aggregates is not None and getattr(calculator, 'aggregates', None) is not None:
+    calculator.aggregates.extend(aggregates, key_offset=key_offset)
+  for key, entry in entries.items():
+    calculator.calculated_emissions[key_offset + key] = entry
+  total_emissions = calculator.total_emissions
+  for data_uuid, emissions in best_emissions.items():
+    calculator.best_emissions[data_uuid] = emissions
+    total_emissions += emissions
+  calculator.total_emissions = total_emissions
+
+
+def df_to_calculator_chunked(df:pd.DataFrame, calculator, creator, progress_bar=True, return_invalid_indices=False, prefetch=True, workers=ROW_POOL_MAX_WORKERS, chunk_size=ROW_CHUNK_SIZE):
+  """ 
+  `df_to_calculator` for very large uploads: `df` is split into row chunks of `chunk_size`, calculated on the shared process pool
+  (see utils.file_pool.process_executor, factor rows are shared through memory mapped Arrow files) and merged back in row order.
+  Warnings and invalid indices keep the original row index. Same arguments and return values as `df_to_calculator`,
+  which calls this by itself for uploads of two chunks or more. `creator` must be a `partial`.
+  """
+  if progress_bar:
+    progress_bar = st.progress(0)
+
+  cache = getattr(calculator, 'cache', None)
+  shared_cache = cache is not None and not isinstance(cache, dict)
+  creator_keywords = {k: v for k, v in creator.keywords.items() if k not in WORKER_KEYWORDS}
+  worker_keywords = [k for k in WORKER_KEYWORDS if k in creator.keywords]
+
+  chunks = [df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size)]
+  geolocator = creator.keywords.get('geolocator')
+  if geolocator is None or 'lat' not in df.columns or 'lon' not in df.columns:
+    geo_fields = lambda chunk: {}
+  else: # primed by `df_to_calculator` before splitting
+    geo_fields = lambda chunk: geolocator.cached_fields(chunk['lat'], chunk['lon'])
+  results = [None] * len(chunks)
+  executor = process_executor(cache if shared_cache else None) # shared and kept alive, never shut down here
+  futures = {
+    executor.submit(_calculate_chunk, chunk, type(calculator), shared_cache, creator.func, creator_keywords, worker_keywords, prefetch, geo_fields(chunk)): i
+    for i, chunk in enumerate(chunks)
+  }
+  try:
+    for done, future in enumerate(as_completed(futures)):
+      results[futures[future]] = future.result()
+      if progress_bar:
+        progress_bar.progress( (done+1) / len(chunks) )
+  finally:
+    for future in futures:
+      future.cancel()
+
+  warning_messages, invalid_rows = [], set()
+  for chunk_result in results: # row order
+    _merge_chunk(calculator, chunk_result)
+    warning_messages.extend(chunk_result[2])
+    invalid_rows.update(chunk_result[3])
+
+  if return_invalid_indices:
+    return calculator, warning_messages, invalid_rows
+  else:
+    return calculator, warning_messages
+
+
+#-----
+# Calculator
+#-----
+def df_to_calculator(df:pd.DataFrame, calculator, creator, progress_bar=True, return_invalid_indices=False, prefetch=True, geolocator=None, workers=ROW_POOL_MAX_WORKERS, chunk_size=ROW_CHUNK_SIZE):
   """ 
   Args:
   df (pd.DataFrame): 
@@ -15,51 +190,156 @@ def df_to_calculator(df:pd.DataFrame, calculator, creator, progress_bar=True, re
   calculator: 
     Calculator object. 
     Example usage: `calc.add_data( row.to_dict() )`
+    Calculators with `add_many(data_list) -> {position: exception}` get every validated row in one call instead.
     
   creator:
     Validator function for rows. Passing `row.to_dict()` might end up creating a Model object that is incompatible to the calculator. 
     Example: `create_data_for_model(**kwargs) -> Model(**kwargs)`. Advised to use `partial(create_data)` as input param. 
+    `row` is a plain dict. With a `Model` keyword (EG: `partial(create_s3c4_data, Model=Model, cache=cache)`) the creator only
+    corrects rows and validation runs in batches of INGEST_BATCH_SIZE through `validate_batch`.
     
   progress_bar (bool): 
-    Whether to show a progress bar (default is True).
+    Whether to show a progress bar (default is True). Updated once per INGEST_BATCH_SIZE rows.
   
   return_invalid_indices (bool): 
     Whether to return indices of invalid rows (default is False).
 
+  prefetch (bool):
+    Fetch every distinct emission factor concurrently into `calculator.cache` before the calculation loop (default is True).
+
+  geolocator:
+    GeoLocator used by the creator. Every lat/lon in `df` is resolved in one batch before the row loop.
+    Defaults to the `geolocator` keyword of a `partial` creator.
+
+  workers, chunk_size:
+    Uploads of at least two `chunk_size` chunks are calculated on the shared process pool, see `df_to_calculator_chunked`. 1 disables.
+
   Returns:
     tuple: A tuple containing the calculator, warning messages, and optionally invalid row indices.
   """
-  df = df.replace('<Blank>', None)
-  df = df.replace('<To fill>', None)
-  df = df.replace(np.nan, None)
+  geolocator = geolocator or getattr(creator, 'keywords', {}).get('geolocator')
+  if geolocator is not None and 'lat' in df.columns and 'lon' in df.columns:
+    geolocator.prime(df['lat'], df['lon']) # before splitting, chunks carry their resolved coordinates to the workers
+
+  if workers > 1 and len(df) >= 2 * chunk_size and isinstance(creator, partial) and not in_worker():
+    return df_to_calculator_chunked(df, calculator, creator, progress_bar=progress_bar, return_invalid_indices=return_invalid_indices, prefetch=prefetch, workers=workers, chunk_size=chunk_size)
 
   if progress_bar:
     progress_bar = st.progress(0)
-    nrows = len(df)
+    nrows = max(len(df), 1)
 
-  warning_messages = []
+  warning_messages = {} # row position: message, so messages stay in row order across both passes
   invalid_rows = set()  # Track indices of invalid rows
-  for idx, row in df.iterrows():
-    try:
-      data = creator(row=row) # make sure your creator must have 'row' as parameter
-      calculator.add_data(data) # calculator must have internal function 'add_data()'
 
-    except Exception as e:
-      warning_messages.append(f'Unable to add data for row {idx+1}. Traceback: {e}') # idx + 1 because python idx starts from 0
-      invalid_rows.add(idx) 
-      traceback.print_exc()
-      pass
-    
+  Model = getattr(creator, 'keywords', {}).get('Model')
+  batch_validate = isinstance(Model, type) and issubclass(Model, BaseModel)
+
+  #--- Pass 1: correct + validate rows in batches ---#
+  validated = []
+  records = enumerate(iter_records(df))
+  while True:
+    batch = list(islice(records, INGEST_BATCH_SIZE))
+    if not batch:
+      break
+
+    prepared = []
+    for n, (idx, row) in batch:
+      try:
+        if batch_validate:
+          prepared.append((n, idx, creator(row=row, Model=_collect_row)))
+        else:
+          validated.append((n, idx, creator(row=row))) # make sure your creator must have 'row' as parameter
+
+      except Exception as e:
+        warning_messages[n] = f'Unable to add data for row {idx+1}. Traceback: {e}' # idx + 1 because python idx starts from 0
+        invalid_rows.add(idx) 
+        traceback.print_exc()
+
+    if prepared:
+      for (n, idx, _), (data, e) in zip(prepared, validate_batch(Model, [row for _, _, row in prepared])):
+        if e is None:
+          validated.append((n, idx, data))
+        else:
+          warning_messages[n] = f'Unable to add data for row {idx+1}. Traceback: {e}'
+          invalid_rows.add(idx)
+          traceback.print_exception(type(e), e, e.__traceback__)
+
     if progress_bar:
-      progress_pct = (idx+1) / nrows
-      progress_bar.progress(progress_pct)
+      progress_bar.progress( 0.5 * (batch[-1][0]+1) / nrows )
 
+  #--- Prefetch distinct lookups ---#
+  cache = getattr(calculator, 'cache', None)
+  if prefetch and cache:
+    prefetch_lookups(cache, [data for _, _, data in validated])
+
+  #--- Pass 2: calculate ---#
+  if hasattr(calculator, 'add_many'): # batch calculation, EG: columnar S3 categories
+    errors = calculator.add_many([data for _, _, data in validated])
+    for i, e in errors.items():
+      n, idx, _ = validated[i]
+      warning_messages[n] = f'Unable to add data for row {idx+1}. Traceback: {e}'
+      invalid_rows.add(idx)
+      traceback.print_exception(type(e), e, e.__traceback__)
+
+  else:
+    for i, (n, idx, data) in enumerate(validated):
+      try:
+        calculator.add_data(data) # calculator must have internal function 'add_data()'
+
+      except Exception as e:
+        warning_messages[n] = f'Unable to add data for row {idx+1}. Traceback: {e}'
+        invalid_rows.add(idx) 
+        traceback.print_exc()
+      
+      if progress_bar and ((i+1) % INGEST_BATCH_SIZE == 0 or i+1 == len(validated)):
+        progress_bar.progress( 0.5 + 0.5 * (i+1) / len(validated) )
+
+  if progress_bar:
+    progress_bar.progress(1.0)
+
+  warning_messages = [warning_messages[n] for n in sorted(warning_messages)]
   if return_invalid_indices:
     return calculator, warning_messages, invalid_rows
   else:
     return calculator, warning_messages
 
 
+#-----
+# Re-upload
+#-----
+def row_keys(df:pd.DataFrame) -> np.ndarray:
+  """
+  Stable identity of every row of an upload: a hash of its cells and of the number of identical rows above it.
+  An unchanged row gets the same key in a corrected re-upload of the file, wherever it moved to.
+  """
+  content = pd.util.hash_pandas_object(df, index=False).to_numpy()
+  occurrence = pd.Series(content).groupby(content).cumcount().to_numpy()
+  return pd.util.hash_pandas_object(pd.DataFrame({'content': content, 'occurrence': occurrence}), index=False).to_numpy()
+
+
+def stored_row_uuids(calculator, df:pd.DataFrame, keys:np.ndarray, invalid_indices) -> Optional[dict]:
+  """
+  {row key: uuid} of the rows `df_to_calculator` stored from `df`, `keys` being its `row_keys`.
+  Valid rows are stored in row order, one uuid each. None when the calculator's rows do not line up with them.
+  """
+  aggregates = getattr(calculator, 'aggregates', None)
+  if aggregates is None:
+    return None
+  valid = [key for idx, key in zip(df.index, keys.tolist()) if idx not in invalid_indices]
+  uuids = aggregates.uuids()
+  if len(uuids) != len(valid):
+    return None
+  return dict(zip(valid, uuids))
+
+
+def merge_calculator(calculator, other):
+  """Append every row of `other`, a calculator of the same class, EG: the changed rows of a re-upload. Nothing is recalculated."""
+  _merge_chunk(calculator, (
+    other.calculated_emissions, other.best_emissions, [], set(),
+    getattr(other, 'gas_emissions', None), getattr(other, 'aggregates', None),
+  ))
+
+
 def calculator_to_df(calculator):
     """ 
     calculator: 
@@ -85,7 +365,7 @@ def calculator_to_df(calculator):
     return pd.DataFrame(data)
 
 
-def calculators_2_df(calculators):
+def calculators_2_df(calculators, gwp_set=None):
   """ 
   calculators: dictionary of calculators
     Example: 
@@ -94,6 +374,10 @@ def calculators_2_df(calculators):
       'Scope2_IndirectEmissions': calculator2,
       # ...
     }
+
+  gwp_set:
+    Name in `ghg_utils.GWP_SETS` (EG: 'AR6'). `emission_result` of rows with a gas split is re-weighted from the calculator's
+    gas ledger, see utils.gas_ledger. None keeps the stored results.
   """
   def camel_case_to_natural(camel_case_str):
     return re.sub('([a-z0-9])([A-Z])', r'\1 \2', camel_case_str)
@@ -127,8 +411,11 @@ def calculators_2_df(calculators):
     return np.nan
 
   rows = []
+  ledgers = [] # (first row of the calculator, calculator) for gwp_set
   for name, calculator in calculators.items():
     scope, category, category_name = extract_scope_and_category(name)    
+    if gwp_set and len(getattr(calculator, 'gas_emissions', None) or []):
+      ledgers.append((len(rows), calculator))
     stream = get_stream_status(scope=scope, category=category)
 
     if hasattr(calculator, 'calculated_emissions'):
@@ -172,6 +459,13 @@ def calculators_2_df(calculators):
         rows.append(row)
   
   df = pd.DataFrame(rows)
+  for start, calculator in ledgers:
+    ledger, stored = calculator.gas_emissions, calculator.calculated_emissions
+    keys = stored.key_array() if hasattr(stored, 'key_array') else np.fromiter(stored.keys(), dtype=np.int64, count=len(stored))
+    index = start + np.searchsorted(keys, ledger.row_keys()) # keys are handed out in increasing order, see emission_aggregates.next_key
+    column = df.columns.get_loc('emission_result')
+    df.iloc[index, column] = ledger.first(gwp_set)
+
   for col in df.columns:
     if df[col].apply(lambda x: isinstance(x, (dict, list))).any():
       df[col] = df[col].apply(json.dumps)
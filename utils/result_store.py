@@ -0,0 +1,372 @@
+import gc
+import datetime
+from contextlib import contextmanager
+from bisect import bisect_right
+from collections.abc import MutableMapping
+from typing import Optional, Dict, List, Tuple, Any, Iterator
+
+import numpy as np
+import pyarrow as pa
+
+from utils.app_config import RESULT_STORE_ENABLED, RESULT_STORE_CHUNK_ROWS
+from utils.utility import get_deep_size
+
+
+"""
+Usage:
+  Drop-in replacement for the `calculated_emissions` dict of the calculators. Same read/write API:
+    store[len(store)] = {'input_data': data.model_dump(), 'calculated_emissions': {'emission_result': {...}, 'data_quality': 2, 'metadata': [...]}}
+    store[0], store.values(), store.items(), len(store), del store[0]
+
+  Rows are appended to a small buffer of plain dicts. Every RESULT_STORE_CHUNK_ROWS rows the buffer is packed into Arrow columns:
+    input fields        one typed column each, strings dictionary-encoded
+    emission methods    one column each (EG: 'reported_emissions_1'), null where the method did not apply
+    data_quality        one column
+    metadata            calculation names + fields used dictionary-encoded per row, amounts and data qualities as list columns
+  Rows are rebuilt into the same dicts on read, so `calculator_to_df`, `calculators_2_df` and `_update_emissions_summary` work unchanged.
+  Rows that do not have this shape (EG: legacy calculators) are kept as they are.
+
+store = new_result_store()
+store.memory_usage() >> {'rows': 100000, 'columnar_rows': 98304, 'columnar_bytes': 9120344, 'buffered_bytes': 1712236, 'total_bytes': 10832580}
+"""
+
+RESULT_KEYS = ('emission_result', 'emission_removals') # S3C15_4 reports removals
+METADATA_KEYS = ('calculation', 'amount', 'fields_used', 'data_quality')
+ARROW_TYPES = {bool, int, float, str, datetime.date} # read back exactly as written. Anything else stays a Python list
+
+
+def _fits(row) -> bool:
+    """True when `row` has the calculator result shape the columns are laid out for."""
+    try:
+        input_data, calculated = row['input_data'], row['calculated_emissions']
+        if len(row) != 2 or not isinstance(input_data, dict) or not isinstance(calculated, dict):
+            return False
+        result_key, dq_key, metadata_key = calculated.keys()
+        if result_key not in RESULT_KEYS or (dq_key, metadata_key) != ('data_quality', 'metadata') or not isinstance(calculated[result_key], dict):
+            return False
+        return all(
+            isinstance(entry, dict) and tuple(entry.keys()) == METADATA_KEYS and isinstance(entry['fields_used'], list)
+            for entry in calculated['metadata']
+        )
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return False
+
+
+def _arrow_safe(values) -> bool:
+    """
+    One scalar type in ARROW_TYPES (or only None). Mixed columns would change on the way back, EG: int and float
+    (0 comes back as 0.0), and so would nested values (dicts come back with every key of the column).
+    """
+    types = set(type(value) for value in values if value is not None)
+    return len(types) < 2 and types <= ARROW_TYPES
+
+
+def _column(values: list):
+    """Typed Arrow column for `values`, strings dictionary-encoded. The plain list when Arrow would not give it back as is."""
+    if not _arrow_safe(values):
+        return values
+    try:
+        array = pa.array(values)
+    except (pa.ArrowException, TypeError, ValueError, OverflowError):
+        return values
+    if pa.types.is_string(array.type):
+        array = array.dictionary_encode()
+    return array
+
+
+def _to_list(column) -> list:
+    """Python values of a column. Dictionaries are decoded once, null-free numbers go through numpy (much faster than `to_pylist`)."""
+    if isinstance(column, list):
+        return column
+    if pa.types.is_dictionary(column.type):
+        values = column.dictionary.to_pylist()
+        return [None if index is None else values[index] for index in _to_list(column.indices)]
+    if column.null_count == 0 and (pa.types.is_integer(column.type) or pa.types.is_floating(column.type) or pa.types.is_boolean(column.type)):
+        return column.to_numpy(zero_copy_only=False).tolist()
+    return column.to_pylist()
+
+
+@contextmanager
+def _gc_paused():
+    """Packing and rebuilding create many objects that live on. Cyclic GC passes over them are pure overhead."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _nbytes(column) -> int:
+    return get_deep_size(column) if isinstance(column, list) else column.nbytes
+
+
+#-----
+# Chunk
+#-----
+class _Interned:
+    """Distinct values (layouts) numbered in first-seen order. Shared by every chunk of a store."""
+    def __init__(self):
+        self.values: List[Any] = []
+        self.codes: Dict[Any, int] = {}
+
+    def code(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class _Chunk:
+    def __init__(self, rows: List[dict], layouts: _Interned):
+        """
+        Pack `rows` (all fitting the result shape) into columns.
+        Key order of every dict is kept as a layout code per row, so rows read back with the same key order.
+        """
+        self.length = len(rows)
+        self.layouts = layouts
+        codes = np.empty((self.length, 3), dtype=np.int32) # input layout, result layout, metadata layout
+
+        inputs, methods, data_quality, amounts, qualities = {}, {}, [], [], []
+        for i, row in enumerate(rows):
+            input_data, calculated = row['input_data'], row['calculated_emissions']
+            result_key = next(iter(calculated))
+            result, metadata = calculated[result_key], calculated['metadata']
+
+            codes[i, 0] = layouts.code(('input',) + tuple(input_data.keys()))
+            codes[i, 1] = layouts.code(('result', result_key) + tuple(result.keys()))
+            codes[i, 2] = layouts.code(('metadata',) + tuple((entry['calculation'], tuple(entry['fields_used'])) for entry in metadata))
+            for columns, values in ((inputs, input_data), (methods, result)):
+                for name, value in values.items():
+                    column = columns.get(name)
+                    if column is None:
+                        column = columns[name] = [None] * self.length
+                    column[i] = value
+            data_quality.append(calculated['data_quality'])
+            amounts.append([entry['amount'] for entry in metadata])
+            qualities.append([entry['data_quality'] for entry in metadata])
+
+        self.codes = codes
+        self.inputs = {field: _column(values) for field, values in inputs.items()}
+        self.methods = {method: _column(values) for method, values in methods.items()}
+        self.data_quality = _column(data_quality)
+        self.amounts = self._list_column(amounts)
+        self.qualities = self._list_column(qualities)
+
+    @staticmethod
+    def _list_column(lists: List[list]):
+        if not _arrow_safe(value for values in lists for value in values):
+            return lists
+        try:
+            return pa.array(lists)
+        except (pa.ArrowException, TypeError, ValueError, OverflowError):
+            return lists
+
+    @property
+    def nbytes(self) -> int:
+        columns = [*self.inputs.values(), *self.methods.values(), self.data_quality, self.amounts, self.qualities]
+        return self.codes.nbytes + sum(_nbytes(column) for column in columns)
+
+    def _columns(self, convert) -> tuple:
+        """(inputs, methods, data_quality, amounts, qualities) with every column passed through `convert`."""
+        return (
+            {field: convert(column) for field, column in self.inputs.items()},
+            {method: convert(column) for method, column in self.methods.items()},
+            convert(self.data_quality), convert(self.amounts), convert(self.qualities),
+        )
+
+    def _plan(self, codes, inputs, methods) -> tuple:
+        """Columns to read, in key order, for one (input, result, metadata) layout."""
+        input_layout, result_layout, metadata_layout = (self.layouts.values[code] for code in codes)
+        return (
+            [(field, inputs[field]) for field in input_layout[1:]],
+            result_layout[1],
+            [(method, methods[method]) for method in result_layout[2:]],
+            metadata_layout[1:],
+        )
+
+    @staticmethod
+    def _build(i, plan, data_quality, amounts, qualities) -> dict:
+        input_columns, result_key, method_columns, metadata_layout = plan
+        row_amounts, row_qualities = amounts[i], qualities[i]
+        return {
+            'input_data': {field: column[i] for field, column in input_columns},
+            'calculated_emissions': {
+                result_key: {method: column[i] for method, column in method_columns},
+                'data_quality': data_quality[i],
+                'metadata': [
+                    {'calculation': calculation, 'amount': row_amounts[j], 'fields_used': list(fields_used), 'data_quality': row_qualities[j]}
+                    for j, (calculation, fields_used) in enumerate(metadata_layout)
+                ],
+            },
+        }
+
+    def row(self, i) -> dict:
+        inputs, methods, *rest = self._columns(_Cells)
+        return self._build(i, self._plan(tuple(self.codes[i]), inputs, methods), *rest)
+
+    def rows(self) -> Iterator[dict]:
+        """Every row, columns converted to Python once instead of cell by cell."""
+        inputs, methods, *rest = self._columns(_to_list)
+        plans = {}
+        for i, codes in enumerate(map(tuple, self.codes.tolist())):
+            plan = plans.get(codes)
+            if plan is None:
+                plan = plans[codes] = self._plan(codes, inputs, methods)
+            yield self._build(i, plan, *rest)
+
+
+class _Cells:
+    """Single cell access to a column, for reading one row without converting whole columns."""
+    __slots__ = ['column']
+
+    def __init__(self, column):
+        self.column = column
+
+    def __getitem__(self, i):
+        return self.column[i] if isinstance(self.column, list) else self.column[i].as_py()
+
+
+#-----
+# Store
+#-----
+class ResultStore(MutableMapping):
+    def __init__(self, rows: Optional[dict] = None, chunk_rows: int = RESULT_STORE_CHUNK_ROWS):
+        """
+        rows:
+          Optional existing {key: row} dict, EG: `calculated_emissions` of an older calculator.
+
+        chunk_rows:
+          Rows buffered as dicts before being packed into columns.
+        """
+        self.chunk_rows = chunk_rows
+        self._layouts = _Interned()
+        self._chunks: List[_Chunk] = []
+        self._starts: List[int] = [] # first position of every chunk
+        self._packed = 0 # rows held in chunks, positions [0, _packed)
+        self._buffer: List[dict] = [] # positions [_packed, _packed + len(_buffer))
+        self._keys: List[Any] = [] # key of every position, including deleted ones
+        self._positions: Dict[Any, int] = {} # live key: position
+        self._loose: Dict[int, Any] = {} # position: row kept as is (other shapes, rows replaced after packing)
+        self._key_array: Optional[np.ndarray] = None # see `key_array`, dropped whenever a key is added or deleted
+
+        for key, row in (rows or {}).items():
+            self[key] = row
+
+    def __repr__(self):
+        return f"<ResultStore: {len(self)} rows, {self._packed} columnar>"
+
+    #--Mapping--#
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def __iter__(self):
+        for position, key in enumerate(self._keys):
+            if self._positions.get(key) == position:
+                yield key
+
+    def __getitem__(self, key):
+        return self._read(self._positions[key])
+
+    def __setitem__(self, key, row):
+        position = self._positions.get(key)
+        if position is not None: # replaced in place, keeps its position like a dict does
+            if position >= self._packed:
+                self._buffer[position - self._packed] = row
+            else:
+                self._loose[position] = row
+            return
+
+        self._positions[key] = len(self._keys)
+        self._keys.append(key)
+        self._key_array = None
+        self._buffer.append(row)
+        if len(self._buffer) >= self.chunk_rows:
+            self.pack()
+
+    def __delitem__(self, key):
+        position = self._positions.pop(key)
+        self._loose.pop(position, None)
+        self._key_array = None
+
+    def key_array(self) -> np.ndarray:
+        """Live keys in iteration order, EG: to align the gas ledger with `searchsorted`. Cached until keys change."""
+        if self._key_array is None:
+            positions = np.fromiter(self._positions.values(), dtype=np.int64, count=len(self._positions))
+            positions.sort()
+            self._key_array = np.asarray(self._keys)[positions] if len(positions) else np.array([], dtype=np.int64)
+        return self._key_array
+
+    def values(self):
+        with _gc_paused():
+            return [row for _, row in self._iter_rows()]
+
+    def items(self):
+        with _gc_paused():
+            return [(self._keys[position], row) for position, row in self._iter_rows()]
+
+    #--Storage--#
+    def _read(self, position):
+        if position in self._loose:
+            return self._loose[position]
+        if position >= self._packed:
+            return self._buffer[position - self._packed]
+        chunk_index = bisect_right(self._starts, position) - 1
+        return self._chunks[chunk_index].row(position - self._starts[chunk_index])
+
+    def _iter_rows(self) -> Iterator[Tuple[int, dict]]:
+        live = set(self._positions.values())
+        for start, chunk in zip(self._starts, self._chunks):
+            if not any(position in live for position in range(start, start + chunk.length)):
+                continue
+            for i, row in enumerate(chunk.rows()):
+                position = start + i
+                if position in live:
+                    yield position, self._loose.get(position, row)
+        for i, row in enumerate(self._buffer):
+            position = self._packed + i
+            if position in live:
+                yield position, self._loose.get(position, row)
+
+    def pack(self):
+        """Move buffered rows into a columnar chunk. Called every `chunk_rows` appends."""
+        if not self._buffer:
+            return
+        fitting = []
+        for i, row in enumerate(self._buffer):
+            if _fits(row):
+                fitting.append(row)
+            else:
+                self._loose[self._packed + i] = row
+                fitting.append(_PLACEHOLDER_ROW)
+        with _gc_paused():
+            self._chunks.append(_Chunk(fitting, self._layouts))
+        self._starts.append(self._packed)
+        self._packed += len(fitting)
+        self._buffer = []
+
+    #--Stats--#
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes held by the columns, and by rows still (or only) stored as dicts."""
+        columnar_bytes = sum(chunk.nbytes for chunk in self._chunks)
+        buffered_bytes = get_deep_size(self._buffer) + get_deep_size(list(self._loose.values()))
+        return {
+            'rows': len(self),
+            'columnar_rows': self._packed - len(self._loose),
+            'columnar_bytes': columnar_bytes,
+            'buffered_bytes': buffered_bytes,
+            'total_bytes': columnar_bytes + buffered_bytes,
+        }
+
+
+_PLACEHOLDER_ROW = {'input_data': {}, 'calculated_emissions': {'emission_result': {}, 'data_quality': None, 'metadata': []}} # holds the place of a loose row in a chunk
+
+
+def new_result_store():
+    """`calculated_emissions` container for new calculators: a ResultStore, or a plain dict when RESULT_STORE_ENABLED is off."""
+    return ResultStore() if RESULT_STORE_ENABLED else {}
@@ -2,8 +2,11 @@
 import random
 from typing import Optional, Dict, Union, Any
 
-from utils.ghg_utils import get_relevant_factors, calculate_co2e
+from utils.ghg_utils import get_relevant_factors, calculate_co2e, calculate_gases
 from utils.s1de_Misc.s1_models import *
+from utils.result_store import new_result_store
+from utils.emission_aggregates import EmissionAggregates, shown_emissions, remove_rows
+from utils.gas_ledger import GasLedger, gwp_best_emissions, gwp_total_emissions
 
 #----------
 # Calculator
@@ -13,11 +16,15 @@ class S1_Calculator(BaseModel):
     calculated_emissions: Optional[Dict] = None
     best_emissions: Dict[str,float] = {}
     total_emissions: float = 0.0
+    aggregates: Optional[Any] = None # EmissionAggregates, running totals by category, scope and date
+    gas_emissions: Optional[Any] = None # GasLedger, per gas split of the results for other GWP sets
       
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.cache = self.cache or {}
-        self.calculated_emissions = self.calculated_emissions or {}
+        self.calculated_emissions = self.calculated_emissions or new_result_store()
+        self.aggregates = self.aggregates if self.aggregates is not None else EmissionAggregates()
+        self.gas_emissions = self.gas_emissions or GasLedger()
 
     def add_data(self, data: S1_BaseModel):
         try:
@@ -31,20 +38,23 @@ class S1_Calculator(BaseModel):
                 return
             
             # Create emission result dict
+            gases = res.pop('gases', None) # kept in the gas ledger, not in the stored result
             emission_result = res
-            idx = len(self.calculated_emissions)
+            idx = self.aggregates.next_key()
             self.calculated_emissions[idx] = {'input_data': data.model_dump(), 'calculated_emissions': emission_result}
+            if gases:
+                self.gas_emissions.add(idx, data.uuid, emission_result['metadata'], gases, default_gwp=self._refrigerant_gwp)
 
             print(emission_result)
+
+            # Update best_quality_emissions, total_emissions and the running aggregates
+            self._update_emissions_summary(idx, category=type(data).__name__)
             
         except TypeError as te:
             print(te)
         except Exception as e:
             raise e
             
-        # Update best_quality_emissions and total_emissions
-        self._update_emissions_summary()
-            
         
     def _calculate_emissions(self, data: S1_BaseModel, cache):
         if isinstance(data, (S1_MobileCombustion)): 
@@ -61,10 +71,12 @@ class S1_Calculator(BaseModel):
             print(f'data {data} not in expected data type. Unable to calculate')
         return res
 
-    def _update_emissions_summary(self):
+    def _update_emissions_summary(self, idx, category=None):
+        entry = self.calculated_emissions[idx]
+        data_uuid = entry['input_data']['uuid']
+        emissions = None
         try:
-            data_uuid = self.calculated_emissions[len(self.calculated_emissions) - 1]['input_data']['uuid']
-            metadata = self.calculated_emissions[len(self.calculated_emissions) - 1]['calculated_emissions']['metadata']
+            metadata = entry['calculated_emissions']['metadata']
 
             if not metadata:
                 raise ValueError(f"Metadata is empty for {data_uuid}")
@@ -79,11 +91,25 @@ class S1_Calculator(BaseModel):
         except ValueError as e:
             print(f"An error occurred: {e}")
 
-    def get_emissions(self) -> Dict[str, float]:
-        return self.best_emissions
+        self.aggregates.add(idx, data_uuid, category, entry['input_data'].get('date'), emissions, shown_emissions(entry['calculated_emissions']))
+
+    def remove_data(self, data_uuid: str) -> int:
+        """Remove every row of `data_uuid`, EG: a row deleted or corrected after upload. Only those rows leave the totals. Returns the number of rows removed."""
+        return remove_rows(self, data_uuid)
+
+    def replace_data(self, data: S1_BaseModel):
+        """Recalculate the row of `data.uuid` from `data`, EG: a corrected row of a re-uploaded file."""
+        self.remove_data(data.uuid)
+        self.add_data(data)
+
+    def _refrigerant_gwp(self, refrigerant_type) -> float:
+        return self.cache.get_refrigerant_gwp(refrigerant_type=refrigerant_type)['gwp_100']
+
+    def get_emissions(self, gwp_set: Optional[str] = None) -> Dict[str, float]:
+        return gwp_best_emissions(self, gwp_set)
 
-    def get_total_emissions(self) -> float:
-        return self.total_emissions
+    def get_total_emissions(self, gwp_set: Optional[str] = None) -> float:
+        return gwp_total_emissions(self, gwp_set)
 
 
 
@@ -107,6 +133,7 @@ def calc_S1_StationaryCombustion(data: S1_StationaryCombustion, cache):
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
 
     fields = []
     total_co2e = 0
@@ -124,6 +151,7 @@ def calc_S1_StationaryCombustion(data: S1_StationaryCombustion, cache):
         factors = cache.get_fuel_emission_factors(fuel_type=data.fuel_type)
         relevant_factors =  get_relevant_factors(factors, unit=data.fuel_unit)
         co2e = calculate_co2e(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit)
+        gases['physical_emissions'] = calculate_gases(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit)
         fields += f1
         total_co2e += co2e
 
@@ -132,7 +160,7 @@ def calc_S1_StationaryCombustion(data: S1_StationaryCombustion, cache):
         data_quality -= 2
         metadata.append( create_metadata('physical_emissions', total_co2e, fields, data_quality) )
 
-    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
 
 
 
@@ -140,6 +168,7 @@ def calc_S1_MobileCombustion(data: S1_MobileCombustion, cache):
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
 
     f1 = ['vehicle_type', 'distance_traveled']    
     if all(getattr(data, field, None) is not None for field in f1): 
@@ -148,6 +177,7 @@ def calc_S1_MobileCombustion(data: S1_MobileCombustion, cache):
         factors = cache.get_vehicle_emission_factors(table=TABLE, vehicle_type=data.vehicle_type)
         relevant_factors =  get_relevant_factors(factors, unit='unit')
         total_co2e = calculate_co2e(relevant_factors, unit_value=data.distance_traveled)
+        gases['distance_based_emissions'] = calculate_gases(relevant_factors, unit_value=data.distance_traveled)
     
         emission_result['distance_based_emissions'] = total_co2e
         data_quality -= 1
@@ -158,18 +188,20 @@ def calc_S1_MobileCombustion(data: S1_MobileCombustion, cache):
         factors = cache.get_fuel_emission_factors(fuel_type=data.fuel_type)
         relevant_factors =  get_relevant_factors(factors, unit=data.fuel_unit)
         total_co2e = calculate_co2e(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit)    
+        gases['use_based_emissions'] = calculate_gases(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit)
 
         emission_result['use_based_emissions'] = total_co2e
         data_quality -= 1
         metadata.append( create_metadata('use_based_emissions', total_co2e, f2, data_quality) )
 
-    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
 
 
 def calc_S1_FugitiveEmission(data: S1_FugitiveEmission, cache): 
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
 
     # if user knows refrigerant use
     f1 = ['refrigerant_use',  'refrigerant_type']
@@ -177,6 +209,7 @@ def calc_S1_FugitiveEmission(data: S1_FugitiveEmission, cache):
         factors = cache.get_refrigerant_gwp(refrigerant_type=data.refrigerant_type)
         refrigerant_gwp = factors['gwp_100']
         refrigerant_co2e = data.refrigerant_use * refrigerant_gwp
+        gases['reported_emissions'] = {data.refrigerant_type: data.refrigerant_use}
         data_quality -= 2
 
         emission_result['reported_emissions'] = refrigerant_co2e
@@ -221,9 +254,10 @@ def calc_S1_FugitiveEmission(data: S1_FugitiveEmission, cache):
                 data_quality = 5
 
             refrigerant_co2e = refrigerant_use * refrigerant_gwp
+            gases['calculated_emissions'] = {data.refrigerant_type: refrigerant_use}
             data_quality -=3        
 
             emission_result['calculated_emissions'] = refrigerant_co2e
             metadata.append(create_metadata('calculated_emissions', refrigerant_co2e, fields, data_quality))
 
-    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
\ No newline at end of file
+    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
\ No newline at end of file
@@ -26,7 +26,7 @@ def verify_and_correct(row:dict, field_name:str, allowed_values:list, abbrv_dict
     value = row.get(field_name)
 
     if value not in allowed_values:
-        corrected_value = find_closest_category(value, allowed_values, abbrv_dict=abbrv_dict)
+        corrected_value = find_closest_category(value, allowed_values, abbrv_dict=abbrv_dict, field=field_name)
         if corrected_value is not None:
             print(f'Field "{field_name}" input "{value}" suggested values is "{corrected_value}"')
             return corrected_value
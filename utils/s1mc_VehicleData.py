@@ -14,22 +14,21 @@ from pydantic import BaseModel, Field
 from pydantic import model_validator
 from typing import Optional, Dict, Union, Any
 
-from supabase import create_client
-from .utility import find_closest_category
+from .supabase_pool import SUPABASE_POOL, get_supabase_client
+from .utility import find_closest_category, get_supabase_secrets
+from .factor_store import get_factor_store
 
-supabase_url= st.secrets['supabase_url']
-supabase_anon_key= st.secrets['supabase_anon_key']
-supabase = create_client(supabase_url, supabase_anon_key)
+supabase_url, supabase_anon_key = get_supabase_secrets()
 
 
 def supabase_query(table:str, url:str, key:str, limit: Optional[int]=10000):
-    supabase = create_client(url, key)
+    supabase = get_supabase_client(url, key)
     query_builder = supabase.table(table).select("*")
     if limit is not None:
         query_builder = query_builder.limit(limit)
 
     try:
-        response = query_builder.execute()
+        response = SUPABASE_POOL.execute(query_builder)
     except Exception as e:
         raise e
 
@@ -41,22 +40,9 @@ def supabase_query(table:str, url:str, key:str, limit: Optional[int]=10000):
 def get_lookup_from_S1MC(table='s1mc_v2', vehicle_type=None, fuel_type=None):
     # very inefficient query I hate this so much
     
-    url = supabase_url 
-    key = supabase_anon_key
-    supabase = create_client(url, key)
-    query_builder = supabase.table(table).select('vehicle_type', 'fuel_type', 'year', 'units', 'kgCO2_km', 'gCH4_km', 'gN2O_km')
-    query_builder = query_builder.filter('units', 'eq', 'vehicle-km')
-    
-    if vehicle_type:
-        query_builder = query_builder.filter('vehicle_type', 'eq', vehicle_type)
-    if fuel_type:
-        query_builder = query_builder.filter('fuel_type', 'eq', fuel_type)
-    
-    try:
-        response = query_builder.execute()
-        data = response.data
-    except Exception as e:
-        raise e
+    COLUMNS = ['vehicle_type', 'fuel_type', 'year', 'units', 'kgCO2_km', 'gCH4_km', 'gN2O_km']
+    records = get_factor_store().select(table, units='vehicle-km', vehicle_type=vehicle_type or None, fuel_type=fuel_type or None)
+    data = [{col: row.get(col) for col in COLUMNS} for row in records]
         
     if data == []:
         raise Exception('No data retrieved. Vehicle not supported.')
@@ -140,8 +126,7 @@ class S1MC_Lookup_Cache(BaseModel):
         
         # If not in cache, query DB.
         TABLE = f's1mc_v2'
-        records = supabase_query(TABLE, supabase_url, supabase_anon_key)
-        allowed_vehicles = set(item['vehicle_type'] for item in records)
+        allowed_vehicles = get_factor_store().uniques(TABLE, 'vehicle_type')
         allowed_vehicles = sorted(list(allowed_vehicles))
         self._allowed_vehicles_cache['vehicles'] = allowed_vehicles
         return allowed_vehicles
@@ -155,14 +140,10 @@ class S1MC_Lookup_Cache(BaseModel):
             return self._allowed_fuel_types_cache[vehicle_type]
         
         TABLE = f's1mc_v2'
-        query_builder = supabase.table(TABLE).select('vehicle_type', 'fuel_type')
-        query_builder = query_builder.filter('units', 'eq', 'vehicle-km')
-        query_builder = query_builder.filter('vehicle_type', 'eq', vehicle_type)
-        response = query_builder.execute()
-        records = response.data
+        allowed_fuel_types = get_factor_store().uniques(TABLE, 'fuel_type', units='vehicle-km', vehicle_type=vehicle_type)
         
-        if records not in [[], None]:
-            allowed_fuel_types = set(item['fuel_type'] for item in records)
+        if allowed_fuel_types not in [[], None]:
+            allowed_fuel_types = set(allowed_fuel_types)
             self._allowed_fuel_types_cache[vehicle_type] = allowed_fuel_types
             return allowed_fuel_types
         return None
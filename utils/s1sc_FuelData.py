@@ -13,22 +13,21 @@ from pydantic import BaseModel, Field, constr
 from pydantic import root_validator, field_validator, model_validator
 from typing import Optional, Dict, Union, Any
 
-from supabase import create_client
-from .utility import find_closest_category
+from .supabase_pool import SUPABASE_POOL, get_supabase_client
+from .utility import find_closest_category, get_supabase_secrets
+from .factor_store import get_factor_store
 
 
-supabase_url= st.secrets['supabase_url']
-supabase_anon_key= st.secrets['supabase_anon_key']
-supabase = create_client(supabase_url, supabase_anon_key)
+supabase_url, supabase_anon_key = get_supabase_secrets()
 
 def supabase_query(table:str, url:str, key:str, limit: Optional[int]=10000):
-    supabase = create_client(url, key)
+    supabase = get_supabase_client(url, key)
     query_builder = supabase.table(table).select("*")
     if limit is not None:
         query_builder = query_builder.limit(limit)
 
     try:
-        response = query_builder.execute()
+        response = SUPABASE_POOL.execute(query_builder)
     except Exception as e:
         raise e
 
@@ -48,12 +47,12 @@ def get_lookup_from_supabase(table, fuel_type_col, fuel_type, url, key):
     - url, key:
         Supabase url and anon key
     """
-    supabase = create_client(url, key)
+    supabase = get_supabase_client(url, key)
     query_builder = supabase.table(table).select('*')
     query_builder = query_builder.filter(fuel_type_col, 'eq', fuel_type)
     
     try:
-        response = query_builder.execute()
+        response = SUPABASE_POOL.execute(query_builder)
     except Exception as e:
         raise e
     return response.data
@@ -114,7 +113,7 @@ class S1SC_Lookup_Cache(BaseModel):
             allowed_fuel_types = [item['fuel_type'] for item in lookup]
         else:
             TABLE = f's1sc_{fuel_state}'
-            records = supabase_query(TABLE, supabase_url, supabase_anon_key)
+            records = get_factor_store().select(TABLE, limit=10000, columns=['fuel_type'])
             allowed_fuel_types = [item['fuel_type'] for item in records]
 
         self._allowed_fuel_types_cache[fuel_state] = allowed_fuel_types
@@ -126,7 +125,7 @@ class S1SC_Lookup_Cache(BaseModel):
             print(f"{cache_key} discovered, skipping database query.") # 
             return self._emission_factors_cache[cache_key]
 
-        row = get_lookup_from_supabase(table, fuel_type_col='fuel_type', fuel_type=fuel_type, url=supabase_url, key=supabase_anon_key)
+        row = get_factor_store().select(table, fuel_type=fuel_type)
         self._emission_factors_cache[cache_key] = row
         return row
     
@@ -6,6 +6,8 @@ from typing import Optional, Dict, Union, Any
 from utils.utility import clamp
 from utils.ghg_utils import get_relevant_factors
 from utils.s2ie_Misc.s2_models import S2_PurchasedPower, S2_BaseModel
+from utils.result_store import new_result_store
+from utils.emission_aggregates import EmissionAggregates, shown_emissions, remove_rows
 
 
 #----------
@@ -16,11 +18,13 @@ class S2_Calculator(BaseModel):
     calculated_emissions: Optional[Dict] = None
     best_emissions: Dict[str,float] = {}
     total_emissions: float = 0.0
+    aggregates: Optional[Any] = None # EmissionAggregates, running totals by category, scope and date
       
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.cache = self.cache or {}
-        self.calculated_emissions = self.calculated_emissions or {}
+        self.calculated_emissions = self.calculated_emissions or new_result_store()
+        self.aggregates = self.aggregates if self.aggregates is not None else EmissionAggregates()
 
     def add_data(self, data: S2_BaseModel):
         try:
@@ -35,19 +39,19 @@ class S2_Calculator(BaseModel):
             
             # Create emission result dict
             emission_result = res
-            idx = len(self.calculated_emissions)
+            idx = self.aggregates.next_key()
             self.calculated_emissions[idx] = {'input_data': data.model_dump(), 'calculated_emissions': emission_result}
 
             print(emission_result) # 
+
+            # Update best_quality_emissions, total_emissions and the running aggregates
+            self._update_emissions_summary(idx, category=type(data).__name__)
             
         except TypeError as te:
             print(te)
         except Exception as e:
             raise e
             
-        # Update best_quality_emissions and total_emissions
-        self._update_emissions_summary()
-            
         
     def _calculate_emissions(self, data: S2_BaseModel, cache):
         if isinstance(data, (S2_PurchasedPower)): 
@@ -58,10 +62,12 @@ class S2_Calculator(BaseModel):
         return res
     
 
-    def _update_emissions_summary(self):
+    def _update_emissions_summary(self, idx, category=None):
+        entry = self.calculated_emissions[idx]
+        data_uuid = entry['input_data']['uuid']
+        emissions = None
         try:
-            data_uuid = self.calculated_emissions[len(self.calculated_emissions) - 1]['input_data']['uuid']
-            metadata = self.calculated_emissions[len(self.calculated_emissions) - 1]['calculated_emissions']['metadata']
+            metadata = entry['calculated_emissions']['metadata']
 
             if not metadata:
                 raise ValueError(f"Metadata is empty for {data_uuid}")
@@ -76,6 +82,17 @@ class S2_Calculator(BaseModel):
         except ValueError as e:
             print(f"An error occurred: {e}")
 
+        self.aggregates.add(idx, data_uuid, category, entry['input_data'].get('date'), emissions, shown_emissions(entry['calculated_emissions']))
+
+    def remove_data(self, data_uuid: str) -> int:
+        """Remove every row of `data_uuid`, EG: a row deleted or corrected after upload. Only those rows leave the totals. Returns the number of rows removed."""
+        return remove_rows(self, data_uuid)
+
+    def replace_data(self, data: S2_BaseModel):
+        """Recalculate the row of `data.uuid` from `data`, EG: a corrected row of a re-uploaded file."""
+        self.remove_data(data.uuid)
+        self.add_data(data)
+
 
     def get_emissions(self) -> Dict[str, float]:
         return self.best_emissions
@@ -28,7 +28,7 @@ def verify_and_correct(row:dict, field_name:str, allowed_values:list, abbrv_dict
     value = row.get(field_name)
 
     if value not in allowed_values:
-        corrected_value = find_closest_category(value, allowed_values, abbrv_dict=abbrv_dict)
+        corrected_value = find_closest_category(value, allowed_values, abbrv_dict=abbrv_dict, field=field_name)
         if corrected_value is not None:
             print(f'Field "{field_name}" input "{value}" suggested values is "{corrected_value}"')
             return corrected_value
@@ -82,13 +82,13 @@ def create_s2pp_data(row, Model:S2_PurchasedPower, cache=None, geolocator=None,
         # Verify and correct country
         if 'country' in row and row['country'] is not None:
             allowed_countries = cache.get_allowed_countries()
-            corrected_country = find_closest_category(row['country'], allowed_countries, abbrv_dict=abbrv_map)
+            corrected_country = find_closest_category(row['country'], allowed_countries, abbrv_dict=abbrv_map, field='country')
             row['country'] = corrected_country if corrected_country else None
 
         # Verify and correct state
         if 'state' in row and row['state'] is not None and row['country'] is not None:
             allowed_states = cache.get_allowed_states(country=row['country'])
-            corrected_state = find_closest_category(row['state'], allowed_states, abbrv_dict=abbrv_map)
+            corrected_state = find_closest_category(row['state'], allowed_states, abbrv_dict=abbrv_map, field='state')
             row['state'] = corrected_state if corrected_state else None
 
         return Model(**row)
@@ -11,24 +11,23 @@ from pydantic import BaseModel, Field
 from pydantic import model_validator
 from typing import Optional, Dict, Union, Tuple, ClassVar, Any
 
-from supabase import create_client
+from .supabase_pool import SUPABASE_POOL, get_supabase_client
 
-from .utility import find_closest_category
+from .utility import find_closest_category, get_supabase_secrets
+from .factor_store import get_factor_store
 from .geolocator import GeoLocator
 
-supabase_url= st.secrets['supabase_url']
-supabase_anon_key= st.secrets['supabase_anon_key']
-supabase = create_client(supabase_url, supabase_anon_key)
+supabase_url, supabase_anon_key = get_supabase_secrets()
 
 
 def supabase_query(table:str, url:str, key:str, limit: Optional[int]=10000):
-    supabase = create_client(url, key)
+    supabase = get_supabase_client(url, key)
     query_builder = supabase.table(table).select("*")
     if limit is not None:
         query_builder = query_builder.limit(limit)
 
     try:
-        response = query_builder.execute()
+        response = SUPABASE_POOL.execute(query_builder)
     except Exception as e:
         raise e
 
@@ -38,9 +37,7 @@ def supabase_query(table:str, url:str, key:str, limit: Optional[int]=10000):
 
 
 def get_lookup_from_S2IE(table='s2ie_gef', country='malaysia', state='Peninsular', energy_provider='TNB', default=None):
-    url = supabase_url 
-    key = supabase_anon_key
-    supabase = create_client(url, key)
+    store = get_factor_store()
 
     if country is None:
         country = 'Malaysia'
@@ -49,27 +46,14 @@ def get_lookup_from_S2IE(table='s2ie_gef', country='malaysia', state='Peninsular
         state = 'Peninsular'
     
     # Fetch unique countries and states for spell check
-    unique_countries = [row['country'] for row in supabase.table(table).select('country').execute().data]
-    unique_states = [row['state'] for row in supabase.table(table).select('state').execute().data]
+    unique_countries = store.uniques(table, 'country')
+    unique_states = store.uniques(table, 'state')
     
     # Spell check
     corrected_country = find_closest_category(country, unique_countries)
     corrected_state = find_closest_category(state, unique_states)
     
-    query_builder = supabase.table(table).select('*')
-    
-    if corrected_country:
-        query_builder = query_builder.filter('country', 'eq', corrected_country)
-    if corrected_state:
-        query_builder = query_builder.filter('state', 'eq', corrected_state)
-    if energy_provider:
-        query_builder = query_builder.filter('energy_provider', 'eq', energy_provider)
-    
-    try:
-        response = query_builder.execute()
-        data = response.data
-    except Exception as e:
-        raise e
+    data = store.select(table, country=corrected_country or None, state=corrected_state or None, energy_provider=energy_provider or None)
     
     if data == []:
         if default is not None:
@@ -116,8 +100,7 @@ class S2IE_Lookup_Cache(BaseModel):
             return self._allowed_countries_cache['countries']
         
         TABLE = 'locations_country_code'
-        records = supabase_query(TABLE, supabase_url, supabase_anon_key)
-        allowed_countries = set(item['name'] for item in records)
+        allowed_countries = get_factor_store().uniques(TABLE, 'name')
         allowed_countries = sorted(list(allowed_countries))
         
         self._allowed_countries_cache['countries'] = allowed_countries
@@ -130,13 +113,9 @@ class S2IE_Lookup_Cache(BaseModel):
         
         if country not in [None, [], np.nan]:
           TABLE = 'locations_states'
-          query_builder = supabase.table(TABLE).select('state_name', 'country_name')
-          query_builder = query_builder.filter('country_name', 'eq', country)
-          response = query_builder.execute()
-          records = response.data
+          allowed_states = get_factor_store().uniques(TABLE, 'state_name', country_name=country)
           
-          if records not in [[], None]:
-              allowed_states = list(set(item['state_name'] for item in records))
+          if allowed_states not in [[], None]:
               self._allowed_states_cache[country] = allowed_states
               return allowed_states
           return None
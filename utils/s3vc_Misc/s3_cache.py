@@ -1,5 +1,36 @@
+import threading
 from pydantic import BaseModel, Field
-from utils.utility import find_closest_category, supabase_query_v2
+from typing import Optional, Any
+from utils.utility import find_closest_category
+from utils.category_matcher import get_category_matcher
+from utils.factor_store import get_factor_store
+from utils.factor_disk_cache import get_factor_disk_cache
+from utils.shared_cache import get_shared_lookup_cache
+from utils.single_flight import LOOKUP_FLIGHTS, rebuild_error
+from utils.app_config import NEGATIVE_CACHE_TTL
+from utils.s3vc_Misc.s3_snapshot import FactorSnapshot
+
+
+class NegativeResult:
+    """ 
+    Remembered "not found" or failed lookup. Lives in memory only, never written to the disk tier.
+    Only the error's type and args are kept, every hit raises a fresh exception so tracebacks do not pile up on a shared one.
+    """
+    __slots__ = ['error_type', 'error_args']
+
+    def __init__(self, error: Optional[Exception] = None):
+        self.error_type = type(error) if error is not None else None
+        self.error_args = error.args if error is not None else ()
+
+    def __repr__(self):
+        if self.error_type is None:
+            return "<NegativeResult: None>"
+        return f"<NegativeResult: {self.error_type.__name__}{self.error_args!r}>"
+
+    def resolve(self):
+        if self.error_type is None:
+            return None
+        raise rebuild_error(self.error_type, self.error_args)
 
 
 #-----
@@ -7,41 +38,185 @@ from utils.utility import find_closest_category, supabase_query_v2
 #-----
 class S3_Lookup_Cache(BaseModel):
     from functools import lru_cache
-    cache: dict = {}
+    cache: Any = Field(default_factory=get_shared_lookup_cache) # server-wide LRU/TTL cache shared by all sessions, see utils.shared_cache
+    snapshot_mode: bool = False # serve factor tables from a bulk loaded, indexed in-memory snapshot
+    snapshot: Optional[Any] = None
+    disk_cache: Optional[Any] = None # persistent tier below `cache`, see utils.factor_disk_cache
+    store: Optional[Any] = None # FactorStore backend, defaults to the process-wide store in utils.factor_store
         
     #--Helper--#
     def __repr__(self):
         return f"<S3_Lookup_Cache: {len(self.cache)} items>"
-    
+
     def _generate_cache_key(self, table, **kwargs):
         sorted_items = sorted(kwargs.items())
         return f"{table}_{'_'.join([f'{k}_{v}' for k, v in sorted_items])}"
+
+    def load_snapshot(self, tables=None):
+        """ 
+        Bulk fetch factor tables into an indexed snapshot. Tables not listed are loaded lazily on first lookup.
+        """
+        self.snapshot_mode = True
+        if self.snapshot is None:
+            self.snapshot = FactorSnapshot(disk_cache=self.disk_cache, store=self.store)
+        self.snapshot.load(tables)
+        return self.snapshot
+
+    def _in_snapshot(self, table):
+        if not self.snapshot_mode:
+            return False
+        if self.snapshot is None:
+            self.snapshot = FactorSnapshot(disk_cache=self.disk_cache, store=self.store)
+        return table in self.snapshot
+
+    def _cache_get(self, table, cache_key):
+        """ 
+        Memory first, then the persistent disk tier. Returns (found, value) so cached None values still count as hits.
+        """
+        found, value = self.cache.lookup(cache_key, table=table)
+        if found:
+            return True, value
+
+        if self.disk_cache is not None:
+            found, value = self.disk_cache.get(table, cache_key)
+            if found:
+                self.cache.set(cache_key, value, table=table)
+                return True, value
+        return False, None
+
+    def _cache_set(self, table, cache_key, value, persist=True):
+        """ 
+        persist: False for values that should not outlive the process.
+        """
+        self.cache.set(cache_key, value, table=table)
+        if persist and self.disk_cache is not None:
+            self.disk_cache.set(table, cache_key, value)
+
+    def invalidate(self, table=None):
+        """ 
+        Drop cached lookups for `table` (or everything) from memory, snapshot and disk.
+        """
+        self.cache.clear(table)
+
+        if self.snapshot is not None:
+            self.snapshot.invalidate(table)
+        if self.disk_cache is not None:
+            self.disk_cache.invalidate(table)
+
+    def _query(self, table, **kwargs):
+        """ 
+        Single entry point for factor rows. Snapshot tables resolve from memory, anything else goes to the factor store.
+        """
+        if self._in_snapshot(table):
+            return self.snapshot.select(table, **kwargs)
+        return self._get_store().select(table, **kwargs)
+
+    def _query_in(self, table, column, values, **kwargs):
+        """ 
+        Batched `_query`: {value: rows} for every value of `column`, in one `IN` query instead of one query per value.
+        """
+        if self._in_snapshot(table):
+            return self.snapshot.select_in(table, column, values, **kwargs)
+        return self._get_store().select_in(table, column, values, **kwargs)
+
+    def _query_uniques(self, table, column, **kwargs):
+        """ 
+        Distinct values of one column. Outside the snapshot only that column is transferred, not whole rows.
+        """
+        if self._in_snapshot(table):
+            return self.snapshot.uniques(table, column, **kwargs)
+        return self._get_store().uniques(table, column, **kwargs)
+
+    def _get_store(self):
+        return self.store or get_factor_store()
     
-    def _query_and_cache_uniques(self, cache_key, table, column, additional_filters=None):
+    def _lookup(self, table, cache_key, fetch, verbose=True):
         """ 
-        1. Search cache for key. If key, return result. 
-        2. If key not found, use QueryV2 to search TABLE, then COL. 
-        3. From column, sort and filter all available values and return as result. 
+        Memory/disk cache first. On a miss, concurrent callers for the same key share ONE `fetch()` (single-flight).
+        "Not found" (None) and failed lookups are remembered as NegativeResult for NEGATIVE_CACHE_TTL seconds.
         """
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        found, cached = self._cache_get(table, cache_key)
+        if found:
+            if verbose:
+                print(f"{cache_key} discovered, skipping database query")
+            return cached.resolve() if isinstance(cached, NegativeResult) else cached
+        return LOOKUP_FLIGHTS.do(cache_key, lambda: self._fetch_and_cache(table, cache_key, fetch))
+
+    def _fetch_and_cache(self, table, cache_key, fetch):
+        if cache_key in self.cache: # a previous flight finished between our miss and becoming leader
+            found, cached = self.cache.lookup(cache_key, table=table)
+            if found:
+                return cached.resolve() if isinstance(cached, NegativeResult) else cached
+
+        try:
+            value = fetch()
+        except Exception as e:
+            self.cache.set(cache_key, NegativeResult(error=e), table=table, ttl=NEGATIVE_CACHE_TTL)
+            raise
 
-        if additional_filters:
-            records = supabase_query_v2(table=table, **additional_filters)
-        else:
-            records = supabase_query_v2(table=table)
+        if value is None:
+            self.cache.set(cache_key, NegativeResult(), table=table, ttl=NEGATIVE_CACHE_TTL)
+            return None
+        self._cache_set(table, cache_key, value)
+        return value
+    
+    def _lookup_many(self, table, column, values, cache_key_fn, pick, **kwargs):
+        """ 
+        Batched `_lookup`. Cached values are served from memory/disk, all misses resolve in ONE `column IN (...)` query.
 
-        if records not in [[], None]:
-            allowed_values = sorted(list(set(item[column] for item in records)))
+        cache_key_fn: value -> cache key. Must match the single getter so batch and per-row lookups share entries.
+        pick: rows of one value -> result. None or an exception is negatively cached, same as `_lookup`.
+
+        Returns {value: result}. Not found / failed values map to None.
+        """
+        results, missing = {}, {}
+        for value in dict.fromkeys(values):
+            if value is None:
+                continue
+            cache_key = cache_key_fn(value)
+            found, cached = self._cache_get(table, cache_key)
+            if found:
+                results[value] = None if isinstance(cached, NegativeResult) else cached
+            else:
+                missing[value] = cache_key
+
+        if not missing:
+            return results
+
+        grouped = self._query_in(table, column, list(missing.keys()), **kwargs)
+        for value, cache_key in missing.items():
+            try:
+                result = pick(grouped.get(value, []))
+            except Exception as e:
+                self.cache.set(cache_key, NegativeResult(error=e), table=table, ttl=NEGATIVE_CACHE_TTL)
+                result = None
+            else:
+                if result is None:
+                    self.cache.set(cache_key, NegativeResult(), table=table, ttl=NEGATIVE_CACHE_TTL)
+                else:
+                    self._cache_set(table, cache_key, result)
+            results[value] = result
+        return results
+    
+    def _query_and_cache_uniques(self, cache_key, table, column, additional_filters=None):
+        """ 
+        1. Search cache for key. If key, return result. 
+        2. If key not found, query the distinct values of COL in TABLE (only COL is transferred). 
+        3. Sort and filter all available values and return as result. 
+        """
+        def fetch():
+            uniques = self._query_uniques(table, column, **(additional_filters or {}))
+            if uniques in [[], None]:
+                return None
+            allowed_values = sorted(uniques)
             
              # Handle edge case where all values are None
             if allowed_values == [None]:
-                self.cache[cache_key] = None
                 return None
-        
-            self.cache[cache_key] = allowed_values
+            get_category_matcher().get_index(allowed_values) # build the fuzzy matching index once, when the list is cached
             return allowed_values
-        return None
+
+        return self._lookup(table, cache_key, fetch, verbose=False)
     
 
     #--- Get allowed options from column from table
@@ -128,30 +303,22 @@ class S3_Lookup_Cache(BaseModel):
         TABLE = 's3c4_freight_factors'
         CACHE_KEY = self._generate_cache_key(table=TABLE, **kwargs)
         
-        if CACHE_KEY in self.cache:
-            print(f"{CACHE_KEY} discovered, skipping database query")
-            return self.cache[CACHE_KEY]
-        
-        else:
-            records = supabase_query_v2(table=TABLE, **kwargs)
+        def fetch():
+            records = self._query(TABLE, **kwargs)
             first_record = records[0]
-            self.cache[CACHE_KEY] = first_record
             return first_record
+        return self._lookup(TABLE, CACHE_KEY, fetch)
 
 
     def get_fuel_emission_factors(self, fuel_state='liquid', fuel_type='Petroleum'):
         TABLE = f's1sc_{fuel_state}'
         CACHE_KEY = self._generate_cache_key(table=TABLE, fuel_type=fuel_type)
         
-        if CACHE_KEY in self.cache:
-            print(f"{CACHE_KEY} discovered, skipping database query")
-            return self.cache[CACHE_KEY]
-            
-        else:
-            records = supabase_query_v2(table=TABLE, fuel_type=fuel_type)
+        def fetch():
+            records = self._query(TABLE, fuel_type=fuel_type)
             first_record = records[0]
-            self.cache[CACHE_KEY] = first_record
             return first_record
+        return self._lookup(TABLE, CACHE_KEY, fetch)
   
     
     def get_grid_emission_factors(self, table='s2ie_gef', country='malaysia', state=None, energy_provider=None):
@@ -159,62 +326,42 @@ class S3_Lookup_Cache(BaseModel):
         UNIQUE_COUNTRIES_KEY = f"{table}_unique_countries"
         UNIQUE_STATES_KEY = f"{table}_unique_states"
 
-        if CACHE_KEY in self.cache:
-            print(f"{CACHE_KEY} discovered, skipping database query.")
-            return self.cache[CACHE_KEY]
-
-        try:
+        def fetch():
             # Fetch unique countries and states for spell check
-            if UNIQUE_COUNTRIES_KEY not in self.cache:
-                self.cache[UNIQUE_COUNTRIES_KEY] = list(set(row['country'] for row in supabase_query_v2(table=table, select='country')))
-
-            if UNIQUE_STATES_KEY not in self.cache:
-                self.cache[UNIQUE_STATES_KEY] = list(set(row['state'] for row in supabase_query_v2(table=table, select='state')))
-
-            unique_countries = self.cache[UNIQUE_COUNTRIES_KEY]
-            unique_states = self.cache[UNIQUE_STATES_KEY]
+            unique_countries = self._lookup(table, UNIQUE_COUNTRIES_KEY, lambda: self._query_uniques(table, 'country'), verbose=False)
+            unique_states = self._lookup(table, UNIQUE_STATES_KEY, lambda: self._query_uniques(table, 'state'), verbose=False)
             
             # Spell check
-            corrected_country = find_closest_category(country, unique_countries)
-            corrected_state = find_closest_category(state, unique_states)
+            corrected_country = find_closest_category(country, unique_countries, field='country')
+            corrected_state = find_closest_category(state, unique_states, field='state')
 
             # Query the database
-            records = supabase_query_v2(table=table, country=corrected_country, state=corrected_state, energy_provider=energy_provider)
+            records = self._query(table, country=corrected_country, state=corrected_state, energy_provider=energy_provider)
 
             if not records:
-                self.cache[CACHE_KEY] = {}
                 raise Exception(f'No data retrieved. Query: {CACHE_KEY}')
 
             # Sort by year and take the latest entry
             records = sorted(records, key=lambda x: x.get('year', 0) or 0, reverse=True)
             latest_data = records[0] if records else None
-
-            self.cache[CACHE_KEY] = latest_data
             return latest_data
-
-        except Exception as e:
-            self.cache[CACHE_KEY] = {}
-            raise e
+        return self._lookup(table, CACHE_KEY, fetch)
         
           
     def get_waste_emission_factors(self, waste_type='Aluminum Cans', **kwargs):
         TABLE = f's3c5_waste_factors'
         CACHE_KEY = self._generate_cache_key(table=TABLE, waste_type=waste_type, **kwargs)
         
-        if CACHE_KEY in self.cache:
-            print(f"{CACHE_KEY} discovered, skipping database query")
-            return self.cache[CACHE_KEY]
-        
-        else:
-            records = supabase_query_v2(table=TABLE, waste_type=waste_type, **kwargs)
+        def fetch():
+            records = self._query(TABLE, waste_type=waste_type, **kwargs)
             filtered_records = [record for record in records if record.get('kgCO2_unit') is not None]
             
             if not filtered_records:
-                return None
+                return None # negatively cached, bad waste types are not re-queried every row
             
             first_record = filtered_records[0]
-            self.cache[CACHE_KEY] = first_record
             return first_record
+        return self._lookup(TABLE, CACHE_KEY, fetch)
         
 
     def get_vehicle_emission_factors(self, table='s3c6_travel_factors', **kwargs):
@@ -225,15 +372,11 @@ class S3_Lookup_Cache(BaseModel):
         TABLE = table
         CACHE_KEY = self._generate_cache_key(table=TABLE, **kwargs)
         
-        if CACHE_KEY in self.cache:
-            print(f"{CACHE_KEY} discovered, skipping database query")
-            return self.cache[CACHE_KEY]
-        
-        else:
-            records = supabase_query_v2(table=TABLE, **kwargs)
+        def fetch():
+            records = self._query(TABLE, **kwargs)
             first_record = records[0]
-            self.cache[CACHE_KEY] = first_record
-            return first_record   
+            return first_record
+        return self._lookup(TABLE, CACHE_KEY, fetch)
         
 
     def get_refrigerant_gwp(self, refrigerant_type, **kwargs):
@@ -245,14 +388,51 @@ class S3_Lookup_Cache(BaseModel):
         TABLE='ghg_refrigerants_gwp_v2'
         CACHE_KEY = self._generate_cache_key(table=TABLE, ashrae_number=refrigerant_type, **kwargs)
         
-        if CACHE_KEY in self.cache:
-            print(f"{CACHE_KEY} discovered, skipping database query")
-            return self.cache[CACHE_KEY]
-        
-        else:
-            records = supabase_query_v2(table=TABLE, ashrae_number=refrigerant_type, **kwargs)
+        def fetch():
+            records = self._query(TABLE, ashrae_number=refrigerant_type, **kwargs)
             first_record = records[0]
-            self.cache[CACHE_KEY] = first_record
             return first_record
-        
-        
\ No newline at end of file
+        return self._lookup(TABLE, CACHE_KEY, fetch)
+
+    #--- Batched emission factors ---#
+    # Same cache keys as the single getters above. Returns {key value: factors}, None where not found.
+    def get_fuel_emission_factors_batch(self, fuel_types, fuel_state='liquid'):
+        TABLE = f's1sc_{fuel_state}'
+        return self._lookup_many(TABLE, 'fuel_type', fuel_types, lambda v: self._generate_cache_key(table=TABLE, fuel_type=v), lambda rows: rows[0])
+
+
+    def get_freight_emission_factors_batch(self, freight_types):
+        TABLE = 's3c4_freight_factors'
+        return self._lookup_many(TABLE, 'freight_type', freight_types, lambda v: self._generate_cache_key(table=TABLE, freight_type=v), lambda rows: rows[0])
+
+
+    def get_vehicle_emission_factors_batch(self, vehicle_types, table='s3c6_travel_factors'):
+        TABLE = table
+        return self._lookup_many(TABLE, 'vehicle_type', vehicle_types, lambda v: self._generate_cache_key(table=TABLE, vehicle_type=v), lambda rows: rows[0])
+
+
+    def get_waste_emission_factors_batch(self, waste_types, **kwargs):
+        TABLE = 's3c5_waste_factors'
+
+        def pick(rows):
+            filtered_records = [record for record in rows if record.get('kgCO2_unit') is not None]
+            return filtered_records[0] if filtered_records else None
+        return self._lookup_many(TABLE, 'waste_type', waste_types, lambda v: self._generate_cache_key(table=TABLE, waste_type=v, **kwargs), pick, **kwargs)
+
+
+    def get_refrigerant_gwp_batch(self, refrigerant_types):
+        TABLE = 'ghg_refrigerants_gwp_v2'
+        return self._lookup_many(TABLE, 'ashrae_number', refrigerant_types, lambda v: self._generate_cache_key(table=TABLE, ashrae_number=v), lambda rows: rows[0])
+
+_SHARED_S3_CACHE = None
+_SHARED_S3_CACHE_LOCK = threading.Lock()
+
+def get_shared_s3_cache() -> S3_Lookup_Cache:
+    """
+    One lookup cache (and snapshot) for the whole server. Pages keep it under their own session keys, but every session points at the same instance.
+    """
+    global _SHARED_S3_CACHE
+    with _SHARED_S3_CACHE_LOCK:
+        if _SHARED_S3_CACHE is None:
+            _SHARED_S3_CACHE = S3_Lookup_Cache(snapshot_mode=True, disk_cache=get_factor_disk_cache())
+        return _SHARED_S3_CACHE
@@ -1,18 +1,22 @@
 import streamlit as st
 
 import random
+import pandas as pd
 from datetime import datetime
 from uuid import uuid4
 
 from pydantic import BaseModel, Field
 from pydantic import model_validator
-from typing import Optional, Dict, Union, Any
+from typing import Optional, Dict, List, Union, Any
 
 from supabase import create_client
-from utils.ghg_utils import get_relevant_factors, calculate_co2e
+from utils.ghg_utils import get_relevant_factors, calculate_co2e, calculate_gases, add_gases
 from utils.s3vc_Misc.s3_models import *
 from utils.s3vc_Misc.s3_creators import *
 from utils.s3vc_Misc.s3_cache import S3_Lookup_Cache
+from utils.result_store import new_result_store
+from utils.emission_aggregates import EmissionAggregates, shown_emissions, remove_rows
+from utils.gas_ledger import GasLedger, gwp_best_emissions, gwp_total_emissions
 
 
 
@@ -24,11 +28,15 @@ class S3_Calculator(BaseModel):
     calculated_emissions: Optional[Dict] = None
     best_emissions: Dict[str,float] = {}
     total_emissions: float = 0.0
+    aggregates: Optional[Any] = None # EmissionAggregates, running totals by category, scope and date
+    gas_emissions: Optional[Any] = None # GasLedger, per gas split of the results for other GWP sets
       
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.cache = self.cache or {}
-        self.calculated_emissions = self.calculated_emissions or {}
+        self.calculated_emissions = self.calculated_emissions or new_result_store()
+        self.aggregates = self.aggregates if self.aggregates is not None else EmissionAggregates()
+        self.gas_emissions = self.gas_emissions or GasLedger()
 
     def add_data(self, data: S3_BaseModel):
         try:
@@ -42,19 +50,72 @@ class S3_Calculator(BaseModel):
                 return
             
             # Create emission result dict
+            gases = res.pop('gases', None) # kept in the gas ledger, not in the stored result
             emission_result = res
-            idx = len(self.calculated_emissions)
+            idx = self.aggregates.next_key()
             self.calculated_emissions[idx] = {'input_data': data.model_dump(), 'calculated_emissions': emission_result}
+            if gases:
+                self.gas_emissions.add(idx, data.uuid, emission_result['metadata'], gases, default_gwp=self._refrigerant_gwp)
+
+            # Update best_quality_emissions, total_emissions and the running aggregates
+            self._update_emissions_summary(idx, category=type(data).__name__)
             
         except TypeError as te:
             print(te)
         except Exception as e:
             raise e
+
+    def add_many(self, data_list: List[S3_BaseModel]) -> Dict[int, Exception]:
+        """
+        Batch `add_data`, entries are stored in input order.
+        Categories in VECTOR_CALCULATORS are calculated column-wise, one `calculate_frame` pass per category.
+        Everything else, and rows the columnar pass hands back, go through `add_data`.
+        Returns {position in data_list: exception} for rows that failed.
+        """
+        from utils.s3vc_Misc.s3_vectorized import VECTOR_CALCULATORS, calculate_frame # s3_vectorized imports this module
+
+        positions = {}
+        for i, data in enumerate(data_list):
+            if type(data) in VECTOR_CALCULATORS:
+                positions.setdefault(type(data), []).append(i)
+
+        records, results = {}, {}
+        for model, model_positions in positions.items():
+            model_records = [data_list[i].model_dump() for i in model_positions]
+            model_results = calculate_frame(model, pd.DataFrame(model_records), self.cache)
+            records.update(zip(model_positions, model_records))
+            results.update(zip(model_positions, model_results))
+
+        errors = {}
+        total_emissions = self.total_emissions # summed locally, same order as _update_emissions_summary
+        for i, data in enumerate(data_list):
+            if results.get(i) is None:
+                self.total_emissions = total_emissions
+                try:
+                    self.add_data(data)
+                except Exception as e:
+                    errors[i] = e
+                total_emissions = self.total_emissions
+                continue
+
+            gases = results[i].pop('gases', None)
+            idx = self.aggregates.next_key()
+            self.calculated_emissions[idx] = {'input_data': records[i], 'calculated_emissions': results[i]}
+            if gases:
+                self.gas_emissions.add(idx, records[i]['uuid'], results[i]['metadata'], gases, default_gwp=self._refrigerant_gwp)
+
+            metadata = results[i]['metadata']
+            emissions = min(metadata, key=lambda x: x['data_quality'])['amount'] if metadata else None
+            self.aggregates.add(idx, records[i]['uuid'], type(data).__name__, records[i].get('date'), emissions, shown_emissions(results[i]))
+            if not metadata:
+                print("An error occurred: Metadata is empty")
+                continue
+            self.best_emissions[records[i]['uuid']] = emissions
+            total_emissions += emissions
+
+        self.total_emissions = total_emissions
+        return errors
             
-        # Update best_quality_emissions and total_emissions
-        self._update_emissions_summary()
-            
-        
     def _calculate_emissions(self, data: S3_BaseModel, cache):
         if isinstance(data, (S3C1_PurchasedGoods)):
             res = calc_S3C1_PurchasedGoods(data)
@@ -103,10 +164,12 @@ class S3_Calculator(BaseModel):
             print(f'data {data} not in expected data type. Unable to calculate')
         return res
 
-    def _update_emissions_summary(self):
+    def _update_emissions_summary(self, idx, category=None):
+        entry = self.calculated_emissions[idx]
+        data_uuid = entry['input_data']['uuid']
+        emissions = None
         try:
-            data_uuid = self.calculated_emissions[len(self.calculated_emissions) - 1]['input_data']['uuid']
-            metadata = self.calculated_emissions[len(self.calculated_emissions) - 1]['calculated_emissions']['metadata']
+            metadata = entry['calculated_emissions']['metadata']
 
             if not metadata:
                 raise ValueError("Metadata is empty")
@@ -121,11 +184,25 @@ class S3_Calculator(BaseModel):
         except ValueError as e:
             print(f"An error occurred: {e}")
 
-    def get_emissions(self) -> Dict[str, float]:
-        return self.best_emissions
+        self.aggregates.add(idx, data_uuid, category, entry['input_data'].get('date'), emissions, shown_emissions(entry['calculated_emissions']))
+
+    def remove_data(self, data_uuid: str) -> int:
+        """Remove every row of `data_uuid`, EG: a row deleted or corrected after upload. Only those rows leave the totals. Returns the number of rows removed."""
+        return remove_rows(self, data_uuid)
+
+    def replace_data(self, data: S3_BaseModel):
+        """Recalculate the row of `data.uuid` from `data`, EG: a corrected row of a re-uploaded file."""
+        self.remove_data(data.uuid)
+        self.add_data(data)
+
+    def _refrigerant_gwp(self, refrigerant_type) -> float:
+        return self.cache.get_refrigerant_gwp(refrigerant_type=refrigerant_type)['gwp_100']
+
+    def get_emissions(self, gwp_set: Optional[str] = None) -> Dict[str, float]:
+        return gwp_best_emissions(self, gwp_set)
 
-    def get_total_emissions(self) -> float:
-        return self.total_emissions
+    def get_total_emissions(self, gwp_set: Optional[str] = None) -> float:
+        return gwp_total_emissions(self, gwp_set)
 
 
 
@@ -230,6 +307,7 @@ def calc_S3C4_UpstreamTransport(data: S3C4_UpstreamTransport, cache):
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
     
     f1 = ['distance_traveled', 'distance_unit', 'freight_type']
     if all(getattr(data, field, None) is not None for field in f1): 
@@ -247,6 +325,7 @@ def calc_S3C4_UpstreamTransport(data: S3C4_UpstreamTransport, cache):
         
         relevant_factors =  get_relevant_factors(factors, unit='unit')
         total_co2e = calculate_co2e(relevant_factors, unit_value=unit_value)
+        gases['distance_based_emissions'] = calculate_gases(relevant_factors, unit_value=unit_value)
         
         emission_result['distance_based_emissions'] = total_co2e
         data_quality -= 1
@@ -257,18 +336,20 @@ def calc_S3C4_UpstreamTransport(data: S3C4_UpstreamTransport, cache):
         factors = cache.get_fuel_emission_factors(fuel_type=data.fuel_type)
         relevant_factors =  get_relevant_factors(factors, unit=data.fuel_unit)
         total_co2e = calculate_co2e(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit)    
+        gases['use_based_emissions'] = calculate_gases(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit)
 
         emission_result['use_based_emissions'] = total_co2e
         data_quality -= 2
         metadata.append( create_metadata('use_based_emissions', total_co2e, f2, data_quality) )
         
-    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
 
     
 def calc_S3C5_WasteGenerated(data:S3C5_WasteGenerated, cache):
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
     
     f1 = ['waste_type', 'waste_quantity']
     if all(getattr(data, field, None) is not None for field in f1): 
@@ -284,18 +365,20 @@ def calc_S3C5_WasteGenerated(data:S3C5_WasteGenerated, cache):
         else:
             relevant_factors =  get_relevant_factors(factors, unit='unit')        
             total_co2e = calculate_co2e(relevant_factors, unit_value=data.waste_quantity)
+            gases['physical_emissions'] = calculate_gases(relevant_factors, unit_value=data.waste_quantity)
 
         emission_result['physical_emissions'] = total_co2e
         data_quality -= 1
         metadata.append( create_metadata('physical_emissions', total_co2e, f1, data_quality) )
 
-    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
 
 
 def calc_S3C6_BusinessTravel(data: Union[S3C6_1_BusinessTravel, S3C6_2_BusinessStay], cache):
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
 
     if isinstance(data, S3C6_2_BusinessStay):
         try:
@@ -303,7 +386,7 @@ def calc_S3C6_BusinessTravel(data: Union[S3C6_1_BusinessTravel, S3C6_2_BusinessS
             total_co2e = data.no_of_nights * data.hotel_emission_factor
             emission_result['reported_emissions_1'] = total_co2e
             metadata.append( create_metadata('reported_emissions_1', total_co2e, f1, data_quality) )
-            return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+            return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
         except:
             raise
     
@@ -315,6 +398,7 @@ def calc_S3C6_BusinessTravel(data: Union[S3C6_1_BusinessTravel, S3C6_2_BusinessS
             factors = cache.get_vehicle_emission_factors(table=TABLE, vehicle_type=data.vehicle_type)
             relevant_factors =  get_relevant_factors(factors, unit='unit')
             total_co2e = calculate_co2e(relevant_factors, unit_value=data.distance_traveled)
+            gases['distance_based_emissions'] = calculate_gases(relevant_factors, unit_value=data.distance_traveled)
         
             emission_result['distance_based_emissions'] = total_co2e
             data_quality -= 1
@@ -325,18 +409,20 @@ def calc_S3C6_BusinessTravel(data: Union[S3C6_1_BusinessTravel, S3C6_2_BusinessS
             factors = cache.get_fuel_emission_factors(fuel_type=data.fuel_type)
             relevant_factors =  get_relevant_factors(factors, unit=data.fuel_unit)
             total_co2e = calculate_co2e(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit)    
+            gases['use_based_emissions'] = calculate_gases(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit)
 
             emission_result['use_based_emissions'] = total_co2e
             data_quality -= 1
             metadata.append( create_metadata('use_based_emissions', total_co2e, f2, data_quality) )
 
-        return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+        return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
 
  
 def calc_S3C7_EmployeeCommute(data:S3C7_EmployeeCommute, cache):
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
 
     f1 = ['vehicle_type', 'distance_traveled', 'frequency', 'sampled_days']    
     if all(getattr(data, field, None) is not None for field in f1): 
@@ -352,17 +438,19 @@ def calc_S3C7_EmployeeCommute(data:S3C7_EmployeeCommute, cache):
             total_distance = total_distance * data.sampled_days
 
         total_co2e = calculate_co2e(relevant_factors, unit_value=total_distance)
+        gases['distance_based_emissions'] = calculate_gases(relevant_factors, unit_value=total_distance)
         emission_result['distance_based_emissions'] = total_co2e
         data_quality -= 1
         metadata.append( create_metadata('distance_based_emissions', total_co2e, f1, data_quality) )    
 
-    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
 
 
 def calc_S3C8_UpstreamLeased(data: Union[S3C8_1_UpstreamLeasedEstate, S3C8_2_UpstreamLeasedAuto], cache):
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
 
     if isinstance(data, S3C8_1_UpstreamLeasedEstate):  
         if getattr(data, 'electric_use', None) is not None:
@@ -388,6 +476,7 @@ def calc_S3C8_UpstreamLeased(data: Union[S3C8_1_UpstreamLeasedEstate, S3C8_2_Ups
                     refrigerant_gwp = factors['gwp_100']
                     refrigerant_co2e = data.refrigerant_use * refrigerant_gwp
                     total_co2e += refrigerant_co2e
+                    gases['physical_emissions'] = {data.refrigerant_type: data.refrigerant_use}
                 
                 # Update results
                 emission_result['physical_emissions'] = total_co2e
@@ -405,6 +494,7 @@ def calc_S3C8_UpstreamLeased(data: Union[S3C8_1_UpstreamLeasedEstate, S3C8_2_Ups
     else:
         fields = []
         total_co2e = 0
+        physical_gases = {}
         physical_available = False
 
         f1 = ['fuel_use', 'fuel_type', 'fuel_unit']
@@ -413,6 +503,7 @@ def calc_S3C8_UpstreamLeased(data: Union[S3C8_1_UpstreamLeasedEstate, S3C8_2_Ups
             factors = cache.get_fuel_emission_factors(fuel_type=data.fuel_type)
             relevant_factors =  get_relevant_factors(factors, unit=data.fuel_unit)
             co2e = calculate_co2e(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit)
+            physical_gases = add_gases(physical_gases, calculate_gases(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit))
             fields += f1
             total_co2e += co2e
 
@@ -422,10 +513,12 @@ def calc_S3C8_UpstreamLeased(data: Union[S3C8_1_UpstreamLeasedEstate, S3C8_2_Ups
             factors = cache.get_refrigerant_gwp(refrigerant_type=data.refrigerant_type)
             refrigerant_gwp = factors['gwp_100']
             refrigerant_co2e = data.refrigerant_use * refrigerant_gwp
+            physical_gases = add_gases(physical_gases, {data.refrigerant_type: data.refrigerant_use})
             fields += f2
             total_co2e += refrigerant_co2e
 
         if physical_available:
+            gases['physical_emissions'] = physical_gases
             emission_result['physical_emissions'] = total_co2e
             data_quality -= 2
             metadata.append( create_metadata('physical_emissions', total_co2e, fields, data_quality) )
@@ -438,13 +531,14 @@ def calc_S3C8_UpstreamLeased(data: Union[S3C8_1_UpstreamLeasedEstate, S3C8_2_Ups
             data_quality = 1.5
             metadata.append( create_metadata('reported_emissions', total_co2e, f3, data_quality) )   
 
-    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
 
 
 def calc_S3C9_DownstreamTransport(data: S3C9_DownstreamTransport, cache):
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
 
     f1 = ['distance_traveled', 'distance_unit', 'freight_type']
     if all(getattr(data, field, None) is not None for field in f1): 
@@ -461,6 +555,7 @@ def calc_S3C9_DownstreamTransport(data: S3C9_DownstreamTransport, cache):
         
         relevant_factors =  get_relevant_factors(factors, unit='unit')
         total_co2e = calculate_co2e(relevant_factors, unit_value=unit_value)
+        gases['distance_based_emissions'] = calculate_gases(relevant_factors, unit_value=unit_value)
         
         emission_result['distance_based_emissions'] = total_co2e
         data_quality -= 1
@@ -471,21 +566,24 @@ def calc_S3C9_DownstreamTransport(data: S3C9_DownstreamTransport, cache):
         factors = cache.get_fuel_emission_factors(fuel_type=data.fuel_type)
         relevant_factors =  get_relevant_factors(factors, unit=data.fuel_unit)
         total_co2e = calculate_co2e(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit)    
+        gases['use_based_emissions'] = calculate_gases(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit)
 
         emission_result['use_based_emissions'] = total_co2e
         data_quality -= 2
         metadata.append( create_metadata('use_based_emissions', total_co2e, f2, data_quality) )
 
-    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
 
 
 def calc_S3C10_ProcessingProducts(data: S3C10_ProcessingProducts, cache):
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
 
     fields = []
     total_co2e = 0
+    physical_gases = {}
     physical_available = False
 
     f1 = ['fuel_use', 'fuel_type', 'fuel_unit']
@@ -494,6 +592,7 @@ def calc_S3C10_ProcessingProducts(data: S3C10_ProcessingProducts, cache):
         factors = cache.get_fuel_emission_factors(fuel_type=data.fuel_type)
         relevant_factors =  get_relevant_factors(factors, unit=data.fuel_unit)
         co2e = calculate_co2e(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit)
+        physical_gases = add_gases(physical_gases, calculate_gases(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit))
         fields += f1
         total_co2e += co2e
 
@@ -503,6 +602,7 @@ def calc_S3C10_ProcessingProducts(data: S3C10_ProcessingProducts, cache):
         factors = cache.get_refrigerant_gwp(refrigerant_type=data.refrigerant_type)
         refrigerant_gwp = factors['gwp_100']
         refrigerant_co2e = data.refrigerant_use * refrigerant_gwp
+        physical_gases = add_gases(physical_gases, {data.refrigerant_type: data.refrigerant_use})
         fields += f2
         total_co2e += refrigerant_co2e
 
@@ -514,6 +614,7 @@ def calc_S3C10_ProcessingProducts(data: S3C10_ProcessingProducts, cache):
         total_co2e += co2e  
 
     if physical_available:
+        gases['physical_emissions'] = physical_gases
         emission_result['physical_emissions'] = total_co2e
         data_quality -= 2
         metadata.append( create_metadata('physical_emissions', total_co2e, fields, data_quality) )
@@ -526,16 +627,18 @@ def calc_S3C10_ProcessingProducts(data: S3C10_ProcessingProducts, cache):
         data_quality = 1.5
         metadata.append( create_metadata('reported_emissions', total_co2e, f4, data_quality) )  
 
-    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
 
 
 def calc_S3C11_UseOfSold(data:S3C11_UseOfSold, cache):
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
 
     fields = []
     total_co2e = 0
+    physical_gases = {}
     physical_available = False
 
     f1 = ['lifetime_usage_freq', 'number_sold']
@@ -549,6 +652,7 @@ def calc_S3C11_UseOfSold(data:S3C11_UseOfSold, cache):
             factors = cache.get_fuel_emission_factors(fuel_type=data.fuel_type)
             relevant_factors =  get_relevant_factors(factors, unit=data.fuel_unit)
             co2e = sum_use * calculate_co2e(relevant_factors, unit_value=data.fuel_per_use, unit_of_interest=data.fuel_unit)
+            physical_gases = add_gases(physical_gases, calculate_gases(relevant_factors, unit_value=sum_use * data.fuel_per_use, unit_of_interest=data.fuel_unit))
 
             fields += f2
             total_co2e += co2e  
@@ -566,21 +670,24 @@ def calc_S3C11_UseOfSold(data:S3C11_UseOfSold, cache):
             factors = cache.get_refrigerant_gwp(refrigerant_type=data.refrigerant_type)
             refrigerant_gwp = factors['gwp_100']
             co2e = sum_use * data.refrigerant_per_use * refrigerant_gwp
+            physical_gases = add_gases(physical_gases, {data.refrigerant_type: sum_use * data.refrigerant_per_use})
             fields += f4
             total_co2e += co2e
 
     if physical_available:
+        gases['physical_emissions'] = physical_gases
         emission_result['physical_emissions'] = total_co2e
         data_quality -= 2
         metadata.append( create_metadata('physical_emissions', total_co2e, fields, data_quality) )
   
-    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
 
 
 def calc_S3C12_EOLTreatment(data: S3C12_EOLTreatment, cache):
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
 
     f1 = ['waste_type', 'waste_quantity']
     if all(getattr(data, field, None) is not None for field in f1): 
@@ -593,18 +700,20 @@ def calc_S3C12_EOLTreatment(data: S3C12_EOLTreatment, cache):
 
         relevant_factors =  get_relevant_factors(factors, unit='unit')
         total_co2e = calculate_co2e(relevant_factors, unit_value=data.waste_quantity)
+        gases['physical_emissions'] = calculate_gases(relevant_factors, unit_value=data.waste_quantity)
 
         emission_result['physical_emissions'] = total_co2e
         data_quality -= 1
         metadata.append( create_metadata('physical_emissions', total_co2e, f1, data_quality) )
 
-    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
 
 
 def calc_S3C13_DownstreamLeased(data: Union[S3C13_1_DownstreamLeasedEstate, S3C13_2_DownstreamLeasedAuto], cache):
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
 
     if isinstance(data, S3C13_1_DownstreamLeasedEstate):  
         if getattr(data, 'electric_use', None) is not None:
@@ -630,6 +739,7 @@ def calc_S3C13_DownstreamLeased(data: Union[S3C13_1_DownstreamLeasedEstate, S3C1
                     refrigerant_gwp = factors['gwp_100']
                     refrigerant_co2e = data.refrigerant_use * refrigerant_gwp
                     total_co2e += refrigerant_co2e
+                    gases['physical_emissions'] = {data.refrigerant_type: data.refrigerant_use}
                 
                 # Update results
                 emission_result['physical_emissions'] = total_co2e
@@ -647,6 +757,7 @@ def calc_S3C13_DownstreamLeased(data: Union[S3C13_1_DownstreamLeasedEstate, S3C1
     else:
         fields = []
         total_co2e = 0
+        physical_gases = {}
         physical_available = False
 
         f1 = ['fuel_use', 'fuel_type', 'fuel_unit']
@@ -655,6 +766,7 @@ def calc_S3C13_DownstreamLeased(data: Union[S3C13_1_DownstreamLeasedEstate, S3C1
             factors = cache.get_fuel_emission_factors(fuel_type=data.fuel_type)
             relevant_factors =  get_relevant_factors(factors, unit=data.fuel_unit)
             co2e = calculate_co2e(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit)
+            physical_gases = add_gases(physical_gases, calculate_gases(relevant_factors, unit_value=data.fuel_use, unit_of_interest=data.fuel_unit))
             fields += f1
             total_co2e += co2e
 
@@ -664,10 +776,12 @@ def calc_S3C13_DownstreamLeased(data: Union[S3C13_1_DownstreamLeasedEstate, S3C1
             factors = cache.get_refrigerant_gwp(refrigerant_type=data.refrigerant_type)
             refrigerant_gwp = factors['gwp_100']
             refrigerant_co2e = data.refrigerant_use * refrigerant_gwp
+            physical_gases = add_gases(physical_gases, {data.refrigerant_type: data.refrigerant_use})
             fields += f2
             total_co2e += refrigerant_co2e
 
         if physical_available:
+            gases['physical_emissions'] = physical_gases
             emission_result['physical_emissions'] = total_co2e
             data_quality -= 2
             metadata.append( create_metadata('physical_emissions', total_co2e, fields, data_quality) )
@@ -680,13 +794,14 @@ def calc_S3C13_DownstreamLeased(data: Union[S3C13_1_DownstreamLeasedEstate, S3C1
             data_quality = 1.5
             metadata.append( create_metadata('reported_emissions', total_co2e, f3, data_quality) )  
 
-    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
 
 
 def calc_S3C14_Franchise(data: S3C14_Franchise, cache):
     emission_result={}
     data_quality=5
     metadata=[]
+    gases={}
 
     fields = []
     total_co2e = 0
@@ -715,6 +830,7 @@ def calc_S3C14_Franchise(data: S3C14_Franchise, cache):
                 refrigerant_gwp = factors['gwp_100']
                 refrigerant_co2e = data.refrigerant_use * refrigerant_gwp
                 total_co2e += refrigerant_co2e
+                gases['physical_emissions'] = {data.refrigerant_type: data.refrigerant_use}
             
             # Update results
             emission_result['physical_emissions'] = total_co2e
@@ -726,6 +842,7 @@ def calc_S3C14_Franchise(data: S3C14_Franchise, cache):
         factors = cache.get_refrigerant_gwp(refrigerant_type=data.refrigerant_type)
         refrigerant_gwp = factors['gwp_100']
         co2e = data.refrigerant_use * refrigerant_gwp
+        gases['physical_emissions'] = add_gases(gases.get('physical_emissions', {}), {data.refrigerant_type: data.refrigerant_use})
 
         physical_available = True
         fields += f2
@@ -744,7 +861,7 @@ def calc_S3C14_Franchise(data: S3C14_Franchise, cache):
         data_quality = 1.5
         metadata.append( create_metadata('reported_emissions', total_co2e, f3, data_quality) )      
 
-    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata}
+    return {'emission_result': emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases}
 
 
 #--
@@ -32,7 +32,7 @@ def verify_and_correct(row:dict, field_name:str, allowed_values:list, abbrv_dict
     value = row.get(field_name)
 
     if value not in allowed_values:
-        corrected_value = find_closest_category(value, allowed_values, abbrv_dict=abbrv_dict)
+        corrected_value = find_closest_category(value, allowed_values, abbrv_dict=abbrv_dict, field=field_name)
         if corrected_value is not None:
             print(f'Field "{field_name}" input "{value}" suggested values is "{corrected_value}"')
             return corrected_value
@@ -225,12 +225,12 @@ def create_s3c8_1_data(row, Model:S3C8_1_UpstreamLeasedEstate, geolocator=None,
 
         # Correct country and state using abbreviation mapping and fuzzy matching
         if 'country' in row and row['country'] is not None:
-            corrected_country = find_closest_category(row['country'], cache.get_allowed_countries(), abbrv_dict=LOCATION_ABBRV)
+            corrected_country = find_closest_category(row['country'], cache.get_allowed_countries(), abbrv_dict=LOCATION_ABBRV, field='country')
             row['country'] = corrected_country if corrected_country else None
 
         if 'state' in row and row['state'] is not None:
             valid_states = cache.get_allowed_states(country=row['country'])
-            corrected_state = find_closest_category(row['state'], valid_states, abbrv_dict=LOCATION_ABBRV)
+            corrected_state = find_closest_category(row['state'], valid_states, abbrv_dict=LOCATION_ABBRV, field='state')
             row['state'] = corrected_state if corrected_state else None
 
         
@@ -378,12 +378,12 @@ def create_s3c13_1_data(row, Model:S3C13_1_DownstreamLeasedEstate, geolocator:Ge
 
         # Correct country and state using abbreviation mapping and fuzzy matching
         if 'country' in row and row['country'] is not None:
-            corrected_country = find_closest_category(row['country'], cache.get_allowed_countries(), abbrv_dict=LOCATION_ABBRV)
+            corrected_country = find_closest_category(row['country'], cache.get_allowed_countries(), abbrv_dict=LOCATION_ABBRV, field='country')
             row['country'] = corrected_country if corrected_country else None
 
         if 'state' in row and row['state'] is not None:
             valid_states = cache.get_allowed_states(country=row['country'])
-            corrected_state = find_closest_category(row['state'], valid_states, abbrv_dict=LOCATION_ABBRV)
+            corrected_state = find_closest_category(row['state'], valid_states, abbrv_dict=LOCATION_ABBRV, field='state')
             row['state'] = corrected_state if corrected_state else None
 
         
@@ -439,12 +439,12 @@ def create_s3c14_data(row, Model:S3C14_Franchise, geolocator=None, cache=None, *
 
         # Correct country and state using abbreviation mapping and fuzzy matching
         if 'country' in row and row['country'] is not None:
-            corrected_country = find_closest_category(row['country'], cache.get_allowed_countries(), abbrv_dict=LOCATION_ABBRV)
+            corrected_country = find_closest_category(row['country'], cache.get_allowed_countries(), abbrv_dict=LOCATION_ABBRV, field='country')
             row['country'] = corrected_country if corrected_country else None
 
         if 'state' in row and row['state'] is not None:
             valid_states = cache.get_allowed_states(country=row['country'])
-            corrected_state = find_closest_category(row['state'], valid_states, abbrv_dict=LOCATION_ABBRV)
+            corrected_state = find_closest_category(row['state'], valid_states, abbrv_dict=LOCATION_ABBRV, field='state')
             row['state'] = corrected_state if corrected_state else None
 
         
@@ -0,0 +1,149 @@
+import threading
+from typing import Optional, Dict, List, Tuple, Any
+from utils.factor_store import get_factor_store
+
+
+"""
+Usage:
+  In-memory snapshot of the emission factor tables. Each table is pulled ONCE in a single bulk fetch,
+  then held in memory with hash indexes on its lookup columns. Lookups after the first fetch never touch the network.
+
+snap = FactorSnapshot()
+snap.select('s1sc_liquid', fuel_type='Diesel') >> [{'fuel_type': 'Diesel', ...}]
+snap.uniques('s3c5_waste_factors', 'waste_treatment_method', waste_type='Glass') >> ['Landfilled', 'Recycled', ...]
+"""
+
+#-----
+# Tables
+#-----
+# table name: lookup columns that are indexed right after the bulk fetch.
+# Filters on any other column combination get their index built lazily on first use.
+FACTOR_TABLES = {
+    's1sc_liquid': [('fuel_type',)],
+    's1sc_gas': [('fuel_type',)],
+    's1sc_solid': [('fuel_type',)],
+    's1mc_v2': [('vehicle_type',)],
+    's3c6_travel_factors': [('vehicle_type',)],
+    's3c4_freight_factors': [('freight_type',)],
+    's3c5_waste_factors': [('waste_type',), ('waste_treatment_method', 'waste_type')],
+    'ghg_refrigerants_gwp_v2': [('ashrae_number',)],
+    's2ie_gef': [('country', 'state'), ('country', 'energy_provider', 'state')],
+    'locations_country_code': [],
+    'locations_states': [('country_name',)],
+}
+
+
+#-----
+# Snapshot
+#-----
+class FactorSnapshot:
+    TABLE_KEY = '__table__' # disk cache key holding a whole table
+
+    def __init__(self, tables: Optional[List[str]] = None, records: Optional[Dict[str, List[dict]]] = None, disk_cache=None, store=None):
+        """
+        tables:
+          Tables served by this snapshot. Defaults to every table in FACTOR_TABLES.
+
+        records:
+          Optional pre-fetched rows per table. Tables not provided are bulk fetched lazily on first access.
+
+        disk_cache:
+          Optional FactorDiskCache. Whole tables are read from / written to it, so cold starts load from local disk.
+
+        store:
+          FactorStore to bulk fetch from. Defaults to the process-wide store, see utils.factor_store.
+        """
+        self.tables = list(tables) if tables is not None else list(FACTOR_TABLES.keys())
+        self.disk_cache = disk_cache
+        self.store = store
+        self._records: Dict[str, List[dict]] = {}
+        self._indexes: Dict[Tuple[str, Tuple[str, ...]], Dict[tuple, List[dict]]] = {}
+        self._lock = threading.RLock() # snapshot is shared across sessions, one loader per table
+
+        for table, rows in (records or {}).items():
+            self._load(table, rows)
+
+    def __contains__(self, table):
+        return table in self.tables
+
+    def __repr__(self):
+        return f"<FactorSnapshot: {len(self._records)}/{len(self.tables)} tables loaded, {sum(len(r) for r in self._records.values())} rows>"
+
+    #--Loading--#
+    def _fetch(self, table) -> List[dict]:
+        """Single bulk fetch for the whole table. Served from the disk cache when available."""
+        if self.disk_cache is not None:
+            found, rows = self.disk_cache.get(table, self.TABLE_KEY)
+            if found:
+                return rows
+
+        rows = (self.store or get_factor_store()).select(table, limit=None)
+        if self.disk_cache is not None and rows:
+            self.disk_cache.set(table, self.TABLE_KEY, rows)
+        return rows
+
+    def _load(self, table, rows):
+        self._records[table] = list(rows)
+        for columns in FACTOR_TABLES.get(table, []):
+            self._build_index(table, tuple(sorted(columns)))
+
+    def _build_index(self, table, columns):
+        index = {}
+        for record in self._records[table]:
+            key = tuple(record.get(col) for col in columns)
+            index.setdefault(key, []).append(record) # keeps fetch order, so "first record" matches the database query
+        self._indexes[(table, columns)] = index
+        return index
+
+    def load(self, tables: Optional[List[str]] = None):
+        """Eagerly bulk fetch tables that have not been loaded yet."""
+        for table in tables or self.tables:
+            self.records(table)
+        return self
+
+    def invalidate(self, table: Optional[str] = None):
+        """Forget loaded rows so the next access bulk fetches again."""
+        with self._lock:
+            tables = [table] if table is not None else list(self._records.keys())
+            for tbl in tables:
+                self._records.pop(tbl, None)
+                for index_key in [k for k in self._indexes if k[0] == tbl]:
+                    del self._indexes[index_key]
+
+    def export(self) -> Dict[str, List[dict]]:
+        """Rows of every loaded table, EG: to build `FactorSnapshot(records=...)` in another process."""
+        with self._lock:
+            return {table: list(rows) for table, rows in self._records.items()}
+
+    def records(self, table) -> List[dict]:
+        if table not in self._records:
+            with self._lock:
+                if table not in self._records:
+                    print(f'Snapshot bulk loading `{table}`...')
+                    self._load(table, self._fetch(table))
+        return self._records[table]
+
+    #--Lookup--#
+    def select(self, table, **filters) -> List[dict]:
+        """
+        Equivalent of `FactorStore.select(table, **filters)` served from memory.
+        None filters are skipped, same as the database query.
+        """
+        records = self.records(table)
+        filters = {k: v for k, v in filters.items() if v is not None}
+        if not filters:
+            return records
+
+        columns = tuple(sorted(filters.keys()))
+        index = self._indexes.get((table, columns))
+        if index is None:
+            with self._lock:
+                index = self._build_index(table, columns)
+        return index.get(tuple(filters[col] for col in columns), [])
+
+    def select_in(self, table, column, values, **filters) -> Dict[Any, List[dict]]:
+        """Batched `select`: rows for each of `values` in `column`, grouped by value."""
+        return {value: self.select(table, **{**filters, column: value}) for value in dict.fromkeys(values) if value is not None}
+
+    def uniques(self, table, column, **filters) -> List[Any]:
+        return list(set(record.get(column) for record in self.select(table, **filters)))
@@ -0,0 +1,412 @@
+import gc
+from typing import Optional, Dict, List, Tuple, Callable, Any
+
+import numpy as np
+import pandas as pd
+
+from utils.ghg_utils import get_relevant_factors, co2e_coefficient, gas_coefficients
+from utils.s3vc_Misc.s3_models import *
+from utils.s3vc_Misc.s3_calculators import create_metadata
+
+
+"""
+Usage:
+  Columnar version of the `calc_S3C*` functions in s3_calculators. Takes the validated rows of ONE category as a DataFrame
+  (columns = model fields, EG: `pd.DataFrame([data.model_dump() for data in models])`) and evaluates every calculation
+  method over whole columns: null masks instead of per row `getattr` checks, one cache lookup + factor parse per distinct key
+  instead of per row, NumPy arithmetic for the emissions.
+
+  Results are the same {'emission_result', 'data_quality', 'metadata', 'gases'} dicts as the row functions, value for value.
+  Rows the columnar pass does not reproduce exactly (failed lookups, missing factors, ...) come back as None;
+  run those through `S3_Calculator.add_data` so they succeed or fail exactly as before.
+
+  Categories not in VECTOR_CALCULATORS are not supported here. `S3_Calculator.add_many` picks the path per row.
+
+results = calculate_frame(S3C4_UpstreamTransport, df, cache)
+  >> [{'emission_result': {'distance_based_emissions': 12.1}, 'data_quality': 4, 'metadata': [...]}, None, ...] # aligned with df
+"""
+
+#-----
+# Columns
+#-----
+def _has(df: pd.DataFrame, fields) -> np.ndarray:
+    """Row mask of `all(getattr(data, field, None) is not None for field in fields)`. A missing column is None everywhere."""
+    mask = np.ones(len(df), dtype=bool)
+    for field in fields:
+        if field not in df.columns:
+            return np.zeros(len(df), dtype=bool)
+        mask &= df[field].notna().to_numpy()
+    return mask
+
+
+def _truthy(df: pd.DataFrame, field) -> np.ndarray:
+    """Row mask of `bool(getattr(data, field, None))`."""
+    if field not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return np.array([bool(value) and value == value for value in df[field].tolist()], dtype=bool) # value == value drops NaN
+
+
+def _num(df: pd.DataFrame, field) -> np.ndarray:
+    return pd.to_numeric(df[field], errors='coerce').to_numpy(dtype=float)
+
+
+def _round(values: np.ndarray, ndigits=2) -> list:
+    """Python `round` per value. np.round rounds differently on some halfway values."""
+    return [round(value, ndigits) for value in values.tolist()]
+
+
+#-----
+# Lookups
+#-----
+def _key_codes(df: pd.DataFrame, fields, mask) -> Tuple[List[tuple], np.ndarray]:
+    """(distinct keys, key position per row) over `fields` for masked rows. Rows outside the mask get -1."""
+    codes = np.full(len(df), -1)
+    if not mask.any():
+        return [], codes
+
+    keys = {}
+    rows = zip(*(df[field].to_numpy(dtype=object)[mask] for field in fields))
+    codes[mask] = [keys.setdefault(key, len(keys)) for key in rows]
+    return list(keys), codes
+
+
+def _lookup(keys: List[tuple], fetch: Callable) -> List[Any]:
+    """`fetch(*key)` once per distinct key. A key whose lookup raises gets the exception instead of factors."""
+    factors = []
+    for key in keys:
+        try:
+            factors.append(fetch(*key))
+        except Exception as e:
+            factors.append(e)
+    return factors
+
+
+def _co2e(unit_values: np.ndarray, codes: np.ndarray, coefficients: List[Optional[float]]) -> list:
+    """
+    `calculate_co2e(relevant_factors, unit_value)` for every row: unit value x the co2e coefficient of the row's key,
+    one multiply per row exactly like the row function. Rows whose key has no coefficient are 0, same as `calculate_co2e`.
+    """
+    missing = np.array([coefficient is None for coefficient in coefficients] + [True], dtype=bool) # last slot for code -1
+    coefficient = np.array([0 if coefficient is None else coefficient for coefficient in coefficients] + [0], dtype=float)
+
+    values = (unit_values * coefficient[codes]).tolist()
+    for i in np.flatnonzero(missing[codes]):
+        values[i] = 0
+    return values
+
+
+def _gases(unit_values: np.ndarray, codes: np.ndarray, splits: List[dict]) -> list:
+    """`calculate_gases(relevant_factors, unit_value)` for every row, from the kg per unit of each gas of the row's key."""
+    splits = splits + [{}] # last slot for code -1
+    return [
+        {gas: unit_value * coefficient for gas, coefficient in splits[code].items()}
+        for unit_value, code in zip(unit_values.tolist(), codes.tolist())
+    ]
+
+
+def _relevant_coefficient(factors, unit: str, unit_of_interest: Optional[str] = None) -> Tuple[Optional[float], dict]:
+    """(co2e per unit value, kg per unit value of each gas) of one factor record."""
+    relevant_factors = get_relevant_factors(factors, unit=unit)
+    if not relevant_factors:
+        print('Unable to calculate co2e, no relevant factors provided')
+        return None, {}
+    return co2e_coefficient(relevant_factors, unit_of_interest=unit_of_interest), gas_coefficients(relevant_factors, unit_of_interest=unit_of_interest)
+
+
+def _fuel_co2e(df: pd.DataFrame, cache, mask: np.ndarray, fallback: np.ndarray) -> Tuple[list, list]:
+    """`use_based_emissions`: fuel factors per (fuel_type, fuel_unit), applied to fuel_use. (co2e, gases) per row."""
+    if not mask.any():
+        return None, None
+    keys, codes = _key_codes(df, ['fuel_type', 'fuel_unit'], mask)
+    factors = _lookup(keys, lambda fuel_type, fuel_unit: cache.get_fuel_emission_factors(fuel_type=fuel_type))
+
+    coefficients, splits = [], []
+    for code, ((fuel_type, fuel_unit), key_factors) in enumerate(zip(keys, factors)):
+        if isinstance(key_factors, Exception):
+            fallback |= codes == code
+            coefficients.append(None)
+            splits.append({})
+            continue
+        coefficient, split = _relevant_coefficient(key_factors, unit=fuel_unit, unit_of_interest=fuel_unit)
+        coefficients.append(coefficient)
+        splits.append(split)
+
+    fuel_use = _num(df, 'fuel_use')
+    return _co2e(fuel_use, codes, coefficients), _gases(fuel_use, codes, splits)
+
+
+#-----
+# Methods
+#-----
+"""
+Each category returns (methods, fallback). methods run in the same order as in the row function:
+  (name, mask, values, fields, dq_delta) or (name, mask, values, fields, dq_delta, gases)
+  values: python value per row, only read where mask is set
+  gases: {gas: kg} per row (see `calculate_gases`), for methods calculated from gas factors
+  fields: tuple when every row used the same fields, list (per row) otherwise
+  dq_delta: subtracted from data_quality before the metadata entry. Number, or list (per row)
+fallback: rows that must go through the row function instead.
+"""
+
+def _vec_reported(df: pd.DataFrame, cache, quantity_dq) -> Tuple[list, np.ndarray]:
+    """S3C1, S3C2: reported emissions and quantity x factor."""
+    f1 = ('supplier_incurred_emissions',)
+    m1 = _has(df, f1)
+    v1 = _round(_num(df, 'supplier_incurred_emissions')) if m1.any() else None
+
+    f2 = ('purchased_quantity', 'quantity_emission_factor')
+    m2 = _has(df, f2)
+    v2 = _round(_num(df, 'purchased_quantity') * _num(df, 'quantity_emission_factor')) if m2.any() else None
+
+    methods = [
+        ('reported_emissions_1', m1, v1, f1, 0),
+        ('reported_emissions_2', m2, v2, f2, quantity_dq),
+    ]
+    return methods, np.zeros(len(df), dtype=bool)
+
+
+def vec_S3C1_PurchasedGoods(df: pd.DataFrame, cache=None):
+    return _vec_reported(df, cache, quantity_dq=2)
+
+
+def vec_S3C2_CapitalGoods(df: pd.DataFrame, cache=None):
+    return _vec_reported(df, cache, quantity_dq=1)
+
+
+def vec_S3C3_EnergyRelated(df: pd.DataFrame, cache=None):
+    f1 = ('upstream_emission_factor', 'electric_use')
+    m1 = _has(df, f1)
+    v1 = _round(_num(df, 'upstream_emission_factor') * _num(df, 'electric_use')) if m1.any() else None
+
+    # lifecycle method reads `life_cycle_emission_factor`, keep its exact behaviour in the row function
+    fallback = _has(df, ['electric_use', 'lifecycle_emission_factor', 'combustion_emission_factor', 'energy_loss_rate'])
+    return [('reported_emissions_1', m1, v1, f1, 1.5)], fallback
+
+
+def _vec_transport(df: pd.DataFrame, cache, fuel_dq) -> Tuple[list, np.ndarray]:
+    """S3C4, S3C9: freight distance (x weight for mton-km factors) and fuel use."""
+    fallback = np.zeros(len(df), dtype=bool)
+
+    f1 = ('distance_traveled', 'distance_unit', 'freight_type')
+    m1 = _has(df, f1)
+    keys, codes = _key_codes(df, ['freight_type'], m1)
+    factors = _lookup(keys, lambda freight_type: cache.get_freight_emission_factors(freight_type=freight_type))
+
+    coefficients, splits, per_weight = [], [], np.zeros(len(keys) + 1, dtype=bool) # last slot for code -1
+    for code, key_factors in enumerate(factors):
+        if isinstance(key_factors, Exception) or key_factors is None:
+            fallback |= codes == code
+            coefficients.append(None)
+            splits.append({})
+            continue
+        per_weight[code] = key_factors.get('units') == 'mton-km'
+        coefficient, split = _relevant_coefficient(key_factors, unit='unit')
+        coefficients.append(coefficient)
+        splits.append(split)
+
+    weighted = m1 & _truthy(df, 'freight_weight') & per_weight[codes]
+    distance = _num(df, 'distance_traveled')
+    unit_value = np.where(weighted, distance * np.nan_to_num(_num(df, 'freight_weight')), distance)
+    v1 = _co2e(unit_value, codes, coefficients)
+    g1 = _gases(unit_value, codes, splits)
+    fields1 = [list(f1) + ['freight_weight'] if w else list(f1) for w in weighted.tolist()]
+
+    f2 = ('fuel_use', 'fuel_type', 'fuel_unit')
+    m2 = _has(df, f2)
+    v2, g2 = _fuel_co2e(df, cache, m2, fallback)
+
+    methods = [
+        ('distance_based_emissions', m1, v1, fields1, 1, g1),
+        ('use_based_emissions', m2, v2, f2, fuel_dq, g2),
+    ]
+    return methods, fallback
+
+
+def vec_S3C4_UpstreamTransport(df: pd.DataFrame, cache):
+    return _vec_transport(df, cache, fuel_dq=2)
+
+
+def vec_S3C9_DownstreamTransport(df: pd.DataFrame, cache):
+    return _vec_transport(df, cache, fuel_dq=2)
+
+
+def _vec_waste(df: pd.DataFrame, cache) -> Tuple[list, np.ndarray]:
+    """S3C5, S3C12: waste factors per (waste_type, treatment method). Factors not found count as 0 emissions."""
+    fallback = np.zeros(len(df), dtype=bool)
+
+    f1 = ('waste_type', 'waste_quantity')
+    m1 = _has(df, f1)
+    with_method = m1 & _truthy(df, 'waste_treatment_method')
+    methods_col = df['waste_treatment_method'].to_numpy(dtype=object) if 'waste_treatment_method' in df.columns else np.full(len(df), None, dtype=object)
+    key_df = pd.DataFrame({'waste_type': df['waste_type'].to_numpy(dtype=object), 'method': np.where(with_method, methods_col, None)})
+    keys, codes = _key_codes(key_df, ['waste_type', 'method'], m1)
+
+    def fetch(waste_type, method):
+        if method:
+            return cache.get_waste_emission_factors(waste_type=waste_type, waste_treatment_method=method)
+        return cache.get_waste_emission_factors(waste_type=waste_type) # get the first viable waste treatment method
+
+    coefficients, splits = [], []
+    for code, key_factors in enumerate(_lookup(keys, fetch)):
+        if isinstance(key_factors, Exception):
+            fallback |= codes == code
+            coefficients.append(None)
+            splits.append({})
+        elif key_factors is None:
+            coefficients.append(None)
+            splits.append({})
+        else:
+            coefficient, split = _relevant_coefficient(key_factors, unit='unit')
+            coefficients.append(coefficient)
+            splits.append(split)
+
+    waste_quantity = _num(df, 'waste_quantity')
+    v1 = _co2e(waste_quantity, codes, coefficients)
+    g1 = _gases(waste_quantity, codes, splits)
+    with_method = with_method.tolist()
+    fields1 = [list(f1) + ['waste_treatment_method'] if w else list(f1) for w in with_method]
+    dq1 = [2 if w else 1 for w in with_method]
+    return [('physical_emissions', m1, v1, fields1, dq1, g1)], fallback
+
+
+def vec_S3C5_WasteGenerated(df: pd.DataFrame, cache):
+    return _vec_waste(df, cache)
+
+
+def vec_S3C12_EOLTreatment(df: pd.DataFrame, cache):
+    return _vec_waste(df, cache)
+
+
+def _vehicle_co2e(df: pd.DataFrame, cache, mask: np.ndarray, unit_values: np.ndarray, fallback: np.ndarray) -> Tuple[list, list]:
+    if not mask.any():
+        return None, None
+
+    TABLE = 's3c6_travel_factors'
+    keys, codes = _key_codes(df, ['vehicle_type'], mask)
+    factors = _lookup(keys, lambda vehicle_type: cache.get_vehicle_emission_factors(table=TABLE, vehicle_type=vehicle_type))
+
+    coefficients, splits = [], []
+    for code, key_factors in enumerate(factors):
+        if isinstance(key_factors, Exception):
+            fallback |= codes == code
+            coefficients.append(None)
+            splits.append({})
+            continue
+        coefficient, split = _relevant_coefficient(key_factors, unit='unit')
+        coefficients.append(coefficient)
+        splits.append(split)
+
+    return _co2e(unit_values, codes, coefficients), _gases(unit_values, codes, splits)
+
+
+def vec_S3C6_1_BusinessTravel(df: pd.DataFrame, cache):
+    fallback = np.zeros(len(df), dtype=bool)
+
+    f1 = ('vehicle_type', 'distance_traveled')
+    m1 = _has(df, f1)
+    v1, g1 = _vehicle_co2e(df, cache, m1, _num(df, 'distance_traveled'), fallback)
+
+    f2 = ('fuel_use', 'fuel_type', 'fuel_unit')
+    m2 = _has(df, f2)
+    v2, g2 = _fuel_co2e(df, cache, m2, fallback)
+
+    methods = [
+        ('distance_based_emissions', m1, v1, f1, 1, g1),
+        ('use_based_emissions', m2, v2, f2, 1, g2),
+    ]
+    return methods, fallback
+
+
+def vec_S3C6_2_BusinessStay(df: pd.DataFrame, cache=None):
+    f1 = ('no_of_nights', 'hotel_emission_factor')
+    has_factor = _has(df, f1)
+    v1 = (_num(df, 'no_of_nights') * _num(df, 'hotel_emission_factor')).tolist()
+    return [('reported_emissions_1', np.ones(len(df), dtype=bool), v1, f1, 0)], ~has_factor # None * factor raises in the row function
+
+
+def vec_S3C7_EmployeeCommute(df: pd.DataFrame, cache):
+    fallback = np.zeros(len(df), dtype=bool)
+
+    f1 = ('vehicle_type', 'distance_traveled', 'frequency', 'sampled_days')
+    m1 = _has(df, f1)
+    total_distance = _num(df, 'distance_traveled')
+    frequency, sampled_days = _num(df, 'frequency'), _num(df, 'sampled_days')
+    total_distance = np.where(frequency != 0, total_distance * frequency, total_distance)
+    total_distance = np.where(sampled_days != 0, total_distance * sampled_days, total_distance)
+
+    v1, g1 = _vehicle_co2e(df, cache, m1, total_distance, fallback)
+    return [('distance_based_emissions', m1, v1, f1, 1, g1)], fallback
+
+
+VECTOR_CALCULATORS = {
+    S3C1_PurchasedGoods: vec_S3C1_PurchasedGoods,
+    S3C2_CapitalGoods: vec_S3C2_CapitalGoods,
+    S3C3_EnergyRelated: vec_S3C3_EnergyRelated,
+    S3C4_UpstreamTransport: vec_S3C4_UpstreamTransport,
+    S3C5_WasteGenerated: vec_S3C5_WasteGenerated,
+    S3C6_1_BusinessTravel: vec_S3C6_1_BusinessTravel,
+    S3C6_2_BusinessStay: vec_S3C6_2_BusinessStay,
+    S3C7_EmployeeCommute: vec_S3C7_EmployeeCommute,
+    S3C9_DownstreamTransport: vec_S3C9_DownstreamTransport,
+    S3C12_EOLTreatment: vec_S3C12_EOLTreatment,
+}
+
+
+#-----
+# Frame
+#-----
+def _assemble(n: int, methods: list, fallback: np.ndarray, result_key: str = 'emission_result') -> List[Optional[dict]]:
+    """Per row result dicts, built the way the row functions build them."""
+    with_gases = any(len(method) > 5 for method in methods) # row functions of these categories return a gas split
+    methods = [
+        (name, mask.tolist(), values, fields if isinstance(fields, list) else [fields] * n, dq_delta if isinstance(dq_delta, list) else [dq_delta] * n, gases[0] if gases else None)
+        for name, mask, values, fields, dq_delta, *gases in methods
+    ]
+    fallback = fallback.tolist()
+
+    # Millions of small dicts/lists: generational GC passes would rescan the whole heap (models, frames) over and over
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        results = []
+        for i in range(n):
+            if fallback[i]:
+                results.append(None)
+                continue
+
+            emission_result={}
+            data_quality=5
+            metadata=[]
+            gases={}
+            for name, mask, values, fields, dq_delta, method_gases in methods:
+                if not mask[i]:
+                    continue
+                data_quality -= dq_delta[i]
+                emission_result[name] = values[i]
+                metadata.append( create_metadata(name, values[i], list(fields[i]), data_quality) )
+                if method_gases is not None and method_gases[i]:
+                    gases[name] = method_gases[i]
+            if with_gases:
+                results.append({result_key: emission_result, 'data_quality': data_quality, 'metadata': metadata, 'gases': gases})
+            else:
+                results.append({result_key: emission_result, 'data_quality': data_quality, 'metadata': metadata})
+        return results
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def calculate_frame(model, df: pd.DataFrame, cache) -> List[Optional[dict]]:
+    """
+    Emission results for every row of `df` (validated rows of `model`), aligned with df.
+    None for rows that must be calculated by the row function instead.
+    """
+    calc = VECTOR_CALCULATORS.get(model)
+    if calc is None:
+        raise ValueError(f'No columnar calculation for {model.__name__}. Supported: {[m.__name__ for m in VECTOR_CALCULATORS]}')
+    if df.empty:
+        return []
+
+    df = df.reset_index(drop=True)
+    methods, fallback = calc(df, cache)
+    return _assemble(len(df), methods, fallback)
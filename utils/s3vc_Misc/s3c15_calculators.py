@@ -1,7 +1,10 @@
+import pandas as pd
 from pydantic import BaseModel, Field
 from pydantic import model_validator
 from typing import Optional, Dict, List, Union, Tuple, ClassVar, Any
 from utils.s3vc_Misc.s3c15_models import *
+from utils.result_store import new_result_store
+from utils.emission_aggregates import EmissionAggregates, shown_emissions, remove_rows
 
 #----------
 # Calculator
@@ -11,11 +14,13 @@ class S3C15_Calculator(BaseModel):
     calculated_emissions: Optional[Dict] = None
     best_emissions: Dict[str,float] = {}
     total_emissions: float = 0.0
+    aggregates: Optional[Any] = None # EmissionAggregates, running totals by category, scope and date
       
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.cache = self.cache or {}
-        self.calculated_emissions = self.calculated_emissions or {}
+        self.calculated_emissions = self.calculated_emissions or new_result_store()
+        self.aggregates = self.aggregates if self.aggregates is not None else EmissionAggregates()
 
     def add_data(self, asset: S3C15_BaseAsset):
         try:
@@ -29,18 +34,64 @@ class S3C15_Calculator(BaseModel):
             
             # Create an EmissionResult object
             emission_result = res
-            idx = len(self.calculated_emissions)
+            idx = self.aggregates.next_key()
             self.calculated_emissions[idx] = {'input_data': asset.model_dump(), 'calculated_emissions': emission_result}
+
+            # Update best_quality_emissions, total_emissions and the running aggregates
+            self._update_emissions_summary(idx, category=type(asset).__name__)
             
         except TypeError as te:
             print(te)
         except Exception as e:
             raise e
+
+    def add_many(self, assets: List[S3C15_BaseAsset]) -> Dict[int, Exception]:
+        """
+        Batch `add_data` for whole portfolios, entries are stored in input order.
+        Each asset class is calculated column-wise in one `calculate_frame` pass, see s3c15_vectorized.
+        Assets the columnar pass hands back go through `add_data`.
+        Returns {position in assets: exception} for assets that failed.
+        """
+        from utils.s3vc_Misc.s3c15_vectorized import VECTOR_CALCULATORS, calculate_frame # loads the s3 engine helpers, only needed when batching
+
+        positions = {}
+        for i, asset in enumerate(assets):
+            if type(asset) in VECTOR_CALCULATORS:
+                positions.setdefault(type(asset), []).append(i)
+
+        records, results = {}, {}
+        for model, model_positions in positions.items():
+            model_records = [assets[i].model_dump() for i in model_positions]
+            records.update(zip(model_positions, model_records))
+            results.update(zip(model_positions, calculate_frame(model, pd.DataFrame(model_records))))
+
+        errors = {}
+        total_emissions = self.total_emissions # summed locally, same order as _update_emissions_summary
+        for i, asset in enumerate(assets):
+            if results.get(i) is None:
+                self.total_emissions = total_emissions
+                try:
+                    self.add_data(asset)
+                except Exception as e:
+                    errors[i] = e
+                total_emissions = self.total_emissions
+                continue
+
+            idx = self.aggregates.next_key()
+            self.calculated_emissions[idx] = {'input_data': records[i], 'calculated_emissions': results[i]}
+
+            metadata = results[i]['metadata']
+            emissions = min(metadata, key=lambda x: x['data_quality'])['amount'] if metadata else None
+            self.aggregates.add(idx, records[i]['uuid'], type(asset).__name__, records[i].get('date'), emissions, shown_emissions(results[i]))
+            if not metadata:
+                print("An error occurred: Metadata is empty")
+                continue
+            self.best_emissions[records[i]['uuid']] = emissions
+            total_emissions += emissions
+
+        self.total_emissions = total_emissions
+        return errors
             
-        # Update best_quality_emissions and total_emissions
-        self._update_emissions_summary()
-            
-        
     def _calculate_emission_result(self, asset: S3C15_BaseAsset):
         if isinstance(asset, (S3C15_1A_ListedEquity)):
             res = calc_S3C15_1A_ListedEquity(asset)
@@ -74,10 +125,12 @@ class S3C15_Calculator(BaseModel):
             print(f'Asset {asset} not in expected data type. Unable to calculate')
         return res
 
-    def _update_emissions_summary(self):
+    def _update_emissions_summary(self, idx, category=None):
+        entry = self.calculated_emissions[idx]
+        asset_uuid = entry['input_data']['uuid']
+        emissions = None
         try:
-            asset_uuid = self.calculated_emissions[len(self.calculated_emissions) - 1]['input_data']['uuid']
-            metadata = self.calculated_emissions[len(self.calculated_emissions) - 1]['calculated_emissions']['metadata']
+            metadata = entry['calculated_emissions']['metadata']
 
             if not metadata:
                 raise ValueError("Metadata is empty")
@@ -92,6 +145,17 @@ class S3C15_Calculator(BaseModel):
         except ValueError as e:
           print(f"An error occurred: {e}")
 
+        self.aggregates.add(idx, asset_uuid, category, entry['input_data'].get('date'), emissions, shown_emissions(entry['calculated_emissions']))
+
+    def remove_data(self, asset_uuid: str) -> int:
+        """Remove every row of `asset_uuid`, EG: a row deleted or corrected after upload. Only those rows leave the totals. Returns the number of rows removed."""
+        return remove_rows(self, asset_uuid)
+
+    def replace_data(self, asset: S3C15_BaseAsset):
+        """Recalculate the row of `asset.uuid` from `asset`, EG: a corrected row of a re-uploaded file."""
+        self.remove_data(asset.uuid)
+        self.add_data(asset)
+
     def get_emissions(self) -> Dict[str, float]:
         return self.best_emissions
 
@@ -0,0 +1,237 @@
+from typing import Optional, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.s3vc_Misc.s3c15_models import *
+from utils.s3vc_Misc.s3_vectorized import _has, _num, _round, _assemble
+
+
+"""
+Usage:
+  Columnar version of the `calc_S3C15_*` functions in s3c15_calculators, for portfolios with many holdings.
+  Takes the validated assets of ONE asset class as a DataFrame (EG: `pd.DataFrame([asset.model_dump() for asset in assets])`)
+  and computes the PCAF attribution factors and financed emissions for every holding at once:
+    outstanding / EVIC, outstanding / (equity + debt), outstanding / property or vehicle value, outstanding / PPP adjusted GDP
+
+  Results are the same {'emission_result', 'data_quality', 'metadata'} dicts as the row functions, value for value.
+  Holdings the row function would fail on (a zero denominator raises ZeroDivisionError) come back as None;
+  run those through `S3C15_Calculator.add_data` so they fail exactly as before.
+
+results = calculate_frame(S3C15_1A_ListedEquity, df)
+  >> [{'emission_result': {'reported_emissions_1': 12.1, 'reported_emissions_2': 9.87}, 'data_quality': 4, 'metadata': [...]}, ...] # aligned with df
+"""
+
+#-----
+# Methods
+#-----
+"""
+Same method tuples as s3_vectorized: (name, mask, values, fields, dq_delta), in the order the row function runs them.
+"""
+
+def _attributed(df: pd.DataFrame, value_field: str, denominator: np.ndarray, mask: np.ndarray, fallback: np.ndarray) -> Optional[list]:
+    """round( (outstanding_amount / denominator) * value, 2) for masked rows. Zero denominators go to fallback."""
+    if not mask.any():
+        return None
+    fallback |= mask & (denominator == 0)
+    with np.errstate(divide='ignore', invalid='ignore'): # rows outside the mask or in fallback are never read
+        attribution_factor = _num(df, 'outstanding_amount') / denominator
+        return _round(attribution_factor * _num(df, value_field))
+
+
+def _share(df: pd.DataFrame, value_field: str, mask: np.ndarray) -> Optional[list]:
+    """round(attribution_share * value, 2) for masked rows."""
+    if not mask.any():
+        return None
+    return _round(_num(df, 'attribution_share') * _num(df, value_field))
+
+
+def _estimated(df: pd.DataFrame, emissions_field: str) -> tuple:
+    """`estimated_emissions` when `emissions_field` is missing, at the data quality reached so far."""
+    ef1 = ('estimated_emissions',)
+    mask = ~_has(df, [emissions_field]) & _has(df, ef1)
+    values = df['estimated_emissions'].tolist() if mask.any() else None
+    return ('estimated_emissions', mask, values, ef1, 0)
+
+
+def _equity_debt(df: pd.DataFrame) -> np.ndarray:
+    return _num(df, 'total_equity') + _num(df, 'total_debt')
+
+
+def _vec_enterprise(df: pd.DataFrame, denominator_fields: tuple, denominator) -> Tuple[list, np.ndarray]:
+    """reported x attribution share, reported x outstanding / `denominator`, estimated."""
+    fallback = np.zeros(len(df), dtype=bool)
+
+    f1 = ('attribution_share', 'reported_emissions')
+    m1 = _has(df, f1)
+
+    f2 = ('outstanding_amount',) + denominator_fields + ('reported_emissions',)
+    m2 = _has(df, f2)
+    v2 = _attributed(df, 'reported_emissions', denominator(df) if m2.any() else None, m2, fallback)
+
+    methods = [
+        ('reported_emissions_1', m1, _share(df, 'reported_emissions', m1), f1, 0),
+        ('reported_emissions_2', m2, v2, f2, 1),
+        _estimated(df, 'reported_emissions'),
+    ]
+    return methods, fallback
+
+
+def vec_S3C15_1A_ListedEquity(df: pd.DataFrame):
+    return _vec_enterprise(df, ('enterprise_value',), lambda df: _num(df, 'enterprise_value'))
+
+
+def vec_S3C15_1B_1C(df: pd.DataFrame):
+    return _vec_enterprise(df, ('total_equity', 'total_debt'), _equity_debt)
+
+
+def vec_S3C15_6_ManagedInvestments(df: pd.DataFrame):
+    return _vec_enterprise(df, ('total_equity', 'total_debt'), _equity_debt)
+
+
+def vec_S3C15_1D_BusinessLoans(df: pd.DataFrame):
+    """Unlisted companies attribute by equity + debt, listed ones by EVIC."""
+    fallback = np.zeros(len(df), dtype=bool)
+    is_listed = df['is_listed'].to_numpy(dtype=object)
+
+    f1 = ('attribution_share', 'reported_emissions')
+    m1 = _has(df, f1)
+
+    unlisted_f2 = ('outstanding_amount', 'total_equity', 'total_debt', 'reported_emissions')
+    unlisted = _has(df, unlisted_f2) & (is_listed == False)
+    listed_f2 = ('outstanding_amount', 'enterprise_value', 'reported_emissions')
+    listed = _has(df, listed_f2) & (is_listed == True)
+
+    m2 = unlisted | listed
+    denominator = np.where(unlisted, _equity_debt(df), _num(df, 'enterprise_value')) if m2.any() else None
+    v2 = _attributed(df, 'reported_emissions', denominator, m2, fallback)
+    fields2 = [list(unlisted_f2) if u else list(listed_f2) for u in unlisted.tolist()]
+
+    methods = [
+        ('reported_emissions_1', m1, _share(df, 'reported_emissions', m1), f1, 0),
+        ('reported_emissions_2', m2, v2, fields2, 1),
+        _estimated(df, 'reported_emissions'),
+    ]
+    return methods, fallback
+
+
+def _vec_asset_value(df: pd.DataFrame, value_field: str, activity_fields: Tuple[str, str]) -> Tuple[list, np.ndarray]:
+    """S3C15_1E, S3C15_2A, S3C15_2B: outstanding / property (or vehicle) value, then physical emissions on the same share."""
+    fallback = np.zeros(len(df), dtype=bool)
+
+    f1 = ('attribution_share', 'reported_emissions')
+    m1 = _has(df, f1)
+
+    f2 = ('outstanding_amount', value_field, 'reported_emissions')
+    m2 = _has(df, f2)
+    asset_value = _num(df, value_field)
+    v2 = _attributed(df, 'reported_emissions', asset_value, m2, fallback)
+    dq2 = [1.5 if origin == True else 1 for origin in df['value_at_origin'].tolist()]
+
+    f3 = activity_fields + ('reported_emissions', 'outstanding_amount', value_field)
+    m3 = _has(df, f3)
+    v3 = None
+    if m3.any():
+        fallback |= m3 & (asset_value == 0)
+        activity_emissions = _num(df, activity_fields[0]) * _num(df, activity_fields[1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            v3 = _round((_num(df, 'outstanding_amount') / asset_value) * activity_emissions)
+
+    methods = [
+        ('reported_emissions_1', m1, _share(df, 'reported_emissions', m1), f1, 0),
+        ('reported_emissions_2', m2, v2, f2, dq2),
+        ('physical_emissions', m3, v3, f3, 2),
+        _estimated(df, 'reported_emissions'),
+    ]
+    return methods, fallback
+
+
+def vec_S3C15_1E_2A(df: pd.DataFrame):
+    return _vec_asset_value(df, 'property_value', ('building_energy_use', 'building_emission_factor'))
+
+
+def vec_S3C15_2B_VehicleLoans(df: pd.DataFrame):
+    return _vec_asset_value(df, 'vehicle_value', ('distance_traveled', 'distance_emission_factor'))
+
+
+def _vec_project(df: pd.DataFrame, emissions_field: str) -> Tuple[list, np.ndarray]:
+    """S3C15_3, S3C15_4. The project value method asks for `total_debt`, which project assets do not have: it never applies."""
+    fallback = np.zeros(len(df), dtype=bool)
+
+    f1 = ('attribution_share', emissions_field)
+    m1 = _has(df, f1)
+
+    f2 = ('outstanding_amount', 'project_equity', 'total_debt', 'project_emissions')
+    fallback |= _has(df, f2) # keep the row function's behaviour if a frame ever has these columns
+
+    methods = [
+        ('reported_emissions_1', m1, _share(df, emissions_field, m1), f1, 0),
+        _estimated(df, emissions_field),
+    ]
+    return methods, fallback
+
+
+def vec_S3C15_3_ProjectFinance(df: pd.DataFrame):
+    return _vec_project(df, 'project_emissions')
+
+
+def vec_S3C15_4_EmissionRemovals(df: pd.DataFrame):
+    return _vec_project(df, 'emissions_removed')
+
+
+def vec_S3C15_5_SovereignDebt(df: pd.DataFrame):
+    """outstanding / PPP adjusted GDP on reported emissions, attribution share on consumption emissions."""
+    fallback = np.zeros(len(df), dtype=bool)
+
+    f1 = ('attribution_share', 'reported_emissions')
+    m1 = _has(df, f1)
+
+    f2 = ('outstanding_amount', 'ppp_adj_gdp', 'reported_emissions')
+    m2 = _has(df, f2)
+    v2 = _attributed(df, 'reported_emissions', _num(df, 'ppp_adj_gdp') if m2.any() else None, m2, fallback)
+
+    f3 = ('attribution_share', 'consumption_emissions')
+    m3 = _has(df, f3)
+
+    methods = [
+        ('reported_emissions_1', m1, _share(df, 'reported_emissions', m1), f1, 0),
+        ('reported_emissions_2', m2, v2, f2, 1),
+        ('physical_emissions', m3, _share(df, 'consumption_emissions', m3), f3, 2),
+        _estimated(df, 'reported_emissions'),
+    ]
+    return methods, fallback
+
+
+VECTOR_CALCULATORS = {
+    S3C15_1A_ListedEquity: vec_S3C15_1A_ListedEquity,
+    S3C15_1B_UnlistedEquity: vec_S3C15_1B_1C,
+    S3C15_1C_CorporateBonds: vec_S3C15_1B_1C,
+    S3C15_1D_BusinessLoans: vec_S3C15_1D_BusinessLoans,
+    S3C15_1E_CommercialRealEstate: vec_S3C15_1E_2A,
+    S3C15_2A_Mortgage: vec_S3C15_1E_2A,
+    S3C15_2B_VehicleLoans: vec_S3C15_2B_VehicleLoans,
+    S3C15_3_ProjectFinance: vec_S3C15_3_ProjectFinance,
+    S3C15_4_EmissionRemovals: vec_S3C15_4_EmissionRemovals,
+    S3C15_5_SovereignDebt: vec_S3C15_5_SovereignDebt,
+    S3C15_6_ManagedInvestments: vec_S3C15_6_ManagedInvestments,
+}
+
+
+#-----
+# Frame
+#-----
+def calculate_frame(model, df: pd.DataFrame) -> List[Optional[dict]]:
+    """
+    Financed emission results for every row of `df` (validated assets of `model`), aligned with df.
+    None for rows that must be calculated by the row function instead.
+    """
+    calc = VECTOR_CALCULATORS.get(model)
+    if calc is None:
+        raise ValueError(f'No columnar calculation for {model.__name__}. Supported: {[m.__name__ for m in VECTOR_CALCULATORS]}')
+    if df.empty:
+        return []
+
+    df = df.reset_index(drop=True)
+    methods, fallback = calc(df)
+    result_key = 'emission_removals' if model is S3C15_4_EmissionRemovals else 'emission_result'
+    return _assemble(len(df), methods, fallback, result_key=result_key)
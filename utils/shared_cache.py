@@ -0,0 +1,172 @@
+import time
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Optional, Dict, Any, Tuple
+
+from utils.app_config import LOOKUP_CACHE_MAX_ENTRIES, LOOKUP_CACHE_TTL
+from utils.utility import get_deep_size
+
+
+"""
+Usage:
+  Server-wide, thread-safe lookup cache shared by every session and page. Bounded by entry count (LRU eviction)
+  and optionally by age (TTL). Tracks hits, misses, evictions and bytes per table.
+
+  Behaves like a dict, so `key in cache`, `cache[key]`, `len(cache)` keep working. Use `lookup` / `set`
+  to also pass the table name for per-table statistics.
+
+cache = get_shared_lookup_cache()
+cache.set('s1sc_liquid_fuel_type_Diesel', {...}, table='s1sc_liquid')
+cache.lookup('s1sc_liquid_fuel_type_Diesel', table='s1sc_liquid') >> (True, {...})
+cache.get_stats() >> {'total': {'hits': 1, 'misses': 0, ...}, 'tables': {'s1sc_liquid': {...}}}
+print(cache.stats_text()) # prometheus text format
+"""
+
+class SharedLookupCache(MutableMapping):
+    STAT_FIELDS = ['hits', 'misses', 'evictions', 'expirations', 'entries', 'bytes']
+
+    def __init__(self, max_entries: Optional[int] = LOOKUP_CACHE_MAX_ENTRIES, ttl: Optional[float] = LOOKUP_CACHE_TTL):
+        """
+        max_entries:
+          Least recently used entries are evicted past this count. None means unbounded.
+
+        ttl:
+          Seconds an entry stays valid. None means entries never expire.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict() # key: (value, table, created_at, size, ttl)
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return f"<SharedLookupCache: {len(self._data)}/{self.max_entries} items, ttl={self.ttl}>"
+
+    #--Helper--#
+    def _table_stats(self, table) -> Dict[str, int]:
+        table = table or '_unknown'
+        if table not in self._stats:
+            self._stats[table] = {field: 0 for field in self.STAT_FIELDS}
+        return self._stats[table]
+
+    def _expired(self, entry) -> bool:
+        ttl = entry[4] if entry[4] is not None else self.ttl
+        return ttl is not None and time.time() - entry[2] > ttl
+
+    def _drop(self, key, reason=None):
+        value, table, created_at, size, ttl = self._data.pop(key)
+        stats = self._table_stats(table)
+        stats['entries'] -= 1
+        stats['bytes'] -= size
+        if reason:
+            stats[reason] += 1
+
+    #--Lookup--#
+    def lookup(self, key, table: Optional[str] = None) -> Tuple[bool, Any]:
+        """
+        Returns (found, value) and records a hit or miss against `table`. `found` separates a cached None from a miss.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self._expired(entry):
+                self._drop(key, reason='expirations')
+                entry = None
+
+            if entry is None:
+                self._table_stats(table)['misses'] += 1
+                return False, None
+
+            self._data.move_to_end(key)
+            self._table_stats(entry[1])['hits'] += 1
+            return True, entry[0]
+
+    def set(self, key, value, table: Optional[str] = None, ttl: Optional[float] = None):
+        """
+        ttl: per-entry override of the cache TTL, EG: short lived negative results.
+        """
+        size = get_deep_size(value)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, table or '_unknown', time.time(), size, ttl)
+
+            stats = self._table_stats(table)
+            stats['entries'] += 1
+            stats['bytes'] += size
+
+            while self.max_entries is not None and len(self._data) > self.max_entries:
+                oldest_key = next(iter(self._data))
+                self._drop(oldest_key, reason='evictions')
+
+    def clear(self, table: Optional[str] = None):
+        """Drop every entry, or only the entries stored under `table`."""
+        with self._lock:
+            keys = [k for k, entry in self._data.items() if table is None or entry[1] == table]
+            for key in keys:
+                self._drop(key)
+
+    #--Mapping API--#
+    def __getitem__(self, key):
+        found, value = self.lookup(key)
+        if not found:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._drop(key)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._data.keys()))
+
+    def __len__(self):
+        return len(self._data)
+
+    #--Stats--#
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tables = {table: dict(stats) for table, stats in self._stats.items()}
+        total = {field: sum(stats[field] for stats in tables.values()) for field in self.STAT_FIELDS}
+        lookups = total['hits'] + total['misses']
+        total['hit_rate'] = round(total['hits'] / lookups, 4) if lookups else None
+        return {'total': total, 'tables': tables}
+
+    def stats_text(self, prefix: str = 'trace_lookup_cache') -> str:
+        """Prometheus text exposition of `get_stats`, one series per table."""
+        tables = self.get_stats()['tables']
+        lines = []
+        for field in self.STAT_FIELDS:
+            lines.append(f'# TYPE {prefix}_{field} {"gauge" if field in ["entries", "bytes"] else "counter"}')
+            for table, stats in tables.items():
+                lines.append(f'{prefix}_{field}{{table="{table}"}} {stats[field]}')
+        return '\n'.join(lines) + '\n'
+
+    def reset_stats(self):
+        with self._lock:
+            for stats in self._stats.values():
+                for field in ['hits', 'misses', 'evictions', 'expirations']:
+                    stats[field] = 0
+
+
+_SHARED_LOOKUP_CACHE = None
+_SHARED_LOOKUP_CACHE_LOCK = threading.Lock()
+
+def get_shared_lookup_cache() -> SharedLookupCache:
+    """
+    Process-wide cache configured from app_config. Every session on this server gets the same instance.
+    """
+    global _SHARED_LOOKUP_CACHE
+    with _SHARED_LOOKUP_CACHE_LOCK:
+        if _SHARED_LOOKUP_CACHE is None:
+            _SHARED_LOOKUP_CACHE = SharedLookupCache()
+        return _SHARED_LOOKUP_CACHE
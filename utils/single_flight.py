@@ -0,0 +1,72 @@
+import threading
+from typing import Callable, Dict, Any, Tuple, Type
+
+
+"""
+Usage:
+  Request coalescing. Concurrent callers asking for the same key share ONE execution of `fn`:
+  the first caller (leader) runs it, everyone else waits and receives the same result, or a fresh copy of the same
+  exception (raised from the leader's), so waiters never share one traceback across threads.
+
+flights = SingleFlight()
+flights.do('s1sc_liquid_fuel_type_Diesel', lambda: query(...)) # 20 threads, 1 query
+flights.get_stats() >> {'leaders': 1, 'coalesced': 19, 'in_flight': 0}
+"""
+
+def rebuild_error(error_type: Type[Exception], args: Tuple) -> Exception:
+    """New exception of `error_type` with `args`. RuntimeError with the same args when the type cannot be rebuilt from them."""
+    try:
+        return error_type(*args)
+    except Exception: # constructor does not take its own args back
+        return RuntimeError(*args)
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, _Call] = {}
+        self._stats = {'leaders': 0, 'coalesced': 0}
+
+    def __repr__(self):
+        return f"<SingleFlight: {len(self._calls)} in flight, {self._stats}>"
+
+    def do(self, key, fn: Callable[[], Any]):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats['leaders'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise rebuild_error(type(call.error), call.error.args) from call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, 'in_flight': len(self._calls)}
+
+
+LOOKUP_FLIGHTS = SingleFlight() # process-wide, shared by every lookup cache
@@ -0,0 +1,78 @@
+import threading
+from typing import Optional, Dict
+
+from supabase import create_client
+from supabase.lib.client_options import ClientOptions
+
+
+"""
+Usage:
+  Process-wide pool of supabase clients keyed by (url, key, schema).
+  A client keeps its underlying HTTP session (keep-alive connections) alive, so creating one per query
+  means a new session and TLS handshake every time. Grab clients from the pool instead of calling `create_client`.
+
+client = get_supabase_client(url, key)
+response = SUPABASE_POOL.execute( client.table('s1sc_liquid').select('*') )
+SUPABASE_POOL.get_stats() >> {'pool_hits': 41, 'new_connections': 1, 'in_flight': 0, 'requests': 42}
+"""
+
+class SupabaseClientPool:
+    def __init__(self):
+        self._clients: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'pool_hits': 0,
+            'new_connections': 0,
+            'in_flight': 0,
+            'requests': 0,
+        }
+
+    def __repr__(self):
+        return f"<SupabaseClientPool: {len(self._clients)} clients, {self._stats}>"
+
+    def get_client(self, url: str, key: str, schema: Optional[str] = None):
+        pool_key = (url, key, schema)
+
+        with self._lock:
+            client = self._clients.get(pool_key)
+            if client is not None:
+                self._stats['pool_hits'] += 1
+                return client
+
+            if schema:
+                opts = ClientOptions().replace(schema=schema)
+                client = create_client(url, key, options=opts)
+            else:
+                client = create_client(url, key)
+
+            self._clients[pool_key] = client
+            self._stats['new_connections'] += 1
+            return client
+
+    def execute(self, query_builder):
+        """
+        Runs `query_builder.execute()` while tracking in-flight and total requests.
+        """
+        with self._lock:
+            self._stats['in_flight'] += 1
+            self._stats['requests'] += 1
+        try:
+            return query_builder.execute()
+        finally:
+            with self._lock:
+                self._stats['in_flight'] -= 1
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+
+SUPABASE_POOL = SupabaseClientPool()
+
+
+def get_supabase_client(url: str, key: str, schema: Optional[str] = None):
+    return SUPABASE_POOL.get_client(url, key, schema=schema)
@@ -0,0 +1,200 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count, islice
+from typing import Optional, List, Tuple, Iterator
+
+import pandas as pd
+import pyarrow as pa
+
+from utils.app_config import SUPABASE_PAGE_SIZE, SUPABASE_PREFETCH_PAGES
+from utils.supabase_pool import SUPABASE_POOL, get_supabase_client
+from utils.utility import get_supabase_secrets, select_columns
+
+
+"""
+Usage:
+  Read a whole supabase table in range-paged chunks instead of one giant JSON response.
+  Pages are requested with `Range` offsets while the next page(s) are already being fetched in the background.
+  Nothing is silently truncated: the first page carries the exact row count, and pages the server cuts short (supabase
+  `max_rows` below `page_size`) are completed with more requests. Paging ends at the row count, never on a short page.
+
+  Pass `order` (EG: the primary key) for tables that change while being read; Postgres does not guarantee row order otherwise.
+
+for rows in iter_table_pages('climate_risk-climate_simulation_v2', order='id'): ... # list of dicts per page
+for batch in iter_table_batches('s2ie_gef'): ... # pyarrow.RecordBatch per page
+for df in iter_table_frames('s2ie_gef', country='Malaysia'): ... # pd.DataFrame per page
+
+df = read_table_frame('climate_risk-climate_simulation_v2', order='id')
+stream_table_to_file('s2ie_gef', '.trace_cache/s2ie_gef.arrow') >> 5321 # rows written
+"""
+
+#-----
+# Pages
+#-----
+def _page_builder(table, schema: Optional[str] = None, columns: Optional[List[str]] = None, order: Optional[str] = None, in_filter: Optional[Tuple[str, list]] = None, **filters):
+    url, key = get_supabase_secrets()
+    supabase = get_supabase_client(url, key, schema=schema)
+
+    def build(start: int, end: int, with_count: bool = False):
+        """Rows [start, end). postgrest's `.range(start, end)` already sends `Range: start-(end-1)`."""
+        query_builder = supabase.table(table).select(select_columns(columns), count='exact' if with_count else None)
+        for column, value in filters.items():
+            if value is not None:
+                query_builder = query_builder.filter(column, 'eq', value)
+        if in_filter is not None:
+            query_builder = query_builder.in_(*in_filter)
+        if order is not None:
+            query_builder = query_builder.order(order)
+        return query_builder.range(start, end)
+    return build
+
+
+def _fetch_page(build, start: int, size: int, with_count: bool = False) -> Tuple[List[dict], Optional[int]]:
+    """(rows [start, start + size), total row count of the query when `with_count`)."""
+    response = SUPABASE_POOL.execute(build(start, start + size, with_count))
+    return response.data or [], getattr(response, 'count', None)
+
+
+def _fetch_range(build, start: int, size: int) -> List[dict]:
+    """Rows [start, start + size). A page cut short by the server cap is completed with more requests, up to an empty page."""
+    rows, _ = _fetch_page(build, start, size)
+    while rows and len(rows) < size:
+        more, _ = _fetch_page(build, start + len(rows), size - len(rows))
+        if not more:
+            break
+        rows += more
+    return rows
+
+
+def iter_table_pages(
+    table: str,
+    page_size: int = SUPABASE_PAGE_SIZE,
+    prefetch: int = SUPABASE_PREFETCH_PAGES,
+    schema: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    order: Optional[str] = None,
+    limit: Optional[int] = None,
+    in_filter: Optional[Tuple[str, list]] = None,
+    **filters,
+) -> Iterator[List[dict]]:
+    """
+    Yields the rows of `table` one page (list of dicts) at a time. kwargs are "eq" filters as in `supabase_query_v2`.
+
+    page_size:
+      Rows requested per page.
+
+    prefetch:
+      Pages fetched ahead in the background while the caller works on the current one. 0 fetches strictly one by one.
+
+    limit:
+      Stop after this many rows. None reads every row.
+
+    in_filter:
+      (column, values) for a `column IN (values)` filter, EG: one chunk of `supabase_query_in`.
+
+    The first page also asks for the exact row count, paging stops once that many rows were read (or on an empty page
+    when the server sends no count). A short page alone never ends the table, it is completed with more requests.
+    """
+    build = _page_builder(table, schema=schema, columns=columns, order=order, in_filter=in_filter, **filters)
+    if limit is not None:
+        page_size = min(page_size, limit)
+    if page_size <= 0:
+        return
+
+    rows, total = _fetch_page(build, 0, page_size, with_count=True)
+    end = min(n for n in [total, limit] if n is not None) if total is not None or limit is not None else None
+    if not rows:
+        return
+    yield rows
+    offset = len(rows)
+    if end is not None and offset >= end:
+        return
+    if len(rows) < page_size and end is not None: # more rows than the first page returned: the server caps pages at this size
+        page_size = len(rows)
+
+    starts = iter(range(offset, end, page_size)) if end is not None else count(offset, page_size)
+
+    def fetch(start: int) -> Tuple[int, List[dict]]:
+        size = page_size if end is None else min(page_size, end - start)
+        return size, _fetch_range(build, start, size)
+
+    if prefetch <= 0:
+        for start in starts:
+            size, rows = fetch(start)
+            if rows:
+                yield rows
+            if len(rows) < size: # empty page reached
+                return
+        return
+
+    with ThreadPoolExecutor(max_workers=prefetch) as executor:
+        pending = [executor.submit(fetch, start) for start in islice(starts, prefetch)]
+        try:
+            while pending:
+                size, rows = pending.pop(0).result()
+                if rows:
+                    yield rows
+                if len(rows) < size: # empty page reached, anything still pending is past the end
+                    return
+                start = next(starts, None)
+                if start is not None:
+                    pending.append(executor.submit(fetch, start))
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+#-----
+# Arrow / pandas
+#-----
+def iter_table_batches(table: str, arrow_schema: Optional[pa.Schema] = None, **kwargs) -> Iterator[pa.RecordBatch]:
+    """
+    `iter_table_pages` as pyarrow RecordBatches.
+    arrow_schema: cast every page to this schema. Without it, each page infers its own types.
+    """
+    for rows in iter_table_pages(table, **kwargs):
+        yield pa.RecordBatch.from_pylist(rows, schema=arrow_schema)
+
+
+def iter_table_frames(table: str, **kwargs) -> Iterator[pd.DataFrame]:
+    """`iter_table_pages` as DataFrame chunks."""
+    for rows in iter_table_pages(table, **kwargs):
+        yield pd.DataFrame(rows)
+
+
+def read_table_arrow(table: str, **kwargs) -> pa.Table:
+    batches = list(iter_table_batches(table, **kwargs))
+    if not batches:
+        return pa.table({})
+    return pa.concat_tables([pa.Table.from_batches([batch]) for batch in batches], promote=True) # pages may infer different types for all-null columns
+
+
+def read_table_frame(table: str, **kwargs) -> pd.DataFrame:
+    frames = list(iter_table_frames(table, **kwargs))
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def stream_table_to_file(table: str, path: str, arrow_schema: Optional[pa.Schema] = None, **kwargs) -> int:
+    """
+    Write `table` page by page into an Arrow IPC file (readable by LocalFactorStore), never holding more than a few pages in memory.
+    The file schema comes from the first page unless `arrow_schema` is given; pass it when early pages have all-null columns.
+    Returns the number of rows written.
+    """
+    num_rows = 0
+    sink, writer = None, None
+    try:
+        for rows in iter_table_pages(table, **kwargs):
+            batch = pa.RecordBatch.from_pylist(rows, schema=arrow_schema)
+            if writer is None:
+                arrow_schema = batch.schema
+                sink = pa.OSFile(path, 'wb')
+                writer = pa.ipc.new_file(sink, arrow_schema)
+            writer.write_batch(batch)
+            num_rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+        if sink is not None:
+            sink.close()
+    return num_rows
@@ -0,0 +1,236 @@
+import os
+import sys
+import glob
+import time
+import pickle
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Optional, Any
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pydantic
+
+from utils.app_config import UPLOAD_CACHE_ENABLED, UPLOAD_CACHE_DIR, UPLOAD_CACHE_MAX_BYTES, FACTOR_DISK_CACHE_TTL
+from utils.factor_store import get_factor_store, LocalFactorStore
+from utils.factor_disk_cache import get_factor_disk_cache
+from utils.s3vc_Misc.s3_snapshot import FACTOR_TABLES
+
+
+"""
+Usage:
+  Content-addressed cache of processed uploads (`process_file` results: calculator, warnings, invalid indices, dataframes).
+  An upload whose bytes were processed before, under the same factor data and the same code, is restored from disk
+  instead of being parsed, inferred, validated and calculated again. Survives reruns, sessions and server restarts.
+
+  Key: sha256 of the file bytes + a stamp of
+    factor data       local backend: path, size and mtime of every factor file. supabase: the disk cache version of every
+                      table, entries also expire after FACTOR_DISK_CACHE_TTL like the cached factor rows. Without a disk
+                      cache the live tables cannot be versioned and nothing is cached.
+    calculator code   hash of every module under utils/ (`process_file` lives in utils.file_processing), plus the library versions pickles depend on.
+  The inferred model is a function of the file bytes and the inferencer code, so it is covered by the key and stored with the result.
+
+  One pickle per key in UPLOAD_CACHE_DIR. Beyond UPLOAD_CACHE_MAX_BYTES the least recently used results are evicted.
+
+uc = get_upload_cache()
+key = uc.key(content)
+uc.get(key, cache=cache) >> None # miss
+uc.set(key, result)
+uc.get(key, cache=cache) >> {'file_name', 'model_name', 'scope', 'calc', ...}
+"""
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+#-----
+# Versions
+#-----
+@lru_cache(maxsize=1)
+def calculator_version() -> str:
+    """Hash of the code results come from. Computed once per process, code does not change under a running server."""
+    sha = hashlib.sha256()
+    for lib in [sys.version, np.__version__, pd.__version__, pa.__version__, pydantic.VERSION]:
+        sha.update(lib.encode())
+    paths = sorted(glob.glob(os.path.join(_ROOT, 'utils', '**', '*.py'), recursive=True))
+    for path in paths:
+        sha.update(os.path.relpath(path, _ROOT).encode())
+        with open(path, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def factor_version() -> Optional[str]:
+    """Stamp of the factor data results are calculated from. None when it cannot be versioned."""
+    store = get_factor_store()
+    if isinstance(store, LocalFactorStore):
+        stamps = []
+        for table in sorted(FACTOR_TABLES):
+            path = store.find(table)
+            if path is not None:
+                stat = os.stat(path)
+                stamps.append((table, path, stat.st_size, stat.st_mtime_ns))
+        return repr(stamps)
+
+    disk_cache = get_factor_disk_cache()
+    if disk_cache is None:
+        return None
+    return repr([(table, disk_cache.get_version(table)) for table in sorted(FACTOR_TABLES)])
+
+
+#-----
+# Cache
+#-----
+class UploadCache:
+    EXTENSION = '.pkl'
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = UPLOAD_CACHE_MAX_BYTES, ttl: Optional[float] = None):
+        """
+        cache_dir:
+          Directory holding one pickle per result. Defaults to UPLOAD_CACHE_DIR in app_config.
+
+        max_bytes:
+          Size of the directory before least recently used results are evicted.
+
+        ttl:
+          Seconds before a result expires. None means results never expire.
+        """
+        self.cache_dir = cache_dir or UPLOAD_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __repr__(self):
+        return f"<UploadCache: {self.cache_dir}, {self.size()}/{self.max_bytes} bytes>"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + self.EXTENSION)
+
+    def key(self, content: bytes) -> Optional[str]:
+        """Cache key of an upload, None when the factor data cannot be versioned."""
+        version = factor_version()
+        if version is None:
+            return None
+        stamp = hashlib.sha256(f'{version}|{calculator_version()}'.encode()).hexdigest()[:16]
+        return f'{hashlib.sha256(content).hexdigest()}-{stamp}'
+
+    #--Entries--#
+    def get(self, key: str, cache=None) -> Optional[dict]:
+        """
+        The stored result, None on a miss. Unreadable and expired results are dropped.
+        cache: lookup cache attached to the restored calculator in place of the one detached by `set`.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                saved = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f'Unable to load cached upload result {path}. Error: {e}')
+            self._remove(path)
+            return None
+
+        if self.ttl is not None and time.time() - saved['created_at'] > self.ttl:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path) # most recently used, see `evict`
+        except OSError:
+            pass
+
+        result = saved['result']
+        calc = result.get('calc')
+        if calc is not None and getattr(calc, 'cache', {}) is None:
+            calc.cache = cache
+        return result
+
+    def set(self, key: str, result: dict) -> bool:
+        """
+        Store `result`, then evict down to `max_bytes`. A `calc` lookup cache holding locks and connections is detached
+        while pickling, the same way file_pool sends calculators between processes. False when not stored.
+        """
+        calc = result.get('calc')
+        calc_cache = getattr(calc, 'cache', None)
+        detach = calc is not None and calc_cache is not None and not isinstance(calc_cache, dict)
+        try:
+            if detach:
+                calc.cache = None
+            payload = pickle.dumps({'created_at': time.time(), 'result': result}, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            print(f'Unable to pickle upload result for {key}. Error: {e}')
+            return False
+        finally:
+            if detach:
+                calc.cache = calc_cache
+
+        if len(payload) > self.max_bytes:
+            return False
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path) # atomic, other processes never read a half written file
+        except OSError as e:
+            print(f'Unable to save upload result to {path}. Error: {e}')
+            self._remove(tmp_path)
+            return False
+        self.evict()
+        return True
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _entries(self) -> list:
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(self.EXTENSION):
+                    try:
+                        stat = entry.stat()
+                    except OSError: # removed by another process
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used results until the directory fits in `max_bytes`."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def clear(self):
+        for _, _, path in self._entries():
+            self._remove(path)
+
+
+_UPLOAD_CACHE = None
+
+def get_upload_cache() -> Optional[UploadCache]:
+    """
+    Process-wide upload cache configured from app_config. Returns None if disabled or the directory is not writable.
+    With the supabase backend results expire after FACTOR_DISK_CACHE_TTL, like the factor rows they were calculated from.
+    """
+    global _UPLOAD_CACHE
+    if not UPLOAD_CACHE_ENABLED:
+        return None
+    if _UPLOAD_CACHE is None:
+        try:
+            ttl = None if isinstance(get_factor_store(), LocalFactorStore) else FACTOR_DISK_CACHE_TTL
+            _UPLOAD_CACHE = UploadCache(ttl=ttl)
+        except OSError as e:
+            print(f'Upload result cache unavailable. Error: {e}')
+            return None
+    return _UPLOAD_CACHE
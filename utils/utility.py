@@ -10,14 +10,14 @@ from PIL import Image
 from io import StringIO
 import re
 from typing import List, Optional, Union, Dict, Any, get_args, get_origin
-from fuzzywuzzy import process
 
 import os 
 import sys
-from supabase import create_client
-from supabase.lib.client_options import ClientOptions
-
+from urllib.parse import quote
 from utils.globals import COLUMN_SORT_ORDER
+from utils.app_config import SUPABASE_IN_URL_BUDGET
+from utils.supabase_pool import SUPABASE_POOL, get_supabase_client
+from utils.category_matcher import get_category_matcher
 
 #-----
 # Text formatting
@@ -140,18 +140,14 @@ def get_supabase_secrets():
 
 
 def supabase_query(table:str, url:str, key:str,  schema: Optional[str]=None, limit: Optional[int]=10000):
-    if schema:
-        opts = ClientOptions().replace(schema=schema)
-        supabase = create_client(url, key, options=opts)
-    else:
-        supabase = create_client(url, key)
+    supabase = get_supabase_client(url, key, schema=schema)
 
     query_builder = supabase.table(table).select("*")
     if limit is not None:
         query_builder = query_builder.limit(limit)
 
     try:
-        response = query_builder.execute()
+        response = SUPABASE_POOL.execute(query_builder)
     except Exception as e:
         raise e
 
@@ -160,7 +156,14 @@ def supabase_query(table:str, url:str, key:str,  schema: Optional[str]=None, lim
     return response.data
 
 
-def supabase_query_v2(table, schema: Optional[str]=None, limit: Optional[int]=10000, **kwargs):
+def select_columns(columns: Optional[List[str]]=None) -> str:
+    """ 
+    PostgREST `select` value for a column projection. None selects every column.
+    """
+    return ','.join(columns) if columns else '*'
+
+
+def supabase_query_v2(table, schema: Optional[str]=None, limit: Optional[int]=10000, columns: Optional[List[str]]=None, **kwargs):
     """ 
     v2 lets you pass "column_name" = "value" as kwargs to filter
 
@@ -169,16 +172,12 @@ def supabase_query_v2(table, schema: Optional[str]=None, limit: Optional[int]=10
       kwargs= {'fuel_type': 'natural gas'} # search "natural gas" from column "fuel_type"
     
     supabase_query_v2(TABLE, **kwargs)
+    supabase_query_v2(TABLE, columns=['fuel_type', 'co2_factor'], **kwargs) # only transfer these columns
     """
     url, key = get_supabase_secrets()
+    supabase = get_supabase_client(url, key, schema=schema)
     
-    if schema:
-        opts = ClientOptions().replace(schema=schema)
-        supabase = create_client(url, key, options=opts)
-    else:
-        supabase = create_client(url, key)
-    
-    query_builder = supabase.table(table).select('*')
+    query_builder = supabase.table(table).select(select_columns(columns))
     for key, value in kwargs.items():
         if value is not None:  # Only add filter if value is not None
             query_builder = query_builder.filter(key, 'eq', value)
@@ -187,11 +186,80 @@ def supabase_query_v2(table, schema: Optional[str]=None, limit: Optional[int]=10
         query_builder = query_builder.limit(limit)
     
     try:
-        response = query_builder.execute()
-        return response.data
+        response = SUPABASE_POOL.execute(query_builder)
     except Exception as e:
         raise e
 
+    if limit is not None and response.data and len(response.data) >= limit:
+        print(f'`{table}` returned {len(response.data)} rows, hitting limit={limit}. Results may be truncated, use utils.table_stream to read everything.')
+    return response.data
+
+
+
+def supabase_query_distinct(table, column: str, schema: Optional[str]=None, limit: Optional[int]=None, **kwargs) -> list:
+    """ 
+    Distinct values of one column. PostgREST has no DISTINCT, so only `column` is transferred and deduplicated here,
+    instead of pulling every column of every row. Other kwargs are "eq" filters as in v2.
+
+    Example:
+      supabase_query_distinct('s3c5_waste_factors', 'waste_treatment_method', waste_type='Glass') >> ['Landfilled', 'Recycled', ...]
+    """
+    if limit is None: # every row, range paged so the server row cap cannot truncate it
+        from utils.table_stream import iter_table_pages
+        pages = iter_table_pages(table, schema=schema, columns=[column], **kwargs)
+    else:
+        pages = [supabase_query_v2(table, schema=schema, limit=limit, columns=[column], **kwargs) or []]
+    return list(dict.fromkeys(row.get(column) for rows in pages for row in rows))
+
+
+def split_in_values(values: list, url_budget: int=SUPABASE_IN_URL_BUDGET) -> List[list]:
+    """ 
+    Split values into chunks whose URL-encoded `in.(v1,v2,...)` filter stays under `url_budget` characters.
+    """
+    chunks, chunk, length = [], [], 0
+    for value in values:
+        value_str = str(value)
+        if any(char in value_str for char in ',:()'): # postgrest quotes reserved chars
+            value_str = f'"{value_str}"'
+        value_length = len(quote(value_str, safe='')) + 3 # + encoded comma separator
+        
+        if chunk and length + value_length > url_budget:
+            chunks.append(chunk)
+            chunk, length = [], 0
+        chunk.append(value)
+        length += value_length
+
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def supabase_query_in(table, column: str, values: list, schema: Optional[str]=None, url_budget: int=SUPABASE_IN_URL_BUDGET, **kwargs) -> Dict[Any, List[dict]]:
+    """ 
+    Batched version of `supabase_query_v2`. One `column IN (values)` request instead of one request per value,
+    split into several requests only when the URL would get too long. Other kwargs are "eq" filters as in v2.
+    Each chunk is range paged (see utils.table_stream), so values past the server row cap are not dropped.
+
+    Returns rows grouped by requested value. Values without rows map to [].
+
+    Example:
+      supabase_query_in('s3c6_travel_factors', 'vehicle_type', ['Bus', 'Taxi']) >> {'Bus': [{...}], 'Taxi': []}
+    """
+    values = list(dict.fromkeys(v for v in values if v is not None)) # dedupe, keep order
+    grouped = {value: [] for value in values}
+    if not values:
+        return grouped
+    requested = {str(value): value for value in values} # supabase may return a different type than requested, EG: '38' vs 38
+
+    from utils.table_stream import iter_table_pages
+    for chunk in split_in_values(values, url_budget=url_budget):
+        for rows in iter_table_pages(table, schema=schema, prefetch=0, in_filter=(column, chunk), **kwargs): # one counted request unless past the row cap
+            for row in rows:
+                value = requested.get(str(row.get(column)))
+                if value is not None:
+                    grouped[value].append(row)
+    return grouped
+
     
 def get_lookup(
     table: str, 
@@ -211,7 +279,7 @@ def get_lookup(
     supabase_anon_key= st.secrets['supabase_anon_key']
     url = supabase_url
     key = supabase_anon_key
-    supabase = create_client(url, key)
+    supabase = get_supabase_client(url, key)
     
     if distinct:
         query_builder = supabase.table(table).select(distinct)
@@ -223,7 +291,7 @@ def get_lookup(
             query_builder = query_builder.filter(column, 'eq', value)
     
     try:
-        response = query_builder.execute()
+        response = SUPABASE_POOL.execute(query_builder)
         data = response.data
         if distinct:
             unique_values = list(set(row[distinct] for row in data))
@@ -239,24 +307,17 @@ def get_dataframe(data):
   return pd.DataFrame(data)
 
 
-def find_closest_category(input_str, allowed_list:list, threshold=80, abbrv_dict: dict={}):
+def find_closest_category(input_str, allowed_list:list, threshold=80, abbrv_dict: dict={}, field: Optional[str]=None):
     """
     Autocorrect for a list of options
     abbrv_dict: 
       Dictionary containing custom pairs. EG: 'usa': 'United States of America'
       Useful if fuzzy matching is returning unintentional results
-    """
-    if input_str in [None, '']:
-        return None
 
-    if abbrv_dict not in [None, {}]:
-        input_str = abbrv_dict.get(input_str.strip().lower(), input_str)
-    
-    closest_match, score = process.extractOne(input_str, allowed_list)
-    if score >= threshold:
-        return closest_match
-    else:
-        return None 
+    field:
+      Optional field name the value belongs to (EG: 'country'). Results are memoized per field, see utils.category_matcher
+    """
+    return get_category_matcher().match(input_str, allowed_list, threshold=threshold, abbrv_dict=abbrv_dict, field=field)
     
 
 def get_deep_size(obj):